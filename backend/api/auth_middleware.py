@@ -1,9 +1,11 @@
+import hmac
 import json
 import requests
 from django.http import JsonResponse
 from django.conf import settings
 from functools import wraps
 from .services.mongodb_service import MongoDBService
+from .services.timing import span
 
 
 def verify_google_token(id_token):
@@ -56,7 +58,8 @@ def require_auth(view_func):
         id_token = auth_header.split(' ')[1]
         
         # Verify the token
-        token_verification = verify_google_token(id_token)
+        with span('auth.verify'):
+            token_verification = verify_google_token(id_token)
         
         if not token_verification['success']:
             return JsonResponse({
@@ -69,22 +72,23 @@ def require_auth(view_func):
         mongodb_service = MongoDBService()
         
         try:
-            # Check if user exists
-            user = mongodb_service.get_user_by_email(user_info['email'])
-            
-            if not user:
-                # Create new user
-                user_data = {
-                    'email': user_info['email'],
-                    'name': user_info['name'],
-                    'picture': user_info['picture'],
-                    'google_id': user_info['sub']
-                }
-                user_id = mongodb_service.create_user(user_data)
-                user = mongodb_service.get_user_by_id(user_id)
-            else:
-                # Update last login
-                mongodb_service.update_user_login(user['_id'])
+            with span('auth.user'):
+                # Check if user exists
+                user = mongodb_service.get_user_by_email(user_info['email'])
+                
+                if not user:
+                    # Create new user
+                    user_data = {
+                        'email': user_info['email'],
+                        'name': user_info['name'],
+                        'picture': user_info['picture'],
+                        'google_id': user_info['sub']
+                    }
+                    user_id = mongodb_service.create_user(user_data)
+                    user = mongodb_service.get_user_by_id(user_id)
+                else:
+                    # Update last login
+                    mongodb_service.update_user_login(user['_id'])
             
             # Add user info to request
             request.user = user
@@ -105,6 +109,32 @@ def require_auth(view_func):
     return wrapper
 
 
+def require_metrics_token(view_func):
+    """
+    Decorator for internal monitoring endpoints: requires the METRICS_TOKEN shared secret as a
+    bearer token, so scrapers can read them without a Google account
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if not settings.METRICS_TOKEN:
+            return JsonResponse({
+                'success': False,
+                'error': 'Metrics endpoints are disabled'
+            }, status=403)
+        
+        auth_header = request.headers.get('Authorization', '')
+        token = auth_header[len('Bearer '):] if auth_header.startswith('Bearer ') else ''
+        if not hmac.compare_digest(token.encode('utf-8'), settings.METRICS_TOKEN.encode('utf-8')):
+            return JsonResponse({
+                'success': False,
+                'error': 'Valid metrics token required'
+            }, status=401)
+        
+        return view_func(request, *args, **kwargs)
+    
+    return wrapper
+
+
 def get_user_from_request(request):
     """
     Helper function to get user from request
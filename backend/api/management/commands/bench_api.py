@@ -0,0 +1,312 @@
+import json
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from unittest import mock
+from urllib.parse import urlsplit
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from pymongo import monitoring
+
+
+BENCH_TOKEN = 'bench-token'
+BENCH_USER = {
+    'email': 'bench@focalai.local',
+    'name': 'Benchmark User',
+    'picture': '',
+    'sub': 'bench'
+}
+
+BENCH_IDEAS = [
+    'mobile app for hospital patient monitoring',
+    'fintech payment processing platform for freelancers',
+    'learning management system for rural schools',
+    'community marketplace for second hand furniture',
+    'grocery delivery scheduling tool for small shops',
+    'volunteer matching network for animal shelters',
+    'carbon footprint tracker for commuters',
+    'recipe planner that reduces household food waste',
+]
+
+ENDPOINTS = ['refine', 'user-history', 'idea', 'user-insights', 'transactions']
+
+# Hosts --mongo local may use without an explicit --mongo-uri; the benchmark writes users and ideas
+LOCAL_MONGO_HOSTS = {'localhost', '127.0.0.1', '::1'}
+
+
+def is_local_mongo_uri(uri):
+    """Whether every host in a MongoDB URI is a local one (never true for mongodb+srv:// clusters)"""
+    parts = urlsplit(uri)
+    if parts.scheme != 'mongodb':
+        return False
+    hosts = parts.netloc.rpartition('@')[2].split(',')
+    return all(urlsplit(f'//{host}').hostname in LOCAL_MONGO_HOSTS for host in hosts)
+
+
+class MongoCommandCounter(monitoring.CommandListener):
+    """Counts MongoDB commands (server round trips) issued while a benchmark phase runs"""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def increment(self):
+        with self._lock:
+            self.count += 1
+
+    def started(self, event):
+        self.increment()
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the API endpoints in-process against a local mongod (or mongomock) and a fake LLM'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=4, help='Concurrent clients per endpoint')
+        parser.add_argument('--requests', type=int, default=20, help='Requests per endpoint')
+        parser.add_argument('--endpoints', default=','.join(ENDPOINTS), help='Comma separated subset of: ' + ', '.join(ENDPOINTS))
+        parser.add_argument('--mongo', choices=['local', 'memory'], default='local',
+                            help='local uses --mongo-uri (or MONGODB_URI if it is a local mongod); memory uses mongomock')
+        parser.add_argument('--mongo-uri', default=None,
+                            help='Throwaway MongoDB to benchmark against with --mongo local; it gets a benchmark user and ideas')
+        parser.add_argument('--llm', choices=['fake', 'configured'], default='fake',
+                            help='fake forces LLM_PROVIDER=fake; configured keeps the current provider (e.g. cassette_replay)')
+        parser.add_argument('--llm-latency-ms', type=float, default=None, help='Mean fake LLM latency')
+        parser.add_argument('--with-cache', action='store_true', help='Keep the LLM response cache enabled')
+        parser.add_argument('--keep-rate-limits', action='store_true', help='Keep the configured Gemini rate limits')
+        parser.add_argument('--output', default=None, help='Result JSON path (default benchmarks/results/<time>-<commit>.json)')
+        parser.add_argument('--compare', default=None, help='Earlier result JSON to print deltas against')
+
+    def handle(self, *args, **options):
+        endpoints = [endpoint.strip() for endpoint in options['endpoints'].split(',') if endpoint.strip()]
+        unknown = set(endpoints) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+
+        if options['mongo'] == 'local':
+            if options['mongo_uri']:
+                settings.MONGODB_URI = options['mongo_uri']
+            elif not is_local_mongo_uri(settings.MONGODB_URI):
+                raise CommandError(
+                    'MONGODB_URI is not a local mongod; pass --mongo-uri for the database to benchmark against '
+                    '(it will get a benchmark user with unlimited credits and test ideas) or use --mongo memory'
+                )
+
+        self._configure(options)
+        counter = MongoCommandCounter()
+        patches = self._patches(options['mongo'], counter)
+
+        for patch in patches:
+            patch.start()
+        try:
+            results = self._run(endpoints, options, counter)
+        finally:
+            for patch in reversed(patches):
+                patch.stop()
+
+        report = {
+            'meta': {
+                'commit': git_commit(),
+                'timestamp': datetime.utcnow().isoformat(),
+                'clients': options['clients'],
+                'requests_per_endpoint': options['requests'],
+                'mongo': options['mongo'],
+                'llm_provider': settings.LLM_PROVIDER,
+                'fake_llm_latency_ms_mean': settings.FAKE_LLM_LATENCY_MS_MEAN,
+                'llm_cache_enabled': settings.LLM_CACHE_ENABLED,
+            },
+            'endpoints': results
+        }
+
+        output = options['output'] or os.path.join(
+            settings.BASE_DIR, 'benchmarks', 'results',
+            f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-{report['meta']['commit'] or 'nocommit'}.json"
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+
+        self._print_report(results, options['compare'])
+        self.stdout.write(self.style.SUCCESS(f'✅ Benchmark results saved to {output}'))
+
+    def _configure(self, options):
+        """Point the app at benchmark-friendly settings before any shared client is created"""
+        if 'testserver' not in settings.ALLOWED_HOSTS:
+            settings.ALLOWED_HOSTS = list(settings.ALLOWED_HOSTS) + ['testserver']
+        if options['llm'] == 'fake':
+            settings.LLM_PROVIDER = 'fake'
+        if options['llm_latency_ms'] is not None:
+            settings.FAKE_LLM_LATENCY_MS_MEAN = options['llm_latency_ms']
+        if not options['with_cache']:
+            settings.LLM_CACHE_ENABLED = False
+        if not options['keep_rate_limits']:
+            settings.GEMINI_REQUESTS_PER_MINUTE = 10 ** 6
+            settings.GEMINI_TOKENS_PER_MINUTE = 10 ** 9
+
+    def _patches(self, mongo_mode, counter):
+        """Bypass Google token verification and wire up round-trip counting (and mongomock if requested)"""
+        patches = [
+            mock.patch(
+                'api.auth_middleware.verify_google_token',
+                lambda id_token: {'success': True, 'user_info': dict(BENCH_USER)}
+            )
+        ]
+
+        if mongo_mode == 'memory':
+            try:
+                import mongomock
+            except ImportError:
+                raise CommandError('--mongo memory requires mongomock (pip install mongomock)')
+
+            # One shared in-memory server for every MongoClient the app creates
+            shared_client = mongomock.MongoClient()
+            shared_client.close = lambda: None
+            patches.append(mock.patch('api.services.mongodb_service.MongoClient', lambda *args, **kwargs: shared_client))
+
+            # mongomock has no command monitoring, so count the collection methods that would hit the server
+            for method in ('find', 'find_one', 'insert_one', 'insert_many', 'update_one', 'update_many',
+                           'find_one_and_update', 'aggregate', 'create_index', 'count_documents', 'delete_many'):
+                original = getattr(mongomock.collection.Collection, method)
+                patches.append(mock.patch.object(
+                    mongomock.collection.Collection, method, self._counting(original, counter)
+                ))
+        else:
+            # Listeners only apply to clients created after registration; the app creates its clients lazily
+            monitoring.register(counter)
+
+        return patches
+
+    @staticmethod
+    def _counting(original, counter):
+        def wrapper(*args, **kwargs):
+            counter.increment()
+            return original(*args, **kwargs)
+        return wrapper
+
+    def _run(self, endpoints, options, counter):
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {BENCH_TOKEN}')
+
+        # Warm up: creates the benchmark user, then gives it enough credits for every refine request
+        client.get('/api/users/profile/')
+        from api.services.mongodb_service import MongoDBService
+
+        mongodb_service = MongoDBService()
+        mongodb_service.users_collection.update_one({'email': BENCH_USER['email']}, {'$set': {'credits': 10 ** 6}})
+        idea_ids = [str(idea['_id']) for idea in mongodb_service.ideas_collection.find(
+            {'user_id': mongodb_service.get_user_by_email(BENCH_USER['email'])['_id']}, {'_id': 1}
+        ).limit(50)]
+        mongodb_service.close()
+
+        results = {}
+        for endpoint in endpoints:
+            if endpoint == 'idea' and not idea_ids:
+                self.stdout.write('⚠️ Skipping idea endpoint: no ideas yet (run refine first)')
+                continue
+
+            def make_request(index, endpoint=endpoint):
+                request_client = Client(HTTP_AUTHORIZATION=f'Bearer {BENCH_TOKEN}')
+                if endpoint == 'refine':
+                    body = {
+                        'idea': f"{BENCH_IDEAS[index % len(BENCH_IDEAS)]} (variant {index})",
+                        'force_new': True
+                    }
+                    response = request_client.post('/api/refine/', json.dumps(body), content_type='application/json')
+                    if response.status_code == 200:
+                        idea_ids.append(response.json()['idea_id'])
+                    return response
+                if endpoint == 'user-history':
+                    return request_client.get('/api/user-history/')
+                if endpoint == 'idea':
+                    return request_client.get(f'/api/idea/{idea_ids[index % len(idea_ids)]}/')
+                if endpoint == 'user-insights':
+                    return request_client.get('/api/user-insights/')
+                return request_client.get('/api/users/transactions/')
+
+            self.stdout.write(f'⏱️  {endpoint}: {options["requests"]} requests, {options["clients"]} clients')
+            results[endpoint] = self._measure(make_request, options['requests'], options['clients'], counter)
+
+        return results
+
+    def _measure(self, make_request, request_count, clients, counter):
+        latencies = []
+        errors = 0
+        lock = threading.Lock()
+
+        def timed(index):
+            nonlocal errors
+            started_at = time.perf_counter()
+            try:
+                response = make_request(index)
+                failed = response.status_code >= 400
+            except Exception:
+                failed = True
+            elapsed = (time.perf_counter() - started_at) * 1000
+            with lock:
+                latencies.append(elapsed)
+                errors += failed
+
+        commands_before = counter.count
+        started_at = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as executor:
+            list(executor.map(timed, range(request_count)))
+        wall_time = time.perf_counter() - started_at
+        commands = counter.count - commands_before
+
+        latencies.sort()
+        return {
+            'requests': request_count,
+            'errors': errors,
+            'mean_ms': round(sum(latencies) / len(latencies), 2) if latencies else None,
+            'p50_ms': round(percentile(latencies, 0.50), 2) if latencies else None,
+            'p95_ms': round(percentile(latencies, 0.95), 2) if latencies else None,
+            'p99_ms': round(percentile(latencies, 0.99), 2) if latencies else None,
+            'throughput_rps': round(request_count / wall_time, 2) if wall_time else None,
+            'mongo_round_trips_per_request': round(commands / request_count, 2) if request_count else None
+        }
+
+    def _print_report(self, results, compare_path):
+        baseline = {}
+        if compare_path:
+            with open(compare_path) as compare_file:
+                baseline = json.load(compare_file).get('endpoints', {})
+
+        self.stdout.write('')
+        self.stdout.write(f"{'endpoint':<16}{'p50':>10}{'p95':>10}{'p99':>10}{'rps':>8}{'mongo/req':>11}{'errors':>8}")
+        for endpoint, stats in results.items():
+            self.stdout.write(
+                f"{endpoint:<16}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}"
+                f"{stats['throughput_rps']:>8}{stats['mongo_round_trips_per_request']:>11}{stats['errors']:>8}"
+            )
+            previous = baseline.get(endpoint)
+            if previous and previous.get('p95_ms') and stats['p95_ms']:
+                delta = (stats['p95_ms'] - previous['p95_ms']) / previous['p95_ms'] * 100
+                self.stdout.write(f"{'':<16}p95 {delta:+.1f}% vs {compare_path}")
+        self.stdout.write('')
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+from api.services.domain_classifier import classify_domains
+from api.services.mongodb_service import MongoDBService
+
+
+class Command(BaseCommand):
+    help = 'Store the product domain on ideas saved without one (or on all ideas, after a taxonomy change)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Reclassify every idea, not only unclassified ones')
+        parser.add_argument('--batch-size', type=int, default=500, help='Ideas classified and written per bulk write')
+
+    def handle(self, *args, **options):
+        mongodb_service = MongoDBService()
+        query = {} if options['all'] else {'domain': {'$exists': False}}
+        cursor = mongodb_service.ideas_collection.find(query, {'description': 1, 'user_id': 1})
+
+        updated = 0
+        users = set()
+        batch = []
+        try:
+            for idea in cursor:
+                batch.append(idea)
+                if len(batch) >= options['batch_size']:
+                    updated += self._write(mongodb_service, batch, users)
+                    batch = []
+            if batch:
+                updated += self._write(mongodb_service, batch, users)
+
+            # Domain histograms of the affected users are recounted on their next read
+            if users:
+                mongodb_service.user_stats_collection.update_many(
+                    {'_id': {'$in': list(users)}}, {'$set': {'complete': False}}
+                )
+        finally:
+            mongodb_service.close()
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Classified {updated} ideas of {len(users)} users'))
+
+    def _write(self, mongodb_service, ideas, users):
+        domains = classify_domains([idea.get('description', '') for idea in ideas])
+        mongodb_service.ideas_collection.bulk_write([
+            UpdateOne({'_id': idea['_id']}, {'$set': {'domain': domain}})
+            for idea, domain in zip(ideas, domains)
+        ], ordered=False)
+        users.update(idea['user_id'] for idea in ideas if idea.get('user_id'))
+        return len(ideas)
@@ -0,0 +1,285 @@
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from django.conf import settings
+from .rate_limiter import is_rate_limit_error, record_event
+
+
+logger = logging.getLogger(__name__)
+
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit breaker is open"""
+
+    def __init__(self, name, retry_after):
+        self.name = name
+        self.retry_after = max(0.0, retry_after)
+        super().__init__(f"{name} is temporarily unavailable (circuit open), retry in {math.ceil(self.retry_after)}s")
+
+
+class CircuitBreaker:
+    """
+    Failure-rate and slow-call-rate circuit breaker shared by every thread of a process.
+
+    Closed: calls pass and their outcomes are kept for window_seconds. Once at least min_calls
+    were seen, the breaker opens when the failure rate or the share of calls slower than
+    slow_call_seconds reaches its threshold.
+    Open: calls are rejected with CircuitOpenError until open_seconds have passed.
+    Half-open: up to half_open_calls trial calls are let through; if they all succeed quickly
+    the breaker closes, and any failed or slow trial opens it again.
+
+    Quota (429) errors are left to the rate limiter and do not count as failures.
+    """
+
+    def __init__(self, name, window_seconds=60, min_calls=10, failure_rate=0.5, slow_call_seconds=30,
+                 slow_call_rate=0.8, open_seconds=30, half_open_calls=2):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+
+        self.state = CLOSED
+        self.opened_at = None
+        self.times_opened = 0
+        self.rejected_calls = 0
+        self.last_failure = None
+        self._calls = deque()  # (timestamp, failed, slow)
+        self._trials_in_flight = 0
+        self._trial_successes = 0
+        self._lock = threading.Lock()
+
+    def _prune(self, now):
+        while self._calls and now - self._calls[0][0] > self.window_seconds:
+            self._calls.popleft()
+
+    def _rates(self):
+        total = len(self._calls)
+        if not total:
+            return 0.0, 0.0
+        failed = sum(1 for _, is_failure, _ in self._calls if is_failure)
+        slow = sum(1 for _, _, is_slow in self._calls if is_slow)
+        return failed / total, slow / total
+
+    def _open(self, now):
+        self.state = OPEN
+        self.opened_at = now
+        self.times_opened += 1
+        self._calls.clear()
+        record_event(f'circuit_opened.{self.name}')
+        logger.warning("Circuit breaker '%s' opened", self.name)
+
+    def _close(self):
+        self.state = CLOSED
+        self.opened_at = None
+        self._calls.clear()
+        logger.info("Circuit breaker '%s' closed", self.name)
+
+    def _retry_after(self, now):
+        return self.open_seconds - (now - self.opened_at) if self.opened_at else 0.0
+
+    def is_open(self):
+        """True while calls would be rejected outright (does not start a half-open trial)"""
+        with self._lock:
+            return self.state == OPEN and time.monotonic() - self.opened_at < self.open_seconds
+
+    def retry_after(self):
+        with self._lock:
+            return max(0.0, self._retry_after(time.monotonic()))
+
+    def check(self):
+        """
+        Raise CircuitOpenError if a call would be rejected right now, without admitting it. Used
+        before a call queues for rate limit quota, so an open circuit fails fast.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN and now - self.opened_at < self.open_seconds:
+                retry_after = self._retry_after(now)
+            elif self.state == HALF_OPEN and self._trials_in_flight >= self.half_open_calls:
+                retry_after = 1.0
+            else:
+                return
+            self.rejected_calls += 1
+            record_event(f'circuit_rejected.{self.name}')
+        raise CircuitOpenError(self.name, retry_after)
+
+    def before_call(self):
+        """Admit a call, returning True if it is a half-open trial, or raise CircuitOpenError"""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN:
+                if now - self.opened_at < self.open_seconds:
+                    self.rejected_calls += 1
+                    record_event(f'circuit_rejected.{self.name}')
+                    raise CircuitOpenError(self.name, self._retry_after(now))
+                self.state = HALF_OPEN
+                self._trials_in_flight = 0
+                self._trial_successes = 0
+
+            if self.state == HALF_OPEN:
+                if self._trials_in_flight >= self.half_open_calls:
+                    self.rejected_calls += 1
+                    record_event(f'circuit_rejected.{self.name}')
+                    raise CircuitOpenError(self.name, 1.0)
+                self._trials_in_flight += 1
+                return True
+            return False
+
+    def record(self, trial, failed, latency, error=None):
+        """Record the outcome of an admitted call"""
+        with self._lock:
+            now = time.monotonic()
+            slow = latency >= self.slow_call_seconds
+            if failed:
+                # Only the exception type: provider error text can echo prompts or account details
+                self.last_failure = {'error': type(error).__name__, 'at': datetime.utcnow().isoformat()}
+
+            if trial:
+                self._trials_in_flight -= 1
+                if self.state != HALF_OPEN:
+                    return
+                if failed or slow:
+                    self._open(now)
+                else:
+                    self._trial_successes += 1
+                    if self._trial_successes >= self.half_open_calls:
+                        self._close()
+                return
+
+            # Results of calls admitted before the breaker opened don't count towards recovery
+            if self.state != CLOSED:
+                return
+            self._calls.append((now, failed, slow))
+            self._prune(now)
+            if len(self._calls) >= self.min_calls:
+                failure_rate, slow_rate = self._rates()
+                if failure_rate >= self.failure_rate or slow_rate >= self.slow_call_rate:
+                    self._open(now)
+
+    def release(self, trial):
+        """Give back an admitted call that ended without a usable outcome (e.g. a quota error)"""
+        if trial:
+            with self._lock:
+                self._trials_in_flight -= 1
+
+    def call(self, func):
+        """Run func() through the breaker"""
+        trial = self.before_call()
+        started_at = time.monotonic()
+        try:
+            result = func()
+        except Exception as e:
+            if is_rate_limit_error(e):
+                self.release(trial)
+            else:
+                self.record(trial, True, time.monotonic() - started_at, e)
+            raise
+        self.record(trial, False, time.monotonic() - started_at)
+        return result
+
+    def get_state(self):
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            failure_rate, slow_rate = self._rates()
+            return {
+                'name': self.name,
+                'state': self.state,
+                'retry_after_seconds': round(max(0.0, self._retry_after(now)), 1) if self.state == OPEN else None,
+                'window_calls': len(self._calls),
+                'failure_rate': round(failure_rate, 3),
+                'slow_call_rate': round(slow_rate, 3),
+                'times_opened': self.times_opened,
+                'rejected_calls': self.rejected_calls,
+                'last_failure': self.last_failure,
+                'config': {
+                    'window_seconds': self.window_seconds,
+                    'min_calls': self.min_calls,
+                    'failure_rate': self.failure_rate,
+                    'slow_call_seconds': self.slow_call_seconds,
+                    'slow_call_rate': self.slow_call_rate,
+                    'open_seconds': self.open_seconds,
+                    'half_open_calls': self.half_open_calls
+                }
+            }
+
+
+class CircuitBreakerChatModel:
+    """Wraps a chat model so invoke/stream outcomes feed, and are gated by, a circuit breaker"""
+
+    def __init__(self, llm, breaker):
+        self.llm = llm
+        self.breaker = breaker
+
+    def invoke(self, messages, **kwargs):
+        return self.breaker.call(lambda: self.llm.invoke(messages, **kwargs))
+
+    def stream(self, messages, **kwargs):
+        trial = self.breaker.before_call()
+        started_at = time.monotonic()
+        try:
+            yield from self.llm.stream(messages, **kwargs)
+        except GeneratorExit:
+            # Consumer stopped early; the service was answering
+            self.breaker.record(trial, False, time.monotonic() - started_at)
+            raise
+        except Exception as e:
+            if is_rate_limit_error(e):
+                self.breaker.release(trial)
+            else:
+                self.breaker.record(trial, True, time.monotonic() - started_at, e)
+            raise
+        self.breaker.record(trial, False, time.monotonic() - started_at)
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+_breakers_pid = None
+
+
+def get_circuit_breaker(name):
+    """Return this process's circuit breaker for a dependency, creating it on first use"""
+    global _breakers_pid
+
+    with _breakers_lock:
+        # State (and its lock) inherited through a fork describes the parent's calls
+        if _breakers_pid != os.getpid():
+            _breakers.clear()
+            _breakers_pid = os.getpid()
+
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(
+                name,
+                window_seconds=settings.LLM_BREAKER_WINDOW_SECONDS,
+                min_calls=settings.LLM_BREAKER_MIN_CALLS,
+                failure_rate=settings.LLM_BREAKER_FAILURE_RATE,
+                slow_call_seconds=settings.LLM_BREAKER_SLOW_CALL_SECONDS,
+                slow_call_rate=settings.LLM_BREAKER_SLOW_CALL_RATE,
+                open_seconds=settings.LLM_BREAKER_OPEN_SECONDS,
+                half_open_calls=settings.LLM_BREAKER_HALF_OPEN_CALLS
+            )
+        return breaker
+
+
+def get_circuit_breaker_states():
+    """State of every circuit breaker in this process"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.get_state() for breaker in breakers}
@@ -0,0 +1,161 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from django.conf import settings
+from .rate_limiter import estimate_tokens, record_event
+from .timing import bind_request_timing
+
+
+class LLMDeadlineExceeded(TimeoutError):
+    """An LLM call did not finish within its deadline"""
+
+
+class LatencyWindow:
+    """Latencies of the most recent successful calls of one kind, for percentile estimates"""
+
+    def __init__(self, size):
+        self.samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, fraction):
+        with self._lock:
+            samples = sorted(self.samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+    def __len__(self):
+        return len(self.samples)
+
+
+_windows = {}
+_windows_lock = threading.Lock()
+
+
+def _window(key):
+    with _windows_lock:
+        window = _windows.get(key)
+        if window is None:
+            window = _windows[key] = LatencyWindow(settings.LLM_LATENCY_WINDOW_SIZE)
+        return window
+
+
+def hedge_delay(key):
+    """Seconds after which a call of this kind is hedged: its observed p95, once there are enough samples"""
+    if not settings.LLM_HEDGE_ENABLED:
+        return None
+    window = _window(key)
+    if len(window) < settings.LLM_HEDGE_MIN_SAMPLES:
+        return None
+    return max(settings.LLM_HEDGE_MIN_DELAY_SECONDS, window.percentile(0.95))
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_executor_pid = None
+
+
+def _get_executor():
+    """Threads that run deadline-bound LLM calls; abandoned calls finish here in the background"""
+    global _executor, _executor_pid
+
+    with _executor_lock:
+        # Threads do not survive a fork, so each worker process starts its own pool
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=settings.LLM_CALL_MAX_THREADS, thread_name_prefix='llm-call')
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def call_with_deadline(key, func, timeout, admit_hedge=None):
+    """
+    Run func() with an upper bound of timeout seconds, raising LLMDeadlineExceeded when it is hit.
+    When hedging is enabled and the call outlives the p95 latency of its kind, an identical
+    duplicate is started (if admit_hedge() allows it) and whichever finishes first wins. The
+    loser is left to finish in the background (its result is discarded); a Python thread cannot
+    be interrupted.
+    """
+    executor = _get_executor()
+    started_at = time.monotonic()
+    deadline = started_at + timeout if timeout else None
+    bound = bind_request_timing(func)
+
+    futures = {executor.submit(bound): started_at}
+    delay = hedge_delay(key)
+    if delay is not None and (deadline is None or started_at + delay < deadline):
+        done, _ = wait(futures, timeout=delay)
+        if not done:
+            if admit_hedge is None or admit_hedge():
+                record_event('llm_hedged_calls')
+                futures[executor.submit(bound)] = time.monotonic()
+            else:
+                record_event('llm_hedges_skipped')
+
+    error = None
+    while futures:
+        remaining = None if deadline is None else max(0, deadline - time.monotonic())
+        done, _ = wait(futures, timeout=remaining, return_when=FIRST_COMPLETED)
+        if not done:
+            record_event('llm_deadline_exceeded')
+            raise LLMDeadlineExceeded(f"{key} call exceeded its {timeout:.0f}s deadline")
+
+        for future in done:
+            submitted_at = futures.pop(future)
+            if future.exception() is None:
+                _window(key).add(time.monotonic() - submitted_at)
+                if submitted_at != started_at:
+                    record_event('llm_hedge_wins')
+                return future.result()
+            error = future.exception()
+
+    raise error
+
+
+class DeadlineChatModel:
+    """
+    Wraps a chat model so one invoke() can be bounded: invoke(messages, deadline_seconds=..., deadline_key=...)
+    applies call_with_deadline to the provider request alone. It sits inside the rate limiter, so time
+    spent queueing for quota or backing off between retries does not count against the deadline, and
+    a call abandoned at its deadline was already admitted (no quota is taken after giving up). Hedged
+    duplicates are only sent when the limiter has capacity for them right away.
+    """
+
+    def __init__(self, llm, limiter=None):
+        self.llm = llm
+        self.limiter = limiter
+
+    def invoke(self, messages, deadline_seconds=None, deadline_key='llm', **kwargs):
+        call = lambda: self.llm.invoke(messages, **kwargs)
+        if not deadline_seconds:
+            return call()
+
+        admit_hedge = None
+        if self.limiter is not None:
+            admit_hedge = lambda: self.limiter.try_acquire(
+                estimate_tokens(messages) + settings.GEMINI_EXPECTED_OUTPUT_TOKENS
+            )
+        return call_with_deadline(deadline_key, call, deadline_seconds, admit_hedge=admit_hedge)
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
+
+
+def get_latency_stats():
+    """Observed p50/p95 latency per call kind and the current hedging delay, for the metrics endpoint"""
+    with _windows_lock:
+        windows = dict(_windows)
+    return {
+        key: {
+            'samples': len(window),
+            'p50_seconds': window.percentile(0.5),
+            'p95_seconds': window.percentile(0.95),
+            'hedge_after_seconds': hedge_delay(key)
+        }
+        for key, window in sorted(windows.items())
+    }
@@ -0,0 +1,102 @@
+import re
+import threading
+import yaml
+from django.conf import settings
+
+
+class DomainClassifier:
+    """
+    Keyword classifier over a domain taxonomy. All keywords of all domains are compiled into one
+    alternation, so classifying a description is a single regex scan however many domains exist.
+
+    Keywords match whole words (plus a plural "s"/"es"), so "exam" does not fire on "example".
+    A keyword written as a stem with a trailing "*" ("diagnos*") matches any word it starts.
+    """
+
+    def __init__(self, taxonomy, default='General'):
+        self.default = default
+        self.domains = list(taxonomy)
+
+        # Keyword (normalized) -> domain; a keyword listed under two domains counts for the first
+        self._keyword_domains = {}
+        stems = set()
+        for domain, keywords in taxonomy.items():
+            for keyword in keywords:
+                keyword = self._normalize(keyword)
+                if keyword.endswith('*'):
+                    keyword = keyword.rstrip('*').strip()
+                    stems.add(keyword)
+                self._keyword_domains.setdefault(keyword, domain)
+
+        # Longest keywords first so "mental health" wins over "health" at the same position.
+        # Only the keyword itself is captured, so every match maps back to its dictionary entry
+        alternatives = sorted(self._keyword_domains, key=len, reverse=True)
+        self._pattern = re.compile(
+            r'\b(?:' + '|'.join(self._keyword_pattern(keyword, keyword in stems) for keyword in alternatives) + ')',
+            re.IGNORECASE
+        ) if alternatives else None
+        self._group_keywords = alternatives
+        self._priority = {domain: index for index, domain in enumerate(self.domains)}
+
+    @staticmethod
+    def _keyword_pattern(keyword, stem):
+        pattern = '(' + re.escape(keyword).replace(r'\ ', r'[\s_-]+') + ')'
+        return pattern if stem else pattern + r'(?:e?s)?\b'
+
+    @staticmethod
+    def _normalize(keyword):
+        # Spaces, hyphens and underscores are interchangeable ("e-commerce", "e commerce")
+        return re.sub(r'[\s_-]+', ' ', str(keyword)).strip().lower()
+
+    def scores(self, description):
+        """Keyword hits per domain for a description"""
+        hits = {}
+        if self._pattern is None or not description:
+            return hits
+        for match in self._pattern.finditer(description):
+            domain = self._keyword_domains[self._group_keywords[match.lastindex - 1]]
+            hits[domain] = hits.get(domain, 0) + 1
+        return hits
+
+    def classify(self, description):
+        """The domain with the most keyword hits (earlier taxonomy entries win ties), or the default"""
+        hits = self.scores(description)
+        if not hits:
+            return self.default
+        return min(hits, key=lambda domain: (-hits[domain], self._priority[domain]))
+
+    def classify_many(self, descriptions):
+        """Domains for many descriptions, in input order"""
+        return [self.classify(description) for description in descriptions]
+
+
+def load_taxonomy(path):
+    """Read a taxonomy file into (domains {name: [keywords]}, default domain)"""
+    with open(path, 'r', encoding='utf-8') as taxonomy_file:
+        data = yaml.safe_load(taxonomy_file) or {}
+    return data.get('domains') or {}, data.get('default') or 'General'
+
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+
+def get_domain_classifier():
+    """Return the process-wide classifier, compiled from DOMAIN_TAXONOMY_PATH on first use"""
+    global _classifier
+
+    with _classifier_lock:
+        if _classifier is None:
+            taxonomy, default = load_taxonomy(settings.DOMAIN_TAXONOMY_PATH)
+            _classifier = DomainClassifier(taxonomy, default=default)
+        return _classifier
+
+
+def classify_domain(description):
+    """Product domain of one idea description"""
+    return get_domain_classifier().classify(description)
+
+
+def classify_domains(descriptions):
+    """Product domains of many idea descriptions, in input order"""
+    return get_domain_classifier().classify_many(descriptions)
@@ -0,0 +1,173 @@
+import math
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from django.conf import settings
+
+
+# Words that carry no meaning for deciding whether two ideas are the same
+STOPWORDS = {
+    'a', 'an', 'the', 'and', 'or', 'for', 'to', 'of', 'in', 'on', 'with', 'that', 'which',
+    'is', 'are', 'be', 'it', 'its', 'my', 'our', 'their', 'by', 'at', 'as', 'from', 'into',
+    'i', 'we', 'you', 'me', 'us', 'want', 'would', 'like', 'need', 'should', 'can', 'could',
+    'build', 'create', 'make', 'develop', 'design', 'some', 'something', 'where', 'who', 'people',
+}
+
+# Spelling variants folded onto a single term
+SYNONYMS = {
+    'application': 'app',
+    'apps': 'app',
+    'webapp': 'app',
+    'website': 'site',
+    'web': 'site',
+}
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9\-]*")
+
+
+def tokenize(text):
+    """Lowercase word tokens with stopwords and trivial plurals removed"""
+    tokens = []
+    for token in TOKEN_PATTERN.findall((text or '').lower()):
+        if token in STOPWORDS:
+            continue
+        token = SYNONYMS.get(token, token)
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class IdeaSimilarityIndex:
+    """In-memory TF-IDF index over idea descriptions with cosine similarity lookup"""
+
+    def __init__(self):
+        self._docs = {}
+        self._document_frequency = Counter()
+        self._lock = threading.Lock()
+        self.loaded_at = time.time()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, idea_id, text):
+        """Add (or replace) an idea in the index"""
+        terms = Counter(tokenize(text))
+        with self._lock:
+            self._remove_locked(idea_id)
+            if terms:
+                self._docs[idea_id] = terms
+                self._document_frequency.update(terms.keys())
+
+    def remove(self, idea_id):
+        """Remove an idea from the index"""
+        with self._lock:
+            self._remove_locked(idea_id)
+
+    def _remove_locked(self, idea_id):
+        terms = self._docs.pop(idea_id, None)
+        if terms:
+            self._document_frequency.subtract(terms.keys())
+
+    def _vector(self, terms, doc_count):
+        vector = {}
+        for term, count in terms.items():
+            idf = math.log((1 + doc_count) / (1 + self._document_frequency.get(term, 0))) + 1
+            vector[term] = count * idf
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        return vector, norm
+
+    def query(self, text, threshold=0.0, limit=3):
+        """Return up to `limit` (idea_id, score) pairs scoring at least `threshold`, best first"""
+        query_terms = Counter(tokenize(text))
+        if not query_terms:
+            return []
+
+        with self._lock:
+            doc_count = len(self._docs)
+            query_vector, query_norm = self._vector(query_terms, doc_count)
+            matches = []
+            for idea_id, terms in self._docs.items():
+                # Skip documents that share no terms with the query
+                if not any(term in terms for term in query_terms):
+                    continue
+                doc_vector, doc_norm = self._vector(terms, doc_count)
+                if not doc_norm:
+                    continue
+                dot = sum(weight * doc_vector.get(term, 0) for term, weight in query_vector.items())
+                score = dot / (query_norm * doc_norm)
+                if score >= threshold:
+                    matches.append((idea_id, round(score, 4)))
+
+        matches.sort(key=lambda match: match[1], reverse=True)
+        return matches[:limit]
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def _build_user_index(mongodb_service, user_id):
+    """Build a user's index from their stored idea descriptions"""
+    index = IdeaSimilarityIndex()
+    ideas = mongodb_service.ideas_collection.find(
+        {'user_id': user_id},
+        {'description': 1}
+    ).sort('created_at', -1).limit(settings.IDEA_SIMILARITY_MAX_IDEAS)
+    for idea in ideas:
+        index.add(str(idea['_id']), idea.get('description', ''))
+    return index
+
+
+def get_user_index(mongodb_service, user_id):
+    """Return the process-wide similarity index for a user, loading it from MongoDB when missing or expired"""
+    with _indexes_lock:
+        index = _indexes.get(user_id)
+        if index and time.time() - index.loaded_at < settings.IDEA_SIMILARITY_INDEX_TTL_SECONDS:
+            _indexes.move_to_end(user_id)
+            return index
+
+    index = _build_user_index(mongodb_service, user_id)
+
+    with _indexes_lock:
+        _indexes[user_id] = index
+        _indexes.move_to_end(user_id)
+        while len(_indexes) > settings.IDEA_SIMILARITY_MAX_USERS:
+            _indexes.popitem(last=False)
+    return index
+
+
+def record_idea(user_id, idea_id, description):
+    """Add a newly saved idea to its owner's index if that index is loaded in this process"""
+    with _indexes_lock:
+        index = _indexes.get(user_id)
+    if index is not None:
+        index.add(idea_id, description)
+
+
+def find_similar_ideas(mongodb_service, user_id, idea_text, threshold=None, limit=3):
+    """Return (idea_id, score) pairs for the user's ideas that are near-duplicates of idea_text"""
+    if threshold is None:
+        threshold = settings.IDEA_SIMILARITY_THRESHOLD
+    index = get_user_index(mongodb_service, user_id)
+    return index.query(idea_text, threshold=threshold, limit=limit)
+
+
+def find_batch_duplicates(texts, threshold=None):
+    """
+    For each text, the position of an earlier text in the same list it is a near-duplicate of
+    (None for the first of its kind), scored like stored ideas with a TF-IDF index of the list
+    """
+    if threshold is None:
+        threshold = settings.IDEA_SIMILARITY_THRESHOLD
+    index = IdeaSimilarityIndex()
+    duplicate_of = []
+    for position, text in enumerate(texts):
+        matches = index.query(text, threshold=threshold, limit=1)
+        if matches:
+            duplicate_of.append(int(matches[0][0]))
+        else:
+            duplicate_of.append(None)
+            index.add(str(position), text)
+    return duplicate_of
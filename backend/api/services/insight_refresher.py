@@ -0,0 +1,88 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from django.conf import settings
+from .mongodb_service import MongoDBService
+from .rate_limiter import record_event
+from .user_stats import generate_ai_insight
+
+
+logger = logging.getLogger(__name__)
+
+
+# Freshness of a user's stored AI insight
+INSIGHT_FRESH = 'fresh'
+INSIGHT_STALE = 'stale'
+INSIGHT_MISSING = 'missing'
+
+
+def insight_freshness(stats, now=None):
+    """
+    Whether the insight stored on a user_stats document can be served as is: it is stale once
+    new ideas arrived since it was generated or it is older than INSIGHT_MAX_AGE_SECONDS
+    """
+    insight = stats.get('insight')
+    if not insight:
+        return INSIGHT_MISSING
+    if insight.get('total_ideas') != stats.get('total_ideas'):
+        return INSIGHT_STALE
+    generated_at = insight.get('generated_at')
+    if generated_at is None or (now or datetime.utcnow()) - generated_at > timedelta(seconds=settings.INSIGHT_MAX_AGE_SECONDS):
+        return INSIGHT_STALE
+    return INSIGHT_FRESH
+
+
+def refresh_user_insight(user_id):
+    """Regenerate and store a user's AI insight, unless another worker already holds the refresh lease"""
+    mongodb_service = MongoDBService()
+    try:
+        if not mongodb_service.claim_insight_refresh(user_id, settings.INSIGHT_REFRESH_LEASE_SECONDS):
+            return
+        stats = mongodb_service.get_user_stats(user_id)
+        ai_analysis = generate_ai_insight(stats)
+        if ai_analysis.get('fallback'):
+            # Keep serving the previous copy; the lease expiring allows the next retry
+            return
+        mongodb_service.save_user_insight(user_id, dict(
+            ai_analysis,
+            total_ideas=stats['total_ideas'],
+            generated_at=datetime.utcnow()
+        ))
+        record_event('insight_refreshes')
+    except Exception:
+        logger.exception("Insight refresh for user %s failed", user_id)
+    finally:
+        mongodb_service.close()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_executor_pid = None
+_pending = set()
+
+
+def schedule_insight_refresh(user_id):
+    """Regenerate a user's insight in the background; repeated calls while one is pending are ignored"""
+    global _executor, _executor_pid
+
+    with _executor_lock:
+        # Threads do not survive a fork, so each worker process starts its own pool
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=settings.INSIGHT_REFRESH_WORKERS, thread_name_prefix='insight-refresh')
+            _executor_pid = os.getpid()
+            _pending.clear()
+        if user_id in _pending:
+            return
+        _pending.add(user_id)
+        executor = _executor
+
+    def run():
+        try:
+            refresh_user_insight(user_id)
+        finally:
+            with _executor_lock:
+                _pending.discard(user_id)
+
+    executor.submit(run)
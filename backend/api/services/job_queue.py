@@ -0,0 +1,234 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from django.conf import settings
+from django.utils.module_loading import import_string
+from .mongodb_service import MongoDBService
+from .rate_limiter import record_event
+from .refinement import REFINEMENT_CREDIT_COST, run_refinement
+from .timing import end_request_timing, start_request_timing
+
+
+logger = logging.getLogger(__name__)
+
+
+# Job lifecycle states
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+FINISHED_STATES = (JOB_SUCCEEDED, JOB_FAILED)
+
+
+def execute_refinement_job(job_id):
+    """Run one persisted refinement job to completion, refunding credits if it fails"""
+    # Jobs get their own timing so the saved idea carries its stage spans like a synchronous refine
+    timing, timing_token = start_request_timing()
+    mongodb_service = MongoDBService()
+    try:
+        job = mongodb_service.claim_refinement_job(job_id, settings.REFINE_JOB_LEASE_SECONDS)
+        if not job:
+            return
+
+        try:
+            result = run_refinement(mongodb_service, job['user_id'], job['idea'], rounds=job.get('rounds'))
+        except Exception as e:
+            result = {'success': False, 'error': str(e)}
+
+        if result['success']:
+            finished = mongodb_service.finish_refinement_job(job_id, job['lease_id'], {
+                'status': JOB_SUCCEEDED,
+                'result': result,
+                'finished_at': datetime.utcnow()
+            })
+        else:
+            finished = mongodb_service.finish_refinement_job(job_id, job['lease_id'], {
+                'status': JOB_FAILED,
+                'error': result.get('error', 'Unknown error occurred'),
+                'finished_at': datetime.utcnow()
+            })
+            # Refund credits if requirement generation failed (unless recovery already did)
+            if finished:
+                mongodb_service.add_credits(job['user_id'], REFINEMENT_CREDIT_COST, 'Credit refund - requirement generation failed')
+        if not finished:
+            logger.warning("Refinement job %s finished after its lease expired; outcome discarded", job_id)
+    except Exception:
+        logger.exception("Refinement job %s crashed", job_id)
+    finally:
+        mongodb_service.close()
+        end_request_timing(timing_token)
+
+
+def recover_stale_jobs():
+    """
+    Fail and refund jobs whose worker died: running jobs past their lease and jobs that were never
+    picked up (e.g. queued in memory by a process that restarted). Returns the number recovered.
+    """
+    mongodb_service = MongoDBService()
+    try:
+        jobs = mongodb_service.fail_stale_refinement_jobs(
+            settings.REFINE_JOB_LEASE_SECONDS,
+            settings.REFINE_JOB_QUEUE_TIMEOUT_SECONDS,
+            'Job was interrupted before it finished; credits were refunded'
+        )
+        for job in jobs:
+            mongodb_service.add_credits(job['user_id'], REFINEMENT_CREDIT_COST, 'Credit refund - refinement job interrupted')
+            record_event('refine_jobs_recovered')
+            logger.warning("Recovered stale refinement job %s; credits refunded", job['_id'])
+        return len(jobs)
+    finally:
+        mongodb_service.close()
+
+
+def _reap_stale_jobs():
+    while True:
+        try:
+            recover_stale_jobs()
+        except Exception:
+            logger.exception("Stale refinement job recovery failed")
+        time.sleep(settings.REFINE_JOB_REAP_INTERVAL_SECONDS)
+
+
+_reaper_pid = None
+_reaper_lock = threading.Lock()
+
+
+def ensure_job_reaper():
+    """Start this worker process's stale job sweep, once (every process may run one; sweeps are idempotent)"""
+    global _reaper_pid
+
+    with _reaper_lock:
+        if _reaper_pid != os.getpid():
+            threading.Thread(target=_reap_stale_jobs, name='refine-job-reaper', daemon=True).start()
+            _reaper_pid = os.getpid()
+
+
+class InProcessJobQueue:
+    """
+    Runs jobs on a thread pool inside the current worker process. Queued jobs are lost if the
+    process exits; the stale job sweep fails and refunds them.
+    """
+
+    def __init__(self, max_workers):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='refine-job')
+
+    def submit(self, job_id):
+        self.executor.submit(execute_refinement_job, job_id)
+
+
+class SQLiteJobQueue:
+    """
+    Durable local queue: job ids are stored in a SQLite table and claimed by polling worker threads.
+    Pending jobs survive a restart and may be picked up by any process sharing the database file.
+    A claim held longer than REFINE_JOB_LEASE_SECONDS (its worker died) is released for another worker.
+    """
+
+    def __init__(self, max_workers, path=None, poll_interval=1.0):
+        self.path = path or settings.REFINE_JOB_SQLITE_PATH
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+
+        connection = self._connect()
+        try:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS refinement_jobs ("
+                "job_id TEXT PRIMARY KEY, claimed_by TEXT, enqueued_at REAL NOT NULL, claimed_at REAL)"
+            )
+            # Tables created before claims expired have no claimed_at column
+            columns = [row[1] for row in connection.execute("PRAGMA table_info(refinement_jobs)")]
+            if 'claimed_at' not in columns:
+                connection.execute("ALTER TABLE refinement_jobs ADD COLUMN claimed_at REAL")
+        finally:
+            connection.close()
+
+        for index in range(max_workers):
+            threading.Thread(target=self._work, name=f'refine-job-{index}', daemon=True).start()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def submit(self, job_id):
+        connection = self._connect()
+        try:
+            connection.execute(
+                "INSERT OR IGNORE INTO refinement_jobs (job_id, claimed_by, enqueued_at) VALUES (?, NULL, ?)",
+                (job_id, time.time())
+            )
+        finally:
+            connection.close()
+        self._wakeup.set()
+
+    def _claim(self, connection, worker_id):
+        """Atomically claim the oldest unclaimed job id, first releasing claims whose worker died"""
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "UPDATE refinement_jobs SET claimed_by = NULL, claimed_at = NULL "
+                "WHERE claimed_by IS NOT NULL AND (claimed_at IS NULL OR claimed_at < ?)",
+                (now - settings.REFINE_JOB_LEASE_SECONDS,)
+            )
+            row = connection.execute(
+                "SELECT job_id FROM refinement_jobs WHERE claimed_by IS NULL ORDER BY enqueued_at LIMIT 1"
+            ).fetchone()
+            if row:
+                connection.execute(
+                    "UPDATE refinement_jobs SET claimed_by = ?, claimed_at = ? WHERE job_id = ?",
+                    (worker_id, now, row[0])
+                )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return row[0] if row else None
+
+    def _work(self):
+        worker_id = f"{os.getpid()}:{threading.current_thread().name}"
+        connection = self._connect()
+        while True:
+            try:
+                job_id = self._claim(connection, worker_id)
+            except Exception:
+                logger.exception("Failed to claim refinement job")
+                job_id = None
+
+            if not job_id:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            execute_refinement_job(job_id)
+            connection.execute("DELETE FROM refinement_jobs WHERE job_id = ?", (job_id,))
+
+
+_queue = None
+_queue_lock = threading.Lock()
+_queue_pid = None
+
+
+def get_job_queue():
+    """Return this worker process's job queue backend (configured by REFINE_JOB_QUEUE_BACKEND)"""
+    global _queue, _queue_pid
+
+    with _queue_lock:
+        # Worker threads do not survive a fork, so each process starts its own
+        if _queue is None or _queue_pid != os.getpid():
+            backend_class = import_string(settings.REFINE_JOB_QUEUE_BACKEND)
+            _queue = backend_class(max_workers=settings.REFINE_JOB_WORKERS)
+            _queue_pid = os.getpid()
+    ensure_job_reaper()
+    return _queue
+
+
+def wait_for_job(mongodb_service, job_id, timeout):
+    """Poll a job until it finishes or timeout seconds pass, returning the latest job document"""
+    deadline = time.monotonic() + timeout
+    while True:
+        job = mongodb_service.get_refinement_job(job_id)
+        if not job or job['status'] in FINISHED_STATES or time.monotonic() >= deadline:
+            return job
+        time.sleep(min(settings.REFINE_JOB_POLL_INTERVAL, max(0, deadline - time.monotonic())))
@@ -0,0 +1,171 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_idea(idea):
+    """Normalize idea text so trivially different submissions share a cache entry"""
+    return re.sub(r'\s+', ' ', idea or '').strip().lower()
+
+
+def make_cache_key(kind, idea, agent_key, prompt_version, model, temperature, extra=""):
+    """Build a content-addressed cache key for an LLM call"""
+    payload = json.dumps([
+        kind,
+        normalize_idea(idea),
+        agent_key,
+        prompt_version,
+        model,
+        temperature,
+        extra
+    ])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMResponseCache:
+    """Two-tier (in-process LRU + MongoDB with TTL) cache for LLM responses"""
+
+    def __init__(self, max_entries=512, ttl_seconds=604800, use_mongo=True):
+        self.max_entries = max_entries
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.use_mongo = use_mongo
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._collection = None
+        self._mongo_lock = threading.Lock()
+
+        self._stats = {
+            'memory_hits': 0,
+            'mongo_hits': 0,
+            'misses': 0,
+            'writes': 0,
+            'errors': 0
+        }
+
+    def _get_collection(self):
+        """Lazily connect the MongoDB tier, creating its TTL index once"""
+        if not self.use_mongo:
+            return None
+
+        with self._mongo_lock:
+            if self._collection is None:
+                from .mongodb_service import MongoDBService
+
+                mongodb_service = MongoDBService()
+                collection = mongodb_service.db.llm_cache
+                collection.create_index("key", unique=True)
+                collection.create_index("expires_at", expireAfterSeconds=0)
+                self._collection = collection
+            return self._collection
+
+    def _count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def _remember(self, key, value, expires_at):
+        """Store an entry in the in-process LRU tier"""
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        """Return the cached response for key, or None on a miss"""
+        now = datetime.utcnow()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    return value
+                del self._entries[key]
+
+        try:
+            collection = self._get_collection()
+            if collection is not None:
+                doc = collection.find_one({'key': key, 'expires_at': {'$gt': now}})
+                if doc:
+                    self._remember(key, doc['response'], doc['expires_at'])
+                    self._count('mongo_hits')
+                    return doc['response']
+        except Exception as e:
+            self._count('errors')
+            logger.warning("LLM cache lookup failed: %s", e)
+
+        self._count('misses')
+        return None
+
+    def set(self, key, value, metadata=None):
+        """Store a response in both cache tiers"""
+        now = datetime.utcnow()
+        expires_at = now + self.ttl
+        self._remember(key, value, expires_at)
+        self._count('writes')
+
+        try:
+            collection = self._get_collection()
+            if collection is not None:
+                collection.update_one(
+                    {'key': key},
+                    {'$set': {
+                        'key': key,
+                        'response': value,
+                        'metadata': metadata or {},
+                        'created_at': now,
+                        'expires_at': expires_at
+                    }},
+                    upsert=True
+                )
+        except Exception as e:
+            self._count('errors')
+            logger.warning("LLM cache write failed: %s", e)
+
+    def clear(self):
+        """Drop all in-process entries"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        """Return hit/miss counters for the cache"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._entries)
+
+        hits = stats['memory_hits'] + stats['mongo_hits']
+        lookups = hits + stats['misses']
+        stats['hit_rate'] = round(hits / lookups, 4) if lookups else 0.0
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    """Return the process-wide LLM response cache, or None when caching is disabled"""
+    global _cache
+
+    if not settings.LLM_CACHE_ENABLED:
+        return None
+
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMResponseCache(
+                max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+                ttl_seconds=settings.LLM_CACHE_TTL_SECONDS,
+                use_mongo=settings.LLM_CACHE_USE_MONGO
+            )
+        return _cache
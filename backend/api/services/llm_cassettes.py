@@ -0,0 +1,171 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from django.conf import settings
+from .llm_providers import FakeLLMMessage, LLMProvider, create_llm_provider
+
+
+logger = logging.getLogger(__name__)
+
+
+class CassetteMissError(Exception):
+    """Raised in replay mode when a prompt was never recorded"""
+
+
+def _prompt_text(messages):
+    if isinstance(messages, str):
+        return messages
+    return '\n'.join(
+        f"{getattr(message, 'type', 'message')}: {getattr(message, 'content', message)}"
+        for message in messages
+    )
+
+
+def cassette_key(model, temperature, messages):
+    """Stable key identifying one LLM request"""
+    payload = f"{model}\n{float(temperature)}\n{_prompt_text(messages)}"
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class Cassette:
+    """Append-only JSON Lines file of recorded LLM request/response pairs"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = defaultdict(list)
+        self._cursors = defaultdict(int)
+
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as cassette_file:
+                for line in cassette_file:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries[entry['key']].append(entry)
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._entries.values())
+
+    def append(self, entry):
+        with self._lock:
+            self._entries[entry['key']].append(entry)
+            with open(self.path, 'a', encoding='utf-8') as cassette_file:
+                cassette_file.write(json.dumps(entry) + '\n')
+
+    def next_entry(self, key):
+        """Return the next recording for key, cycling when a prompt was recorded fewer times than replayed"""
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                return None
+            entry = entries[self._cursors[key] % len(entries)]
+            self._cursors[key] += 1
+            return entry
+
+
+class RecordingChatModel:
+    """Passes calls to a real chat model and records each request, response and its timing"""
+
+    def __init__(self, llm, cassette, model, temperature):
+        self.llm = llm
+        self.cassette = cassette
+        self.model = model
+        self.temperature = temperature
+
+    def _record(self, messages, kind, content, latency, chunks=None):
+        self.cassette.append({
+            'key': cassette_key(self.model, self.temperature, messages),
+            'model': self.model,
+            'temperature': self.temperature,
+            'kind': kind,
+            'prompt': _prompt_text(messages),
+            'response': content,
+            'chunks': chunks,
+            'latency_ms': round(latency * 1000, 1),
+            'recorded_at': datetime.utcnow().isoformat()
+        })
+
+    def invoke(self, messages, **kwargs):
+        started_at = time.monotonic()
+        response = self.llm.invoke(messages, **kwargs)
+        self._record(messages, 'invoke', response.content, time.monotonic() - started_at)
+        return response
+
+    def stream(self, messages, **kwargs):
+        started_at = time.monotonic()
+        chunks = []
+        for chunk in self.llm.stream(messages, **kwargs):
+            # Offset of each chunk from the start of the call, so replay can keep the original pacing
+            chunks.append([round((time.monotonic() - started_at) * 1000, 1), chunk.content])
+            yield chunk
+        self._record(
+            messages, 'stream', ''.join(content for _, content in chunks),
+            time.monotonic() - started_at, chunks=chunks
+        )
+
+
+class ReplayChatModel:
+    """Serves recorded responses offline, optionally sleeping for the recorded latency"""
+
+    def __init__(self, cassette, model, temperature, keep_latency=True):
+        self.cassette = cassette
+        self.model = model
+        self.temperature = temperature
+        self.keep_latency = keep_latency
+
+    def _entry(self, messages):
+        entry = self.cassette.next_entry(cassette_key(self.model, self.temperature, messages))
+        if entry is None:
+            raise CassetteMissError(f"No cassette recording for this {self.model} prompt in {self.cassette.path}")
+        return entry
+
+    def invoke(self, messages, **kwargs):
+        entry = self._entry(messages)
+        if self.keep_latency:
+            time.sleep(entry['latency_ms'] / 1000.0)
+        return FakeLLMMessage(entry['response'])
+
+    def stream(self, messages, **kwargs):
+        entry = self._entry(messages)
+        # Entries recorded through invoke() replay as a single chunk
+        chunks = entry.get('chunks') or [[entry['latency_ms'], entry['response']]]
+        elapsed_ms = 0.0
+        for offset_ms, content in chunks:
+            if self.keep_latency and offset_ms > elapsed_ms:
+                time.sleep((offset_ms - elapsed_ms) / 1000.0)
+                elapsed_ms = offset_ms
+            yield FakeLLMMessage(content)
+
+
+class CassetteRecordProvider(LLMProvider):
+    """Records every call made through LLM_CASSETTE_RECORD_PROVIDER into LLM_CASSETTE_PATH"""
+
+    name = 'cassette_record'
+
+    def __init__(self):
+        self.inner = create_llm_provider(settings.LLM_CASSETTE_RECORD_PROVIDER)
+        self.cassette = Cassette(settings.LLM_CASSETTE_PATH)
+
+    def create_chat_model(self, model, temperature):
+        return RecordingChatModel(self.inner.create_chat_model(model, temperature), self.cassette, model, temperature)
+
+
+class CassetteReplayProvider(LLMProvider):
+    """Replays LLM_CASSETTE_PATH without network access"""
+
+    name = 'cassette_replay'
+
+    # Recorded latencies already reflect the real service; don't throttle replays on top of them
+    rate_limited = False
+
+    def __init__(self):
+        self.cassette = Cassette(settings.LLM_CASSETTE_PATH)
+        logger.info("Loaded %d LLM recordings from %s", len(self.cassette), settings.LLM_CASSETTE_PATH)
+
+    def create_chat_model(self, model, temperature):
+        return ReplayChatModel(self.cassette, model, temperature, keep_latency=settings.LLM_CASSETTE_KEEP_LATENCY)
@@ -0,0 +1,80 @@
+import logging
+import os
+import threading
+from django.conf import settings
+from .circuit_breaker import CircuitBreakerChatModel, get_circuit_breaker
+from .deadlines import DeadlineChatModel
+from .llm_providers import create_llm_provider
+from .rate_limiter import RateLimitedChatModel, get_rate_limiter
+
+
+logger = logging.getLogger(__name__)
+
+
+# Warm LLM clients keyed by (model, temperature), created once per worker process
+_clients = {}
+_clients_lock = threading.Lock()
+_clients_pid = None
+_provider = None
+
+
+def _reset_after_fork():
+    """Drop clients inherited from a parent process; gRPC channels must not be shared across a fork"""
+    global _clients_pid, _provider
+
+    if _clients_pid != os.getpid():
+        _clients.clear()
+        _provider = create_llm_provider()
+        _clients_pid = os.getpid()
+
+
+def get_llm(model, temperature):
+    """
+    Return the shared chat client for a model/temperature pair, creating it on first use.
+    Clients come from the configured LLM_PROVIDER, are gated by the provider's circuit breaker
+    and, unless the provider opts out, every call goes through the process-wide rate limiter.
+    invoke() accepts deadline_seconds/deadline_key to bound the provider request itself.
+    """
+    key = (model, float(temperature))
+
+    with _clients_lock:
+        _reset_after_fork()
+
+        client = _clients.get(key)
+        if client is None:
+            client = _provider.create_chat_model(model, temperature)
+            # Breaker inside the limiter, so queueing for quota is not mistaken for a slow service;
+            # the limiter still checks it first, so an open circuit fails without waiting for quota
+            breaker = get_circuit_breaker(_provider.name) if settings.LLM_CIRCUIT_BREAKER_ENABLED else None
+            if breaker is not None:
+                client = CircuitBreakerChatModel(client, breaker)
+            # Deadline inside the limiter too: only the provider request is timed, not the wait for quota
+            limiter = get_rate_limiter() if _provider.rate_limited else None
+            client = DeadlineChatModel(client, limiter)
+            if limiter is not None:
+                client = RateLimitedChatModel(client, limiter, breaker)
+            _clients[key] = client
+            logger.info("LLM client created for %s (provider=%s, temperature=%s)", model, _provider.name, temperature)
+        return client
+
+
+def get_llm_circuit_breaker():
+    """Circuit breaker guarding the configured provider (None when breaking is disabled)"""
+    if not settings.LLM_CIRCUIT_BREAKER_ENABLED:
+        return None
+    with _clients_lock:
+        _reset_after_fork()
+        return get_circuit_breaker(_provider.name)
+
+
+def get_client_stats():
+    """Return the keys of the clients currently held by this process"""
+    with _clients_lock:
+        return {
+            'pid': _clients_pid,
+            'provider': _provider.name if _provider else None,
+            'clients': [
+                {'model': model, 'temperature': temperature}
+                for model, temperature in _clients.keys()
+            ]
+        }
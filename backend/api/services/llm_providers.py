@@ -0,0 +1,247 @@
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class LLMProvider:
+    """Creates chat models exposing the LangChain invoke()/stream() interface used across the app"""
+
+    name = None
+
+    # Whether calls should pass through the shared Gemini rate limiter
+    rate_limited = True
+
+    def create_chat_model(self, model, temperature):
+        raise NotImplementedError
+
+
+class GeminiProvider(LLMProvider):
+    """Google Gemini through LangChain"""
+
+    name = 'gemini'
+
+    def __init__(self):
+        import google.generativeai as genai
+
+        genai.configure(api_key=settings.GEMINI_API_KEY)
+
+    def create_chat_model(self, model, temperature):
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        return ChatGoogleGenerativeAI(
+            model=model,
+            google_api_key=settings.GEMINI_API_KEY,
+            temperature=temperature
+        )
+
+
+class FakeLLMMessage:
+    """Minimal stand-in for a LangChain AIMessage / AIMessageChunk"""
+
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeRateLimitError(Exception):
+    """Injected quota error, worded like Gemini's 429 so the normal handling applies"""
+
+
+class FakeLLMError(Exception):
+    """Injected non-quota failure"""
+
+
+FAKE_VOCABULARY = (
+    "users product market revenue platform feature mobile onboarding retention pricing "
+    "scalability security latency design accessibility workflow dashboard analytics "
+    "integration roadmap priority requirement customer feedback value risk cost team "
+    "launch metric growth support experience data privacy compliance reliable simple"
+).split()
+
+# (marker, responder) pairs: prompts containing the marker get the responder's text instead of filler prose.
+# responder(prompt, rng, output_tokens) -> str
+FAKE_RESPONDERS = []
+
+
+def register_fake_responder(marker, responder):
+    """Teach the fake provider how to answer prompts that expect a specific output format"""
+    FAKE_RESPONDERS.append((marker, responder))
+
+
+def _fake_title(prompt, rng, output_tokens):
+    return ' '.join(rng.choice(FAKE_VOCABULARY).capitalize() for _ in range(3))
+
+
+def _fake_titles(prompt, rng, output_tokens):
+    count = int(re.search(r'exactly\s+(\d+) titles', prompt).group(1))
+    return json.dumps({'titles': [_fake_title(prompt, rng, output_tokens) for _ in range(count)]})
+
+
+def _fake_insight(prompt, rng, output_tokens):
+    return json.dumps({
+        'ai_insight': _filler_text(rng, 40),
+        'recommendations': [_filler_text(rng, 12) for _ in range(4)]
+    })
+
+
+def _fake_prd(prompt, rng, output_tokens):
+    def items(count, **extra):
+        return [
+            dict({'title': _filler_text(rng, 5).rstrip('.'), 'description': _filler_text(rng, 20)}, **extra)
+            for _ in range(count)
+        ]
+    return json.dumps({
+        'refined_requirements': items(6, priority=rng.choice(['high', 'medium', 'low'])),
+        'trade_offs': items(4),
+        'next_steps': items(4, timeline=f"{rng.randint(1, 8)} weeks")
+    })
+
+
+register_fake_responder('Return only the clean title', _fake_title)
+register_fake_responder('{"titles":', _fake_titles)
+register_fake_responder('"ai_insight"', _fake_insight)
+register_fake_responder('"refined_requirements"', _fake_prd)
+
+
+def _prompt_text(messages):
+    if isinstance(messages, str):
+        return messages
+    return '\n'.join(str(getattr(message, 'content', message)) for message in messages)
+
+
+def _filler_text(rng, output_tokens):
+    words = []
+    while len(words) < output_tokens:
+        sentence = [rng.choice(FAKE_VOCABULARY) for _ in range(rng.randint(6, 14))]
+        sentence[0] = sentence[0].capitalize()
+        words.extend(sentence)
+        words[-1] += '.'
+    return ' '.join(words[:output_tokens])
+
+
+class FakeChatModel:
+    """
+    Deterministic offline chat model. Output text depends only on the prompt (and FAKE_LLM_SEED);
+    latency, output size and injected failures are drawn from a seeded per-model generator.
+    """
+
+    def __init__(self, model, temperature, config):
+        self.model = model
+        self.temperature = temperature
+        self.config = config
+        self._rng = random.Random(f"{config['seed']}:{model}:{temperature}")
+        self._lock = threading.Lock()
+
+    def _sample(self):
+        """Draw (latency_seconds, output_tokens, failure) for one call"""
+        config = self.config
+        with self._lock:
+            mean = config['latency_ms_mean']
+            stddev = config['latency_ms_stddev']
+            distribution = config['latency_distribution']
+            if distribution == 'fixed':
+                latency_ms = mean
+            elif distribution == 'uniform':
+                latency_ms = self._rng.uniform(max(0, mean - stddev), mean + stddev)
+            elif distribution == 'lognormal' and mean > 0:
+                # Parameterised so the distribution has the configured mean and standard deviation
+                sigma = math.sqrt(math.log(1 + (stddev / mean) ** 2))
+                mu = math.log(mean) - sigma ** 2 / 2
+                latency_ms = self._rng.lognormvariate(mu, sigma)
+            else:
+                latency_ms = self._rng.gauss(mean, stddev)
+
+            output_tokens = max(1, int(self._rng.gauss(config['output_tokens'], config['output_tokens_stddev'])))
+
+            roll = self._rng.random()
+            if roll < config['rate_limit_rate']:
+                failure = FakeRateLimitError(
+                    "429 Resource has been exhausted (e.g. check quota). Please retry in 1s"
+                )
+            elif roll < config['rate_limit_rate'] + config['error_rate']:
+                failure = FakeLLMError("503 The model is overloaded. Please try again later.")
+            else:
+                failure = None
+
+        return max(0.0, latency_ms) / 1000.0, output_tokens, failure
+
+    def _respond(self, messages, output_tokens):
+        prompt = _prompt_text(messages)
+        digest = hashlib.sha256(f"{self.config['seed']}:{self.model}:{prompt}".encode('utf-8')).hexdigest()
+        rng = random.Random(digest)
+
+        for marker, responder in FAKE_RESPONDERS:
+            if marker in prompt:
+                return responder(prompt, rng, output_tokens)
+        return _filler_text(rng, output_tokens)
+
+    def invoke(self, messages, **kwargs):
+        latency, output_tokens, failure = self._sample()
+        time.sleep(latency)
+        if failure:
+            raise failure
+        return FakeLLMMessage(self._respond(messages, output_tokens))
+
+    def stream(self, messages, **kwargs):
+        latency, output_tokens, failure = self._sample()
+
+        # Time to first token, then the remaining latency spread across the chunks
+        time.sleep(latency * self.config['first_token_fraction'])
+        if failure:
+            raise failure
+
+        words = self._respond(messages, output_tokens).split(' ')
+        chunks = [' '.join(words[index:index + 4]) for index in range(0, len(words), 4)]
+        per_chunk = latency * (1 - self.config['first_token_fraction']) / max(1, len(chunks))
+        for index, chunk in enumerate(chunks):
+            if index:
+                time.sleep(per_chunk)
+            yield FakeLLMMessage(chunk if index == 0 else ' ' + chunk)
+
+    def get_num_tokens(self, text):
+        return max(1, len(text) // 4)
+
+
+class FakeProvider(LLMProvider):
+    """Local provider with configurable latency distributions, output sizes and error/429 injection"""
+
+    name = 'fake'
+
+    def __init__(self, **overrides):
+        self.config = {
+            'seed': settings.FAKE_LLM_SEED,
+            'latency_distribution': settings.FAKE_LLM_LATENCY_DISTRIBUTION,
+            'latency_ms_mean': settings.FAKE_LLM_LATENCY_MS_MEAN,
+            'latency_ms_stddev': settings.FAKE_LLM_LATENCY_MS_STDDEV,
+            'first_token_fraction': settings.FAKE_LLM_FIRST_TOKEN_FRACTION,
+            'output_tokens': settings.FAKE_LLM_OUTPUT_TOKENS,
+            'output_tokens_stddev': settings.FAKE_LLM_OUTPUT_TOKENS_STDDEV,
+            'error_rate': settings.FAKE_LLM_ERROR_RATE,
+            'rate_limit_rate': settings.FAKE_LLM_RATE_LIMIT_RATE,
+        }
+        self.config.update(overrides)
+
+    def create_chat_model(self, model, temperature):
+        return FakeChatModel(model, temperature, self.config)
+
+
+PROVIDERS = {
+    'gemini': GeminiProvider,
+    'fake': FakeProvider,
+    'cassette_record': 'api.services.llm_cassettes.CassetteRecordProvider',
+    'cassette_replay': 'api.services.llm_cassettes.CassetteReplayProvider',
+}
+
+
+def create_llm_provider(name=None):
+    """Instantiate the provider named by LLM_PROVIDER (a short name or a dotted class path)"""
+    name = name or settings.LLM_PROVIDER
+    provider_class = PROVIDERS.get(name, name)
+    if isinstance(provider_class, str):
+        provider_class = import_string(provider_class)
+    return provider_class()
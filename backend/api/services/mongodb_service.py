@@ -1,9 +1,171 @@
 import os
-from pymongo import MongoClient
+import threading
+import uuid
+from pymongo import MongoClient, ReturnDocument, UpdateOne, monitoring
 from django.conf import settings
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 from bson import ObjectId
+from .domain_classifier import classify_domain, classify_domains
+from .idea_similarity import record_idea
+from .user_stats import build_stats_document, stats_update
+from .timing import span
+
+
+class ConnectionPoolStats(monitoring.ConnectionPoolListener):
+    """Connection pool counters of this process's MongoClient, fed by pymongo's pool events"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {
+            'connections_created': 0,
+            'connections_closed': 0,
+            'checkouts': 0,
+            'checkout_failures': 0,
+            'pool_clears': 0
+        }
+        self._checked_out = 0
+
+    def _count(self, name, delta=1):
+        with self._lock:
+            self._counts[name] += delta
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._count('pool_clears')
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._count('connections_created')
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._count('connections_closed')
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._count('checkout_failures')
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self._counts['checkouts'] += 1
+            self._checked_out += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self._checked_out -= 1
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._counts)
+            stats['checked_out'] = self._checked_out
+        stats['open_connections'] = stats['connections_created'] - stats['connections_closed']
+        return stats
+
+
+def _create_indexes(db):
+    """Create database indexes for better performance"""
+    try:
+        # User indexes
+        db.users.create_index("email", unique=True)
+        db.users.create_index("created_at")
+        
+        # Idea indexes
+        db.ideas.create_index("created_at")
+        db.ideas.create_index("user_id")
+        
+        # Debate indexes
+        db.debates.create_index("idea_id")
+        db.debates.create_index("round_number")
+        
+        # Requirements indexes
+        db.requirements.create_index("idea_id")
+        db.requirements.create_index("created_at")
+        
+        # Transaction indexes
+        db.credit_transactions.create_index("user_id")
+        db.credit_transactions.create_index("created_at")
+        
+        # Refinement job indexes
+        db.refinement_jobs.create_index([("user_id", 1), ("created_at", -1)])
+        db.refinement_jobs.create_index("status")
+        
+        print("✅ Database indexes created successfully")
+        
+    except Exception as e:
+        print(f"⚠️ Warning: Failed to create some indexes: {str(e)}")
+
+
+_client = None
+_client_lock = threading.Lock()
+_client_pid = None
+_pool_stats = None
+
+
+def get_mongo_client():
+    """
+    Return this process's MongoClient, connecting (and creating indexes) on first use.
+    Every MongoDBService shares it and its connection pool (MONGODB_MAX_POOL_SIZE).
+    """
+    global _client, _client_pid, _pool_stats
+
+    with _client_lock:
+        # A client inherited through a fork shares the parent's sockets; the child opens its own
+        if _client is None or _client_pid != os.getpid():
+            pool_stats = ConnectionPoolStats()
+            try:
+                with span('mongo.connect'):
+                    client = MongoClient(
+                        settings.MONGODB_URI,
+                        serverSelectionTimeoutMS=10000,
+                        connectTimeoutMS=10000,
+                        socketTimeoutMS=20000,
+                        maxPoolSize=settings.MONGODB_MAX_POOL_SIZE,
+                        minPoolSize=settings.MONGODB_MIN_POOL_SIZE,
+                        maxIdleTimeMS=settings.MONGODB_MAX_IDLE_TIME_MS,
+                        waitQueueTimeoutMS=settings.MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+                        retryWrites=True,
+                        w='majority',
+                        event_listeners=[pool_stats]
+                    )
+                    
+                    # Test the connection
+                    client.admin.command('ping')
+            except Exception as e:
+                print(f"❌ MongoDB connection failed: {str(e)}")
+                raise Exception(f"Failed to connect to MongoDB: {str(e)}")
+            
+            # Create indexes for better performance, once per process
+            _create_indexes(client[settings.MONGODB_DB_NAME])
+            
+            _client, _client_pid, _pool_stats = client, os.getpid(), pool_stats
+            print(f"✅ MongoDB connected successfully to {settings.MONGODB_DB_NAME} (pool size {settings.MONGODB_MAX_POOL_SIZE})")
+        return _client
+
+
+def get_mongo_pool_stats():
+    """Connection pool counters and settings of this process's MongoClient, for the metrics endpoint"""
+    with _client_lock:
+        pool_stats = _pool_stats if _client_pid == os.getpid() else None
+    if pool_stats is None:
+        return {'connected': False}
+    return dict(
+        pool_stats.get_stats(),
+        connected=True,
+        max_pool_size=settings.MONGODB_MAX_POOL_SIZE,
+        min_pool_size=settings.MONGODB_MIN_POOL_SIZE
+    )
 
 
 class MongoDBService:
@@ -17,65 +179,19 @@ class MongoDBService:
         if not self.mongodb_uri:
             raise ValueError("MONGODB_URI is not configured in settings")
         
-        try:
-            # Connect to MongoDB with proper options
-            self.client = MongoClient(
-                self.mongodb_uri,
-                serverSelectionTimeoutMS=10000,
-                connectTimeoutMS=10000,
-                socketTimeoutMS=20000,
-                maxPoolSize=10,
-                retryWrites=True,
-                w='majority'
-            )
-            
-            # Test the connection
-            self.client.admin.command('ping')
-            self.db = self.client[self.db_name]
-            
-            # Initialize collections
-            self.ideas_collection = self.db.ideas
-            self.debates_collection = self.db.debates
-            self.requirements_collection = self.db.requirements
-            self.users_collection = self.db.users
-            self.credit_transactions_collection = self.db.credit_transactions
-            
-            # Create indexes for better performance
-            self._create_indexes()
-            
-            print(f"✅ MongoDB connected successfully to {self.db_name}")
-            
-        except Exception as e:
-            print(f"❌ MongoDB connection failed: {str(e)}")
-            raise Exception(f"Failed to connect to MongoDB: {str(e)}")
-    
-    def _create_indexes(self):
-        """Create database indexes for better performance"""
-        try:
-            # User indexes
-            self.users_collection.create_index("email", unique=True)
-            self.users_collection.create_index("created_at")
-            
-            # Idea indexes
-            self.ideas_collection.create_index("created_at")
-            self.ideas_collection.create_index("user_id")
-            
-            # Debate indexes
-            self.debates_collection.create_index("idea_id")
-            self.debates_collection.create_index("round_number")
-            
-            # Requirements indexes
-            self.requirements_collection.create_index("idea_id")
-            self.requirements_collection.create_index("created_at")
-            
-            # Transaction indexes
-            self.credit_transactions_collection.create_index("user_id")
-            self.credit_transactions_collection.create_index("created_at")
-            
-            print("✅ Database indexes created successfully")
-            
-        except Exception as e:
-            print(f"⚠️ Warning: Failed to create some indexes: {str(e)}")
+        # Shared, pooled client; only the first service in a process connects
+        self.client = get_mongo_client()
+        self.db = self.client[self.db_name]
+        
+        # Initialize collections
+        self.ideas_collection = self.db.ideas
+        self.debates_collection = self.db.debates
+        self.requirements_collection = self.db.requirements
+        self.users_collection = self.db.users
+        self.credit_transactions_collection = self.db.credit_transactions
+        self.refinement_jobs_collection = self.db.refinement_jobs
+        # Per-user insight counters, keyed by user ID and updated whenever ideas are saved
+        self.user_stats_collection = self.db.user_stats
     
     def save_idea(self, idea_data):
         """Save idea to MongoDB"""
@@ -84,11 +200,137 @@ class MongoDBService:
         # Ensure user_id is included
         if 'user_id' not in idea_data:
             raise ValueError("user_id is required for idea creation")
+        idea_data.setdefault('domain', classify_domain(idea_data.get('description', '')))
         result = self.ideas_collection.insert_one(idea_data)
-        return str(result.inserted_id)
+        idea_id = str(result.inserted_id)
+        
+        # Keep this process's near-duplicate index and the user's insight counters current
+        record_idea(idea_data['user_id'], idea_id, idea_data.get('description', ''))
+        self._update_user_stats({idea_data['user_id']: [idea_data]})
+        return idea_id
     
-    def save_debates(self, idea_id, debates):
-        """Save debate entries to MongoDB"""
+    def _update_user_stats(self, ideas_by_user):
+        """Apply newly saved ideas ({user_id: [idea_data]}) to their users' stats documents with one atomic update each"""
+        try:
+            self.user_stats_collection.bulk_write([
+                UpdateOne({'_id': user_id}, stats_update(ideas), upsert=True)
+                for user_id, ideas in ideas_by_user.items()
+            ], ordered=False)
+        except Exception as e:
+            print(f"⚠️ Warning: Failed to update user stats: {str(e)}")
+            try:
+                # The ideas are saved; flag the counters so the next read recounts them
+                self.user_stats_collection.update_many(
+                    {'_id': {'$in': list(ideas_by_user)}}, {'$set': {'complete': False}}
+                )
+            except Exception:
+                pass
+    
+    def get_user_stats(self, user_id):
+        """
+        The user's stats document (idea count, domain histogram, recent ideas, cached insight).
+        Users whose counters predate the stats collection are recounted from their ideas once.
+        """
+        stats = self.user_stats_collection.find_one({'_id': user_id})
+        if stats is None or not stats.get('complete'):
+            stats = self.rebuild_user_stats(user_id)
+        return stats
+    
+    def rebuild_user_stats(self, user_id):
+        """Recount a user's stats document from all of their ideas"""
+        ideas = list(self.ideas_collection.find(
+            {'user_id': user_id},
+            {'description': 1, 'domain': 1}
+        ).sort('created_at', 1))
+        return self.user_stats_collection.find_one_and_update(
+            {'_id': user_id},
+            {'$set': build_stats_document(ideas)},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    
+    def save_user_insight(self, user_id, insight):
+        """Store the generated AI insight on the user's stats document, ending its refresh lease"""
+        self.user_stats_collection.update_one(
+            {'_id': user_id},
+            {'$set': {'insight': insight}, '$unset': {'insight_refresh_started_at': ''}}
+        )
+    
+    def claim_insight_refresh(self, user_id, lease_seconds):
+        """
+        Take the lease on regenerating a user's insight; False while another worker holds an
+        unexpired one, so concurrent dashboard views trigger a single regeneration
+        """
+        now = datetime.utcnow()
+        result = self.user_stats_collection.update_one(
+            {
+                '_id': user_id,
+                '$or': [
+                    {'insight_refresh_started_at': None},
+                    {'insight_refresh_started_at': {'$lt': now - timedelta(seconds=lease_seconds)}}
+                ]
+            },
+            {'$set': {'insight_refresh_started_at': now}}
+        )
+        return result.modified_count == 1
+    
+    def save_idea_metrics(self, idea_id, timings=None, token_usage=None):
+        """Attach the stage timing spans and LLM token usage of the refinement that produced an idea"""
+        fields = {}
+        if timings is not None:
+            fields['timings'] = timings
+        if token_usage is not None:
+            fields['token_usage'] = token_usage
+        if fields:
+            self.ideas_collection.update_one({'_id': ObjectId(idea_id)}, {'$set': fields})
+    
+    def save_token_usage_bulk(self, token_usage_by_idea):
+        """Attach token usage to many ideas ({idea_id: token_usage}) with a single bulk write"""
+        if token_usage_by_idea:
+            self.ideas_collection.bulk_write([
+                UpdateOne({'_id': ObjectId(idea_id)}, {'$set': {'token_usage': token_usage}})
+                for idea_id, token_usage in token_usage_by_idea.items()
+            ], ordered=False)
+    
+    def add_user_token_usage(self, user_id, token_usage, refinements=1):
+        """Add LLM token usage to a user's running totals"""
+        self.users_collection.update_one(
+            {'_id': ObjectId(user_id)},
+            {'$inc': {
+                'token_usage.input_tokens': token_usage['input_tokens'],
+                'token_usage.output_tokens': token_usage['output_tokens'],
+                'token_usage.calls': token_usage['calls'],
+                'token_usage.refinements': refinements
+            }}
+        )
+    
+    def save_ideas(self, ideas):
+        """Save many ideas with a single bulk insert, returning their IDs in input order"""
+        now = datetime.utcnow()
+        for idea_data in ideas:
+            if 'user_id' not in idea_data:
+                raise ValueError("user_id is required for idea creation")
+            idea_data['created_at'] = now
+            idea_data['updated_at'] = now
+        
+        unclassified = [idea_data for idea_data in ideas if not idea_data.get('domain')]
+        for idea_data, domain in zip(unclassified, classify_domains([idea_data.get('description', '') for idea_data in unclassified])):
+            idea_data['domain'] = domain
+        
+        if not ideas:
+            return []
+        result = self.ideas_collection.insert_many(ideas)
+        idea_ids = [str(id) for id in result.inserted_ids]
+        
+        ideas_by_user = {}
+        for idea_data, idea_id in zip(ideas, idea_ids):
+            record_idea(idea_data['user_id'], idea_id, idea_data.get('description', ''))
+            ideas_by_user.setdefault(idea_data['user_id'], []).append(idea_data)
+        self._update_user_stats(ideas_by_user)
+        return idea_ids
+    
+    def _debate_docs(self, idea_id, debates):
+        """Build debate documents for an idea's debate log"""
         debate_docs = []
         for debate in debates:
             debate_doc = {
@@ -98,13 +340,31 @@ class MongoDBService:
                 'message': debate['response'],
                 'timestamp': datetime.utcnow()
             }
+            # Condensed notes from the map step of map-reduce aggregation
+            if debate.get('notes'):
+                debate_doc['notes'] = debate['notes']
             debate_docs.append(debate_doc)
+        return debate_docs
+    
+    def save_debates(self, idea_id, debates):
+        """Save debate entries to MongoDB"""
+        debate_docs = self._debate_docs(idea_id, debates)
         
         if debate_docs:
             result = self.debates_collection.insert_many(debate_docs)
             return [str(id) for id in result.inserted_ids]
         return []
     
+    def save_debates_bulk(self, debates_by_idea):
+        """Save the debate logs of many ideas ({idea_id: debate_log}) with a single bulk insert"""
+        debate_docs = []
+        for idea_id, debates in debates_by_idea.items():
+            debate_docs.extend(self._debate_docs(idea_id, debates))
+        
+        if debate_docs:
+            self.debates_collection.insert_many(debate_docs, ordered=False)
+        return len(debate_docs)
+    
     def save_requirements(self, idea_id, requirements_data):
         """Save refined requirements to MongoDB"""
         requirements_data['idea_id'] = idea_id
@@ -112,6 +372,44 @@ class MongoDBService:
         result = self.requirements_collection.insert_one(requirements_data)
         return str(result.inserted_id)
     
+    def save_requirements_bulk(self, requirements):
+        """Save refined requirements for many ideas ([(idea_id, requirements_data)]) with a single bulk insert"""
+        docs = []
+        for idea_id, requirements_data in requirements:
+            requirements_data['idea_id'] = idea_id
+            requirements_data['created_at'] = datetime.utcnow()
+            docs.append(requirements_data)
+        
+        if docs:
+            self.requirements_collection.insert_many(docs, ordered=False)
+        return len(docs)
+    
+    def get_debate_log(self, idea_id):
+        """Get the stored debate for an idea in the same shape MultiAgentSystem produces"""
+        debates = self.debates_collection.find({'idea_id': idea_id}).sort([('round_number', 1), ('timestamp', 1)])
+        debate_log = []
+        for debate in debates:
+            entry = {
+                'agent': debate['agent_name'],
+                'response': debate['message'],
+                'round': debate['round_number']
+            }
+            if debate.get('notes'):
+                entry['notes'] = debate['notes']
+            debate_log.append(entry)
+        return debate_log
+    
+    def get_idea(self, idea_id):
+        """Get a single idea document (None if the ID is unknown or malformed)"""
+        try:
+            return self.ideas_collection.find_one({'_id': ObjectId(idea_id)})
+        except Exception:
+            return None
+    
+    def get_latest_requirement(self, idea_id):
+        """Get the most recent requirements document for an idea"""
+        return self.requirements_collection.find_one({'idea_id': idea_id}, sort=[('created_at', -1)])
+    
     def get_idea_history(self, limit=10):
         """Get recent ideas with their requirements"""
         pipeline = [
@@ -194,13 +492,11 @@ class MongoDBService:
         
         return list(self.ideas_collection.aggregate(pipeline))
     
-    def get_idea_details(self, idea_id):
-        """Get detailed information about a specific idea"""
-        from bson import ObjectId
-        
+    def get_idea_details(self, idea_id, user_id=None):
+        """Get detailed information about a specific idea (None if it is unknown, malformed or not the user's)"""
         # Get idea
-        idea = self.ideas_collection.find_one({'_id': ObjectId(idea_id)})
-        if not idea:
+        idea = self.get_idea(idea_id)
+        if not idea or (user_id is not None and idea.get('user_id') != user_id):
             return None
         
         # Get debates organized by round
@@ -244,6 +540,7 @@ class MongoDBService:
             print(f"🔧 Creating user: {user_data['email']}")
             result = self.users_collection.insert_one(user_doc)
             user_id = str(result.inserted_id)
+            self.user_stats_collection.insert_one(dict(build_stats_document([]), _id=user_id))
             
             # Log initial credit transaction
             self.log_credit_transaction(
@@ -406,10 +703,80 @@ class MongoDBService:
         except:
             return []
     
-    def close(self):
-        """Close MongoDB connection"""
+    # Refinement Job Methods
+    def create_refinement_job(self, job_data):
+        """Create a refinement job record"""
+        job_data['created_at'] = datetime.utcnow()
+        job_data['updated_at'] = datetime.utcnow()
+        result = self.refinement_jobs_collection.insert_one(job_data)
+        return str(result.inserted_id)
+    
+    def claim_refinement_job(self, job_id, lease_seconds):
+        """
+        Atomically move a queued job to running under a lease, returning it (or None if another
+        worker has it). The returned lease_id must be passed to finish_refinement_job.
+        """
+        now = datetime.utcnow()
+        job = self.refinement_jobs_collection.find_one_and_update(
+            {'_id': ObjectId(job_id), 'status': 'queued'},
+            {'$set': {
+                'status': 'running',
+                'started_at': now,
+                'updated_at': now,
+                'lease_id': uuid.uuid4().hex,
+                'lease_expires_at': now + timedelta(seconds=lease_seconds)
+            }},
+            return_document=ReturnDocument.AFTER
+        )
+        if job:
+            job['_id'] = str(job['_id'])
+        return job
+    
+    def finish_refinement_job(self, job_id, lease_id, updates):
+        """Record the outcome of a running job; False if its lease was lost (the job was already failed by recovery)"""
+        updates['updated_at'] = datetime.utcnow()
+        result = self.refinement_jobs_collection.update_one(
+            {'_id': ObjectId(job_id), 'status': 'running', 'lease_id': lease_id},
+            {'$set': updates}
+        )
+        return result.modified_count == 1
+    
+    def fail_stale_refinement_jobs(self, lease_seconds, queued_timeout_seconds, error):
+        """
+        Fail every running job whose lease expired and every job still queued after queued_timeout_seconds,
+        returning the failed jobs. Each job is failed with a conditional update, so concurrent sweeps
+        (and a worker that finishes late) never handle the same job twice.
+        """
+        now = datetime.utcnow()
+        stale = {'$or': [
+            {'status': 'running', 'lease_expires_at': {'$lt': now}},
+            # Claimed before jobs carried a lease
+            {'status': 'running', 'lease_expires_at': {'$exists': False}, 'started_at': {'$lt': now - timedelta(seconds=lease_seconds)}},
+            {'status': 'queued', 'created_at': {'$lt': now - timedelta(seconds=queued_timeout_seconds)}}
+        ]}
+        
+        failed = []
+        for candidate in self.refinement_jobs_collection.find(stale, {'_id': 1}):
+            job = self.refinement_jobs_collection.find_one_and_update(
+                {'_id': candidate['_id'], **stale},
+                {'$set': {'status': 'failed', 'error': error, 'finished_at': now, 'updated_at': now}},
+                return_document=ReturnDocument.AFTER
+            )
+            if job:
+                job['_id'] = str(job['_id'])
+                failed.append(job)
+        return failed
+    
+    def get_refinement_job(self, job_id):
+        """Get a refinement job by ID"""
         try:
-            self.client.close()
-            print("🔌 MongoDB connection closed")
+            job = self.refinement_jobs_collection.find_one({'_id': ObjectId(job_id)})
+            if job:
+                job['_id'] = str(job['_id'])
+            return job
         except:
-            pass
+            return None
+    
+    def close(self):
+        """No-op: the client and its connection pool are shared by the whole process"""
+        pass
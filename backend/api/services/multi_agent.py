@@ -1,95 +1,165 @@
-import os
-import google.generativeai as genai
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.prompts import ChatPromptTemplate
+import logging
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from django.conf import settings
+import hashlib
 import json
+from .llm_cache import get_llm_cache, make_cache_key
+from .circuit_breaker import CircuitOpenError
+from .deadlines import LLMDeadlineExceeded
+from .llm_clients import get_llm, get_llm_circuit_breaker
+from .persona_registry import get_persona_registry
+from .prd_schema import parse_prd, render_prd_text
+from .rate_limiter import estimate_tokens, is_rate_limit_error, record_event
+from .timing import bind_request_timing, span
+from .token_accounting import SENTENCE_BOUNDARY, fit_to_budget, record_llm_usage, token_ledger
+
+
+logger = logging.getLogger(__name__)
 
 
 class MultiAgentSystem:
     """Multi-agent system for requirement refinement using LangChain + Gemini"""
     
-    def __init__(self):
-        # Configure Gemini
-        genai.configure(api_key=settings.GEMINI_API_KEY)
-        self.llm = ChatGoogleGenerativeAI(
-            model="gemini-1.5-flash",
-            google_api_key=settings.GEMINI_API_KEY,
-            temperature=0.7
-        )
-        
-        # Define agent personas
-        self.agents = {
-            'business_manager': {
-                'name': 'Business Manager',
-                'focus': 'profit, scalability, market opportunity, revenue model',
-                'system_prompt': """You are a Business Manager focused on profitability, scalability, and market opportunities. 
-                Consider revenue models, market size, competitive advantages, and business viability. 
-                Be practical about business constraints and opportunities."""
-            },
-            'engineer': {
-                'name': 'Engineer',
-                'focus': 'technical feasibility, implementation complexity, technology stack',
-                'system_prompt': """You are a Senior Engineer focused on technical feasibility and implementation. 
-                Consider technology stack, development complexity, scalability, security, and technical constraints. 
-                Be realistic about what can be built and how long it would take."""
-            },
-            'designer': {
-                'name': 'Designer',
-                'focus': 'usability, aesthetics, user experience, interface design',
-                'system_prompt': """You are a UX/UI Designer focused on user experience and design. 
-                Consider usability, aesthetics, user flows, accessibility, and design principles. 
-                Think about how users will interact with the product."""
-            },
-            'customer': {
-                'name': 'Customer',
-                'focus': 'needs, pain points, user value, real-world usage',
-                'system_prompt': """You are a Customer representing end users. 
-                Focus on real needs, pain points, user value, and how people would actually use this product. 
-                Think about what problems this solves and what would make you want to use it."""
-            },
-            'product_manager': {
-                'name': 'Product Manager',
-                'focus': 'balance trade-offs, prioritize features, product strategy',
-                'system_prompt': """You are a Product Manager focused on balancing trade-offs and product strategy. 
-                Consider feature prioritization, user needs vs business needs, and how to create a successful product. 
-                Think about the overall product vision and roadmap."""
-            }
-        }
+    MODEL_NAME = "gemini-1.5-flash"
+    TEMPERATURE = 0.7
     
-    def get_agent_response(self, agent_key, idea, context=""):
-        """Get response from a specific agent"""
-        agent = self.agents[agent_key]
+    def __init__(self, max_parallelism=None):
+        # Maximum number of agent calls in flight at once (1 = sequential)
+        self.max_parallelism = max_parallelism or settings.AGENT_MAX_PARALLELISM
         
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", agent['system_prompt']),
-            ("human", f"""Product Idea: {idea}
-            
-            Context from previous discussion: {context}
-            
-            As a {agent['name']}, provide your perspective on this product idea. Focus on {agent['focus']}.
-            
-            Provide a concise but thoughtful response (2-3 paragraphs) that includes:
-            1. Your initial thoughts on the idea
-            2. Key considerations from your perspective
-            3. Potential challenges or opportunities
-            4. Suggestions for improvement
-            
-            Be specific and actionable in your feedback.""")
-        ])
+        # Shared response cache (None when LLM_CACHE_ENABLED is off)
+        self.cache = get_llm_cache()
+    
+    @property
+    def agents(self):
+        """Agent personas of the current registry snapshot, in debate order (for listing; not used mid-refinement)"""
+        return self._personas().agents
+    
+    def _personas(self):
+        """
+        The persona registry snapshot a refinement runs on. Each refinement takes one and passes it
+        through every step, so a registry reload mid-refinement cannot change its agents, templates
+        or the prompt version in its cache keys.
+        """
+        return get_persona_registry().snapshot()
+    
+    @property
+    def llm(self):
+        """Shared, process-wide Gemini client (looked up per call so it stays valid across forks)"""
+        return get_llm(self.MODEL_NAME, self.TEMPERATURE)
+    
+    def _fit_idea(self, idea):
+        """The idea as embedded in prompts, shortened to PROMPT_BUDGET_IDEA_TOKENS"""
+        return fit_to_budget(idea, settings.PROMPT_BUDGET_IDEA_TOKENS)
+    
+    def _build_agent_messages(self, personas, agent_key, idea, context=""):
+        """Build the chat messages sent to a specific agent from its precompiled template"""
+        template = personas.agent_templates[agent_key]
+        return template.format_messages(idea=self._fit_idea(idea), context=context)
+    
+    def _invoke(self, stage, messages, timeout=None):
+        """
+        Call the LLM as one timed, token-accounted pipeline stage. The provider request is bounded
+        by timeout seconds (LLM_CALL_TIMEOUT_SECONDS by default; waiting for rate limit quota does
+        not count) and hedged once it outlives the stage's p95
+        """
+        with span(stage):
+            response = self.llm.invoke(
+                messages,
+                deadline_seconds=timeout or settings.LLM_CALL_TIMEOUT_SECONDS,
+                deadline_key=stage
+            )
+        record_llm_usage(stage, messages, response)
+        return response
+    
+    def _stream(self, stage, messages):
+        """Stream an LLM call as one timed, token-accounted pipeline stage, yielding text chunks"""
+        chunks = []
+        try:
+            with span(stage):
+                for chunk in self.llm.stream(messages):
+                    if chunk.content:
+                        chunks.append(chunk.content)
+                        yield chunk.content
+        finally:
+            # Interrupted streams still consumed their prompt
+            record_llm_usage(stage, messages, ''.join(chunks))
+    
+    def _handle_agent_error(self, personas, agent_key, idea, error):
+        """Turn an agent call failure into the text shown in the debate"""
+        if is_rate_limit_error(error) or isinstance(error, CircuitOpenError):
+            # Retries are exhausted (or the service is failing fast); return a fallback response instead of error message
+            record_event('agent_fallbacks')
+            record_event(f'agent_fallbacks.{agent_key}')
+            return self._get_fallback_response(personas, agent_key, idea)
+        else:
+            record_event('agent_errors')
+            return f"Error getting response from {personas.agents[agent_key]['name']}: {str(error)}"
+    
+    def _agent_cache_key(self, personas, agent_key, idea, context=""):
+        """Cache key for a single agent call"""
+        return make_cache_key('agent', idea, agent_key, personas.version, self.MODEL_NAME, self.TEMPERATURE, context)
+    
+    def _aggregation_cache_key(self, personas, idea, debate_log):
+        """Cache key for the aggregation call, tied to the exact debate it summarizes"""
+        debate_digest = hashlib.sha256(json.dumps([
+            [resp['agent'], resp['round'], resp['response']] + ([resp['notes']] if resp.get('notes') else [])
+            for resp in debate_log
+        ]).encode('utf-8')).hexdigest()
+        return make_cache_key('aggregation', idea, None, personas.version, self.MODEL_NAME, self.TEMPERATURE, debate_digest)
+    
+    def _cache_get(self, key):
+        return self.cache.get(key) if self.cache else None
+    
+    def _cache_set(self, key, value, metadata=None):
+        if self.cache and value:
+            self.cache.set(key, value, metadata)
+    
+    def get_agent_response(self, personas, agent_key, idea, context=""):
+        """Get response from a specific agent (None if the call ran past its deadline)"""
+        cache_key = self._agent_cache_key(personas, agent_key, idea, context)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
         
         try:
-            response = self.llm.invoke(prompt.format_messages())
+            response = self._invoke(f'agent.{agent_key}', self._build_agent_messages(personas, agent_key, idea, context))
+            self._cache_set(cache_key, response.content, {'kind': 'agent', 'agent_key': agent_key})
             return response.content
+        except LLMDeadlineExceeded:
+            # No response; the debate continues without this agent and is marked partial
+            record_event('agent_timeouts')
+            return None
+        except Exception as e:
+            # Fallback and error text is never cached so retries reach the LLM again
+            return self._handle_agent_error(personas, agent_key, idea, e)
+    
+    def stream_agent_response(self, personas, agent_key, idea, context=""):
+        """Yield response chunks from a specific agent as the LLM produces them"""
+        cache_key = self._agent_cache_key(personas, agent_key, idea, context)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+        
+        chunks = []
+        try:
+            for chunk in self._stream(f'agent.{agent_key}', self._build_agent_messages(personas, agent_key, idea, context)):
+                chunks.append(chunk)
+                yield chunk
         except Exception as e:
-            error_msg = str(e)
-            if "quota" in error_msg.lower() or "rate limit" in error_msg.lower() or "429" in error_msg:
-                # Return a fallback response instead of error message
-                return self._get_fallback_response(agent_key, idea)
-            else:
-                return f"Error getting response from {agent['name']}: {error_msg}"
-    
-    def _get_fallback_response(self, agent_key, idea):
+            # Partial output cannot be retracted, so only fall back when nothing was sent
+            if not chunks:
+                yield self._handle_agent_error(personas, agent_key, idea, e)
+            return
+        
+        self._cache_set(cache_key, ''.join(chunks), {'kind': 'agent', 'agent_key': agent_key})
+    
+    def _get_fallback_response(self, personas, agent_key, idea):
         """Provide fallback responses when rate limit is hit"""
         fallback_responses = {
             'business_manager': f"""As a Business Manager, I see potential in this idea: {idea[:100]}... 
@@ -133,84 +203,639 @@ Challenges: Balancing competing priorities and creating a successful product roa
 Suggestions: Define clear success metrics, prioritize features based on user value, and iterate based on feedback."""
         }
         
-        return fallback_responses.get(agent_key, f"Analysis from {self.agents[agent_key]['name']}: {idea[:100]}...")
+        return fallback_responses.get(agent_key, f"Analysis from {personas.agents[agent_key]['name']}: {idea[:100]}...")
     
-    def run_debate(self, idea, rounds=1):
-        """Run multi-agent debate for the given idea - optimized for rate limits"""
-        debate_log = []
+    @property
+    def map_reduce(self):
+        """Whether aggregation condenses each agent response first (AGGREGATION_MODE=map_reduce)"""
+        return settings.AGGREGATION_MODE == 'map_reduce'
+    
+    def condense_agent_response(self, personas, agent_name, idea, response):
+        """Map step: reduce one agent's response to the notes the final synthesis needs"""
+        template = personas.condensation_template
+        if template is None:
+            return self._condense_response(response, settings.DEBATE_SUMMARY_CHARS_PER_AGENT)
         
-        # Single round with all agents to reduce API calls
-        round_responses = []
+        response_digest = hashlib.sha256(response.encode('utf-8')).hexdigest()
+        cache_key = make_cache_key('condensation', idea, agent_name, personas.version, self.MODEL_NAME, self.TEMPERATURE, response_digest)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
         
-        for agent_key in self.agents.keys():
-            response = self.get_agent_response(agent_key, idea, "")
-            round_responses.append({
-                'agent': self.agents[agent_key]['name'],
-                'response': response,
-                'round': 1
-            })
+        try:
+            notes = self._invoke(
+                'condensation',
+                template.format_messages(idea=self._fit_idea(idea), agent=agent_name, response=response)
+            ).content
+            self._cache_set(cache_key, notes, {'kind': 'condensation'})
+            return notes
+        except Exception:
+            # The reduce step still works on an extractive summary
+            record_event('condensation_errors')
+            return self._condense_response(response, settings.DEBATE_SUMMARY_CHARS_PER_AGENT)
+    
+    def _with_condensed_notes(self, personas, idea, debate_log):
+        """
+        Condense any final-round responses that were not mapped while the debate ran
+        (e.g. a debate cut short by its token budget, or one loaded from storage)
+        """
+        final_round = max((resp['round'] for resp in debate_log), default=1)
+        missing = [
+            index for index, resp in enumerate(debate_log)
+            if resp['round'] == final_round and not resp.get('notes')
+        ]
+        if not missing:
+            return debate_log
         
-        # Add responses to debate log
-        debate_log.extend(round_responses)
+        debate_log = [dict(resp) for resp in debate_log]
+        condense = bind_request_timing(
+            lambda index: self.condense_agent_response(personas, debate_log[index]['agent'], idea, debate_log[index]['response'])
+        )
+        workers = max(1, min(self.max_parallelism, len(missing)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='condense') as executor:
+            for index, notes in zip(missing, executor.map(condense, missing)):
+                debate_log[index]['notes'] = notes
+        return debate_log
+    
+    def _check_available(self):
+        """Fail a refinement up front, instead of debating on fallbacks, while the LLM circuit is open"""
+        breaker = get_llm_circuit_breaker()
+        if breaker is not None and breaker.is_open():
+            raise CircuitOpenError(breaker.name, breaker.retry_after())
+    
+    def _refinement_deadline(self):
+        """time.monotonic() value after which the debate stops waiting for agents (None if disabled)"""
+        if not settings.REFINE_DEADLINE_SECONDS:
+            return None
+        return time.monotonic() + settings.REFINE_DEADLINE_SECONDS
+    
+    def _resolve_rounds(self, rounds):
+        """Clamp the requested number of debate rounds to the configured limits"""
+        if rounds is None:
+            rounds = settings.DEBATE_DEFAULT_ROUNDS
+        return max(1, min(int(rounds), settings.DEBATE_MAX_ROUNDS))
+    
+    def _condense_response(self, text, max_chars):
+        """Extractive compression: keep leading whole sentences up to max_chars"""
+        text = re.sub(r'\s+', ' ', text or '').strip()
+        condensed = ''
+        for sentence in SENTENCE_BOUNDARY.split(text):
+            if len(condensed) + len(sentence) + 1 > max_chars:
+                break
+            condensed = f"{condensed} {sentence}".strip()
+        return condensed or text[:max_chars]
+    
+    def _summarize_rounds(self, round_responses, summary_lines=None):
+        """
+        Extend the rolling debate summary with a round's responses. Oldest points are dropped
+        once the summary exceeds DEBATE_SUMMARY_MAX_TOKENS, so context size stays flat as rounds grow.
+        """
+        lines = list(summary_lines or []) + [
+            f"Round {resp['round']} - {resp['agent']}: "
+            f"{self._condense_response(resp['response'], settings.DEBATE_SUMMARY_CHARS_PER_AGENT)}"
+            for resp in round_responses
+        ]
+        while len(lines) > len(round_responses) and estimate_tokens('\n'.join(lines)) > settings.DEBATE_SUMMARY_MAX_TOKENS:
+            lines.pop(0)
+        return lines
+    
+    def _round_context(self, round_number, summary_lines):
+        """Context passed to agents in a given round"""
+        if not summary_lines:
+            return ""
+        return (
+            f"This is debate round {round_number}. Summary of the discussion so far:\n"
+            + "\n".join(summary_lines)
+            + "\nRespond to the other stakeholders' points: say where you agree, where you disagree "
+            "and how your recommendation has changed."
+        )
+    
+    def _round_cost(self, personas, agent_keys, idea, context, responses):
+        """Estimated tokens (prompt + response) spent by one debate round"""
+        return sum(
+            estimate_tokens(self._build_agent_messages(personas, agent_key, idea, context)) + estimate_tokens(response)
+            for agent_key, response in zip(agent_keys, responses)
+        )
+    
+    def run_debate(self, personas, idea, rounds=None, deadline=None, missing=None):
+        """
+        Run a multi-round debate for the given idea - agents within a round are queried concurrently.
+        Later rounds see a rolling summary of earlier rounds rather than the full transcript, and
+        no new round starts if it would push the debate past DEBATE_TOKEN_BUDGET.
+        
+        deadline is a time.monotonic() value: responses still outstanding when it passes are left
+        out, no further round starts, and their (agent, round) pairs are appended to `missing`.
+        """
+        rounds = self._resolve_rounds(rounds)
+        debate_log = []
+        agent_keys = list(personas.agents.keys())
+        summary_lines = []
+        tokens_used = 0
+        last_round_cost = 0
+        
+        for round_number in range(1, rounds + 1):
+            if round_number > 1 and tokens_used + last_round_cost > settings.DEBATE_TOKEN_BUDGET:
+                logger.warning("Debate stopped after round %d: token budget of %d reached", round_number - 1, settings.DEBATE_TOKEN_BUDGET)
+                break
+            if round_number > 1 and deadline is not None and time.monotonic() >= deadline:
+                logger.warning("Debate stopped after round %d: refinement deadline reached", round_number - 1)
+                break
+            
+            context = self._round_context(round_number, summary_lines)
+            # In map-reduce mode the final round's responses are condensed as each agent finishes
+            notes = {} if self.map_reduce and round_number == rounds else None
+            responses = self._run_agents(personas, agent_keys, idea, context, notes=notes, deadline=deadline)
+            
+            # Keep debate log in persona order regardless of completion order
+            round_responses = []
+            for agent_key, response in zip(agent_keys, responses):
+                if response is None:
+                    if missing is not None:
+                        missing.append({'agent': personas.agents[agent_key]['name'], 'round': round_number})
+                    continue
+                resp = {
+                    'agent': personas.agents[agent_key]['name'],
+                    'response': response,
+                    'round': round_number
+                }
+                if notes and notes.get(agent_key):
+                    resp['notes'] = notes[agent_key]
+                round_responses.append(resp)
+            debate_log.extend(round_responses)
+            
+            answered = [(agent_key, response) for agent_key, response in zip(agent_keys, responses) if response is not None]
+            last_round_cost = self._round_cost(
+                personas, [agent_key for agent_key, _ in answered], idea, context, [response for _, response in answered]
+            )
+            tokens_used += last_round_cost
+            if round_number < rounds:
+                summary_lines = self._summarize_rounds(round_responses, summary_lines)
         
         return debate_log
     
-    def aggregate_results(self, idea, debate_log):
-        """Aggregate debate results into refined requirements"""
-        # Create summary of all responses
+    def _run_agents(self, personas, agent_keys, idea, context, notes=None, deadline=None):
+        """
+        Fan agent calls out over a bounded thread pool, returning responses in input order.
+        context is shared by all agents, or a {agent_key: context} dict to give each its own.
+        When a notes dict is given, each response is also condensed (map step) on the same worker
+        right after it arrives, and the result stored under its agent key. Agents that time out,
+        or have not answered when the deadline passes, get None.
+        """
+        def run_agent(agent_key):
+            agent_context = context[agent_key] if isinstance(context, dict) else context
+            response = self.get_agent_response(personas, agent_key, idea, agent_context)
+            if notes is not None and response is not None:
+                notes[agent_key] = self.condense_agent_response(personas, personas.agents[agent_key]['name'], idea, response)
+            return response
+        
+        workers = max(1, min(self.max_parallelism, len(agent_keys)))
+        
+        if workers == 1:
+            return [
+                None if deadline is not None and time.monotonic() >= deadline else run_agent(agent_key)
+                for agent_key in agent_keys
+            ]
+        
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='agent')
+        try:
+            futures = [executor.submit(bind_request_timing(run_agent), agent_key) for agent_key in agent_keys]
+            wait(futures, timeout=None if deadline is None else max(0, deadline - time.monotonic()))
+            
+            late = sum(1 for future in futures if not future.done())
+            if late:
+                record_event('agent_deadline_misses', late)
+            return [future.result() if future.done() else None for future in futures]
+        finally:
+            # Don't block on late agents; they finish in the background and are discarded
+            executor.shutdown(wait=False)
+    
+    def _build_aggregation_messages(self, personas, idea, debate_log):
+        """Build the chat messages for the aggregation step"""
+        # Final round in full; earlier rounds only as a rolling summary to keep the prompt bounded
+        final_round = max((resp['round'] for resp in debate_log), default=1)
+        final_responses = [resp for resp in debate_log if resp['round'] == final_round]
+        
+        # Each stakeholder gets an equal share of the aggregation input budget
+        share = settings.PROMPT_BUDGET_AGGREGATION_TOKENS // max(1, len(final_responses))
         all_responses = "\n\n".join([
-            f"{resp['agent']} (Round {resp['round']}): {resp['response']}"
-            for resp in debate_log
+            f"{resp['agent']} (Round {resp['round']}, condensed notes):\n{fit_to_budget(resp['notes'], share)}"
+            if resp.get('notes') else
+            f"{resp['agent']} (Round {resp['round']}): {fit_to_budget(resp['response'], share)}"
+            for resp in final_responses
         ])
         
-        aggregation_prompt = ChatPromptTemplate.from_messages([
-            ("system", """You are an expert product strategist who can synthesize multiple stakeholder perspectives into clear, actionable requirements."""),
-            ("human", f"""Product Idea: {idea}
-
-            Stakeholder Debate Summary:
-            {all_responses}
-
-            Based on this multi-stakeholder debate, create a comprehensive requirements document with three sections:
-
-            1. REFINED REQUIREMENTS:
-            - List 5-8 key requirements that address the main concerns and opportunities identified
-            - Be specific and actionable
-            - Prioritize by importance
-
-            2. TRADE-OFFS:
-            - Identify 3-5 key trade-offs that need to be considered
-            - Explain the implications of each choice
-            - Suggest how to balance competing priorities
-
-            3. NEXT STEPS:
-            - Provide 3-5 concrete next steps to move forward
-            - Include timeline suggestions
-            - Identify key decisions that need to be made
-
-            Format your response clearly with these three sections.""")
-        ])
+        earlier_responses = [resp for resp in debate_log if resp['round'] < final_round]
+        if earlier_responses:
+            all_responses = (
+                "Earlier rounds (summarized):\n"
+                + "\n".join(self._summarize_rounds(earlier_responses))
+                + "\n\nFinal round:\n\n"
+                + all_responses
+            )
+        
+        template = personas.aggregation_template
+        return template.format_messages(idea=self._fit_idea(idea), all_responses=all_responses)
+    
+    def aggregate_results(self, personas, idea, debate_log):
+        """Aggregate debate results into refined requirements"""
+        if self.map_reduce:
+            debate_log = self._with_condensed_notes(personas, idea, debate_log)
+        
+        cache_key = self._aggregation_cache_key(personas, idea, debate_log)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
         
         try:
-            response = self.llm.invoke(aggregation_prompt.format_messages())
+            response = self._invoke(
+                'aggregation',
+                self._build_aggregation_messages(personas, idea, debate_log),
+                timeout=settings.AGGREGATION_TIMEOUT_SECONDS
+            )
+            self._cache_set(cache_key, response.content, {'kind': 'aggregation'})
             return response.content
         except Exception as e:
+            record_event('aggregation_errors')
             return f"Error aggregating results: {str(e)}"
     
-    def refine_requirements(self, idea):
-        """Main function to refine requirements using multi-agent debate"""
+    def _structure_prd(self, text):
+        """
+        Validate the aggregation reply against the PRD schema, returning (text, structured).
+        Any JSON reply is rendered, from whatever items validate, to the sectioned text clients
+        display; a reply without a JSON object is passed through unchanged with structured=None.
+        """
+        prd = parse_prd(text)
+        if prd is None:
+            record_event('prd_unstructured')
+            return text, None
+        return render_prd_text(prd), prd
+    
+    def stream_aggregate_results(self, personas, idea, debate_log):
+        """Yield aggregated requirements chunks as the LLM produces them"""
+        if self.map_reduce:
+            debate_log = self._with_condensed_notes(personas, idea, debate_log)
+        
+        cache_key = self._aggregation_cache_key(personas, idea, debate_log)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+        
+        chunks = []
         try:
-            # Run the debate
-            debate_log = self.run_debate(idea, rounds=4)
+            for chunk in self._stream('aggregation', self._build_aggregation_messages(personas, idea, debate_log)):
+                chunks.append(chunk)
+                yield chunk
+        except Exception as e:
+            record_event('aggregation_errors')
+            if not chunks:
+                yield f"Error aggregating results: {str(e)}"
+            return
+        
+        self._cache_set(cache_key, ''.join(chunks), {'kind': 'aggregation'})
+    
+    def _stream_round(self, personas, agent_keys, idea, context, round_number, responses, notes=None, deadline=None):
+        """
+        Stream one debate round, yielding events and filling `responses` with the full agent texts.
+        When a notes dict is given, each agent's response is condensed right after it completes.
+        Like _invoke, each agent stream is abandoned once it has run for LLM_CALL_TIMEOUT_SECONDS;
+        agents still streaming then, or when the deadline passes, get an agent_timeout event and no response.
+        """
+        events = queue.Queue()
+        timed_out = set()
+        
+        def run_agent(agent_key):
+            events.put(('started', agent_key, time.monotonic()))
+            agent_chunks = []
+            try:
+                for token in self.stream_agent_response(personas, agent_key, idea, context):
+                    if agent_key in timed_out:
+                        # Closes the provider stream; its usage is still recorded
+                        break
+                    agent_chunks.append(token)
+                    events.put(('token', agent_key, token))
+            finally:
+                events.put(('done', agent_key, None))
             
-            # Aggregate results
-            refined_requirements = self.aggregate_results(idea, debate_log)
+            if notes is not None and agent_key not in timed_out:
+                condensed = None
+                try:
+                    condensed = self.condense_agent_response(personas, personas.agents[agent_key]['name'], idea, ''.join(agent_chunks))
+                finally:
+                    events.put(('notes', agent_key, condensed))
+        
+        chunks = {agent_key: [] for agent_key in agent_keys}
+        # time.monotonic() after which each started, still streaming agent is abandoned
+        call_deadlines = {}
+        workers = max(1, min(self.max_parallelism, len(agent_keys)))
+        
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='agent-stream')
+        try:
+            run_agent = bind_request_timing(run_agent)
+            for agent_key in agent_keys:
+                executor.submit(run_agent, agent_key)
+            
+            remaining = len(agent_keys)
+            while remaining:
+                next_deadline = min(list(call_deadlines.values()) + ([deadline] if deadline is not None else []), default=None)
+                try:
+                    kind, agent_key, token = events.get(
+                        timeout=None if next_deadline is None else max(0, next_deadline - time.monotonic())
+                    )
+                except queue.Empty:
+                    if deadline is not None and time.monotonic() >= deadline:
+                        break
+                    now = time.monotonic()
+                    for expired in [key for key, call_deadline in call_deadlines.items() if call_deadline <= now]:
+                        del call_deadlines[expired]
+                        timed_out.add(expired)
+                        record_event('agent_timeouts')
+                        remaining -= 1
+                    continue
+                if agent_key in timed_out:
+                    continue
+                agent_name = personas.agents[agent_key]['name']
+                if kind == 'started':
+                    call_deadlines[agent_key] = token + settings.LLM_CALL_TIMEOUT_SECONDS
+                elif kind == 'token':
+                    chunks[agent_key].append(token)
+                    yield 'agent_token', {
+                        'agent_key': agent_key,
+                        'agent': agent_name,
+                        'round': round_number,
+                        'token': token
+                    }
+                elif kind == 'done':
+                    call_deadlines.pop(agent_key, None)
+                    responses[agent_key] = ''.join(chunks[agent_key])
+                    if notes is None:
+                        remaining -= 1
+                    yield 'agent_done', {
+                        'agent_key': agent_key,
+                        'agent': agent_name,
+                        'round': round_number,
+                        'response': responses[agent_key]
+                    }
+                else:
+                    remaining -= 1
+                    if token:
+                        notes[agent_key] = token
+                        yield 'agent_notes', {
+                            'agent_key': agent_key,
+                            'agent': agent_name,
+                            'round': round_number,
+                            'notes': token
+                        }
+        finally:
+            # Don't block on late agents; they finish in the background and are discarded
+            executor.shutdown(wait=False)
+        
+        for agent_key in agent_keys:
+            if agent_key not in responses:
+                if agent_key not in timed_out:
+                    record_event('agent_deadline_misses')
+                yield 'agent_timeout', {
+                    'agent_key': agent_key,
+                    'agent': personas.agents[agent_key]['name'],
+                    'round': round_number
+                }
+    
+    def stream_refinement(self, idea, rounds=None):
+        """
+        Run the debate and aggregation, yielding (event, data) tuples as work progresses.
+        Agents stream concurrently; their chunks are interleaved in arrival order.
+        
+        prd_token events carry the raw aggregation output, which is the JSON PRD object rather
+        than display text; once it is complete a single prd event delivers the rendered,
+        sectioned text and the structured items.
+        """
+        self._check_available()
+        with token_ledger() as ledger:
+            yield from self._stream_refinement(self._personas(), idea, rounds, ledger)
+    
+    def _stream_refinement(self, personas, idea, rounds, ledger):
+        """Body of stream_refinement, run inside its token ledger"""
+        rounds = self._resolve_rounds(rounds)
+        agent_keys = list(personas.agents.keys())
+        debate_log = []
+        missing = []
+        deadline = self._refinement_deadline()
+        summary_lines = []
+        tokens_used = 0
+        last_round_cost = 0
+        
+        yield 'stage', {'stage': 'debate', 'status': 'started', 'agents': len(agent_keys), 'rounds': rounds}
+        
+        for round_number in range(1, rounds + 1):
+            if round_number > 1 and tokens_used + last_round_cost > settings.DEBATE_TOKEN_BUDGET:
+                yield 'stage', {'stage': 'debate', 'status': 'budget_exhausted', 'round': round_number - 1}
+                break
+            
+            if round_number > 1 and deadline is not None and time.monotonic() >= deadline:
+                yield 'stage', {'stage': 'debate', 'status': 'deadline_reached', 'round': round_number - 1}
+                break
+            
+            context = self._round_context(round_number, summary_lines)
+            responses = {}
+            notes = {} if self.map_reduce and round_number == rounds else None
+            yield 'stage', {'stage': 'round', 'status': 'started', 'round': round_number}
+            yield from self._stream_round(personas, agent_keys, idea, context, round_number, responses, notes=notes, deadline=deadline)
+            
+            # Keep debate log in persona order regardless of completion order
+            answered = [agent_key for agent_key in agent_keys if agent_key in responses]
+            missing.extend(
+                {'agent': personas.agents[agent_key]['name'], 'round': round_number}
+                for agent_key in agent_keys if agent_key not in responses
+            )
+            round_responses = [
+                {
+                    'agent': personas.agents[agent_key]['name'],
+                    'response': responses[agent_key],
+                    'round': round_number
+                }
+                for agent_key in answered
+            ]
+            for agent_key, resp in zip(answered, round_responses):
+                if notes and notes.get(agent_key):
+                    resp['notes'] = notes[agent_key]
+            debate_log.extend(round_responses)
+            
+            last_round_cost = self._round_cost(personas, answered, idea, context, [responses[key] for key in answered])
+            tokens_used += last_round_cost
+            if round_number < rounds:
+                summary_lines = self._summarize_rounds(round_responses, summary_lines)
+        
+        if not debate_log:
+            raise LLMDeadlineExceeded('No agent responded before the refinement deadline')
+        
+        yield 'stage', {'stage': 'debate', 'status': 'completed', 'partial': bool(missing)}
+        yield 'stage', {'stage': 'aggregation', 'status': 'started'}
+        
+        refined_chunks = []
+        for token in self.stream_aggregate_results(personas, idea, debate_log):
+            refined_chunks.append(token)
+            yield 'prd_token', {'token': token}
+        
+        refined_requirements, structured = self._structure_prd(''.join(refined_chunks))
+        yield 'prd', {'refined_requirements': refined_requirements, 'structured_requirements': structured}
+        
+        yield 'stage', {'stage': 'aggregation', 'status': 'completed'}
+        yield 'result', {
+            'debate_log': debate_log,
+            'refined_requirements': refined_requirements,
+            'structured_requirements': structured,
+            'token_usage': ledger.to_dict(),
+            'partial': bool(missing),
+            'missing_agents': missing
+        }
+    
+    def select_feedback_agents(self, feedback, personas=None):
+        """
+        Agent keys whose name or keywords the feedback mentions, in debate order. Feedback that
+        names no persona goes to the registry's default feedback agents.
+        """
+        personas = personas or self._personas()
+        selected = [
+            agent_key for agent_key in personas.agents
+            if personas.feedback_patterns[agent_key].search(feedback)
+        ]
+        return selected or list(personas.feedback_default_agents)
+    
+    def _latest_responses(self, debate_log):
+        """The most recent response of every agent in a (possibly multi-iteration) debate log"""
+        latest = {}
+        for resp in sorted(debate_log, key=lambda resp: resp['round']):
+            latest[resp['agent']] = resp
+        return latest
+    
+    def _feedback_context(self, personas, agent_name, latest, feedback):
+        """Context for re-running one agent: its previous answer, the others' current views and the feedback"""
+        share = settings.PROMPT_BUDGET_AGGREGATION_TOKENS // max(1, len(latest))
+        previous = latest.get(agent_name)
+        other_views = "\n".join(self._summarize_rounds(
+            [resp for name, resp in latest.items() if name != agent_name]
+        ))
+        template = personas.feedback_context_template
+        return template.format(
+            previous_response=fit_to_budget(previous['response'], share) if previous else "(none)",
+            other_views=other_views or "(none)",
+            feedback=feedback
+        )
+    
+    def refine_with_feedback(self, idea, debate_log, feedback, agent_keys=None):
+        """
+        Iterate on a stored debate with user feedback. Only the affected agents (agent_keys, or those
+        select_feedback_agents picks) are asked again, with their previous response, the other agents'
+        current views and the feedback as context; every other agent keeps its last response, so an
+        iteration costs a few agent calls plus one aggregation instead of a full debate.
+        
+        The new responses form the next round of the debate log; aggregation sees the latest response
+        of every agent as the final round and everything before as summarized history.
+        """
+        try:
+            self._check_available()
+            personas = self._personas()
+            agent_keys = [
+                agent_key for agent_key in (agent_keys or self.select_feedback_agents(feedback, personas))
+                if agent_key in personas.agents
+            ]
+            if not agent_keys:
+                raise ValueError('None of the requested agents exist')
+            
+            latest = self._latest_responses(debate_log)
+            iteration_round = max((resp['round'] for resp in debate_log), default=0) + 1
+            contexts = {
+                agent_key: self._feedback_context(personas, personas.agents[agent_key]['name'], latest, feedback)
+                for agent_key in agent_keys
+            }
+            
+            missing = []
+            with token_ledger() as ledger:
+                notes = {} if self.map_reduce else None
+                responses = self._run_agents(personas, agent_keys, idea, contexts, notes=notes, deadline=self._refinement_deadline())
+                
+                new_responses = []
+                for agent_key, response in zip(agent_keys, responses):
+                    agent_name = personas.agents[agent_key]['name']
+                    if response is None:
+                        missing.append({'agent': agent_name, 'round': iteration_round})
+                        continue
+                    resp = {'agent': agent_name, 'response': response, 'round': iteration_round}
+                    if notes and notes.get(agent_key):
+                        resp['notes'] = notes[agent_key]
+                    new_responses.append(resp)
+                    latest[agent_name] = resp
+                if not new_responses:
+                    raise LLMDeadlineExceeded('No agent responded before the refinement deadline')
+                
+                # Unchanged agents carry their last response into the final round
+                current = [dict(resp, round=iteration_round) for resp in latest.values()]
+                superseded = [resp for resp in debate_log if all(resp is not kept for kept in latest.values())]
+                refined_requirements, structured = self._structure_prd(
+                    self.aggregate_results(personas, idea, superseded + current)
+                )
+            
+            return {
+                'success': True,
+                'debate_log': new_responses,
+                'rerun_agents': [personas.agents[agent_key]['name'] for agent_key in agent_keys],
+                'round': iteration_round,
+                'refined_requirements': refined_requirements,
+                'structured_requirements': structured,
+                'token_usage': ledger.to_dict(),
+                'partial': bool(missing),
+                'missing_agents': missing
+            }
+            
+        except CircuitOpenError as e:
+            return {
+                'success': False,
+                'error': str(e),
+                'retry_after': e.retry_after,
+                'debate_log': [],
+                'refined_requirements': ""
+            }
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e),
+                'debate_log': [],
+                'refined_requirements': ""
+            }
+    
+    def refine_requirements(self, idea, rounds=None):
+        """Main function to refine requirements using multi-agent debate"""
+        try:
+            self._check_available()
+            personas = self._personas()
+            missing = []
+            with token_ledger() as ledger:
+                # Run the debate; agents that miss the deadline are left out
+                debate_log = self.run_debate(personas, idea, rounds=rounds, deadline=self._refinement_deadline(), missing=missing)
+                if not debate_log:
+                    raise LLMDeadlineExceeded('No agent responded before the refinement deadline')
+                
+                # Aggregate results
+                refined_requirements, structured = self._structure_prd(self.aggregate_results(personas, idea, debate_log))
             
             return {
                 'success': True,
                 'debate_log': debate_log,
-                'refined_requirements': refined_requirements
+                'refined_requirements': refined_requirements,
+                'structured_requirements': structured,
+                'token_usage': ledger.to_dict(),
+                'partial': bool(missing),
+                'missing_agents': missing
             }
             
+        except CircuitOpenError as e:
+            return {
+                'success': False,
+                'error': str(e),
+                'retry_after': e.retry_after,
+                'debate_log': [],
+                'refined_requirements': ""
+            }
         except Exception as e:
             return {
                 'success': False,
@@ -218,3 +843,18 @@ Suggestions: Define clear success metrics, prioritize features based on user val
                 'debate_log': [],
                 'refined_requirements': ""
             }
+
+
+
+_system = None
+_system_lock = threading.Lock()
+
+
+def get_multi_agent_system():
+    """Return the process-wide MultiAgentSystem, creating it on first use"""
+    global _system
+
+    with _system_lock:
+        if _system is None:
+            _system = MultiAgentSystem()
+        return _system
@@ -0,0 +1,129 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import yaml
+from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class PersonaRegistrySnapshot:
+    """Immutable view of one loaded registry version with its compiled prompt templates"""
+
+    def __init__(self, data, digest):
+        self.version = f"v{data['version']}-{digest[:12]}"
+
+        # Persona order in the file is the debate order
+        self.agents = {
+            agent_key: {
+                'name': agent['name'],
+                'focus': agent['focus'],
+                'system_prompt': agent['system_prompt'],
+                'keywords': list(agent.get('keywords') or [])
+            }
+            for agent_key, agent in data['agents'].items()
+        }
+
+        # Compile once; name and focus are bound now, idea and context are filled per call
+        self.agent_templates = {
+            agent_key: ChatPromptTemplate.from_messages([
+                ("system", agent['system_prompt']),
+                ("human", data['agent_template'])
+            ]).partial(name=agent['name'], focus=agent['focus'])
+            for agent_key, agent in self.agents.items()
+        }
+
+        self.aggregation_template = ChatPromptTemplate.from_messages([
+            ("system", data['aggregation']['system_prompt']),
+            ("human", data['aggregation']['template'])
+        ])
+
+        # Optional map step of the map-reduce aggregation; without it responses are condensed extractively
+        self.condensation_template = ChatPromptTemplate.from_messages([
+            ("system", data['condensation']['system_prompt']),
+            ("human", data['condensation']['template'])
+        ]) if data.get('condensation') else None
+
+        # Feedback routing: an agent is affected when its key, name or one of its keywords is mentioned
+        feedback = data.get('feedback') or {}
+        self.feedback_patterns = {
+            agent_key: re.compile(
+                r'\b(?:' + '|'.join(
+                    re.escape(term).replace(r'\ ', r'[\s_-]+')
+                    for term in sorted({agent_key.replace('_', ' '), agent['name'], *agent['keywords']}, key=len, reverse=True)
+                ) + r')\b',
+                re.IGNORECASE
+            )
+            for agent_key, agent in self.agents.items()
+        }
+        self.feedback_default_agents = [
+            agent_key for agent_key in feedback.get('default_agents', []) if agent_key in self.agents
+        ] or list(self.agents)[-1:]
+        self.feedback_context_template = PromptTemplate.from_template(feedback.get('context_template') or (
+            "Your previous response: {previous_response}\n\n"
+            "Other stakeholders: {other_views}\n\n"
+            "User feedback to address: {feedback}"
+        ))
+
+
+class PersonaRegistry:
+    """Loads agent personas and prompt templates from a YAML file, reloading when the file changes"""
+
+    def __init__(self, path, reload_interval=5):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._snapshot = None
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        """Read and compile the registry file, replacing the current snapshot"""
+        with open(self.path, 'rb') as registry_file:
+            raw = registry_file.read()
+        mtime = os.path.getmtime(self.path)
+        snapshot = PersonaRegistrySnapshot(yaml.safe_load(raw), hashlib.sha256(raw).hexdigest())
+
+        with self._lock:
+            self._snapshot = snapshot
+            self._mtime = mtime
+            self._checked_at = time.monotonic()
+        logger.info("Persona registry loaded (%s, %d agents)", snapshot.version, len(snapshot.agents))
+        return snapshot
+
+    def snapshot(self):
+        """Return the current snapshot, reloading first if the file changed on disk"""
+        now = time.monotonic()
+        if now - self._checked_at >= self.reload_interval:
+            with self._lock:
+                self._checked_at = now
+            try:
+                if os.path.getmtime(self.path) != self._mtime:
+                    self.reload()
+            except Exception as e:
+                # Keep serving the last good registry if the edited file is invalid
+                logger.warning("Failed to reload persona registry: %s", e)
+        return self._snapshot
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_persona_registry():
+    """Return the process-wide persona registry"""
+    global _registry
+
+    with _registry_lock:
+        if _registry is None:
+            _registry = PersonaRegistry(
+                settings.PERSONA_REGISTRY_PATH,
+                reload_interval=settings.PERSONA_REGISTRY_RELOAD_INTERVAL
+            )
+        return _registry
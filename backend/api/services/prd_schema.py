@@ -0,0 +1,146 @@
+import json
+import re
+from typing import List, Literal
+from pydantic import BaseModel, Field, ValidationError, field_validator
+from .rate_limiter import record_event
+
+
+# Section headings of the text rendering; the frontend splits PRD text on these
+SECTION_HEADINGS = (
+    ('refined_requirements', 'REFINED REQUIREMENTS'),
+    ('trade_offs', 'TRADE-OFFS'),
+    ('next_steps', 'NEXT STEPS'),
+)
+
+CODE_FENCE = re.compile(r'^```(?:json)?\s*|\s*```$', re.IGNORECASE)
+
+
+PRIORITIES = ('high', 'medium', 'low')
+
+
+def _text(value):
+    """Lenient string field: null becomes '', numbers and other scalars their string form"""
+    if value is None:
+        return ''
+    if isinstance(value, (list, dict)):
+        raise ValueError('Expected text')
+    return str(value).strip()
+
+
+class RequirementItem(BaseModel):
+    title: str = Field(min_length=1)
+    description: str = ''
+    priority: Literal['high', 'medium', 'low'] = 'medium'
+
+    _text_fields = field_validator('title', 'description', mode='before')(_text)
+
+    @field_validator('priority', mode='before')
+    @classmethod
+    def _normalize_priority(cls, value):
+        # "critical", "P1" or a missing priority fall back to medium rather than failing the item
+        value = str(value).strip().lower() if value else ''
+        return value if value in PRIORITIES else 'medium'
+
+
+class TradeOffItem(BaseModel):
+    title: str = Field(min_length=1)
+    description: str = ''
+
+    _text_fields = field_validator('title', 'description', mode='before')(_text)
+
+
+class NextStepItem(BaseModel):
+    title: str = Field(min_length=1)
+    description: str = ''
+    timeline: str = ''
+
+    _text_fields = field_validator('title', 'description', 'timeline', mode='before')(_text)
+
+
+def _valid_items(model, value):
+    """
+    The items of a section that validate against its model. A null section is empty, a bare
+    string item is taken as a title, and items that still fail validation are dropped (and
+    counted) instead of failing the whole document.
+    """
+    if value is None:
+        return []
+    if not isinstance(value, list):
+        value = [value]
+
+    items = []
+    for item in value:
+        if isinstance(item, str):
+            item = {'title': item}
+        try:
+            items.append(model.model_validate(item))
+        except ValidationError:
+            record_event('prd_items_dropped')
+    return items
+
+
+class PRDDocument(BaseModel):
+    """Structured output requested from the aggregation step"""
+
+    refined_requirements: List[RequirementItem] = Field(default_factory=list)
+    trade_offs: List[TradeOffItem] = Field(default_factory=list)
+    next_steps: List[NextStepItem] = Field(default_factory=list)
+
+    @field_validator('refined_requirements', mode='before')
+    @classmethod
+    def _requirement_items(cls, value):
+        return _valid_items(RequirementItem, value)
+
+    @field_validator('trade_offs', mode='before')
+    @classmethod
+    def _trade_off_items(cls, value):
+        return _valid_items(TradeOffItem, value)
+
+    @field_validator('next_steps', mode='before')
+    @classmethod
+    def _next_step_items(cls, value):
+        return _valid_items(NextStepItem, value)
+
+
+def extract_json(text):
+    """Pull the JSON object out of a model reply that may wrap it in a code fence or prose"""
+    text = CODE_FENCE.sub('', (text or '').strip())
+    start = text.find('{')
+    end = text.rfind('}')
+    if start == -1 or end <= start:
+        raise ValueError('No JSON object in response')
+    return json.loads(text[start:end + 1])
+
+
+def parse_prd(text):
+    """
+    PRD dict (sections as item arrays) from an aggregation reply, or None if the reply holds no
+    JSON object. Validation is lenient: whatever parts of the object are usable are kept.
+    """
+    try:
+        return PRDDocument.model_validate(extract_json(text)).model_dump()
+    except (ValueError, ValidationError):
+        return None
+
+
+def render_section(section, items):
+    """Text of one section, as a numbered list"""
+    lines = []
+    for number, item in enumerate(items, 1):
+        line = f"{number}. {item['title']}"
+        if item.get('priority'):
+            line += f" ({item['priority'].capitalize()} priority)"
+        if item.get('description'):
+            line += f": {item['description']}"
+        if item.get('timeline'):
+            line += f" [Timeline: {item['timeline']}]"
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def render_prd_text(prd):
+    """Plain-text PRD with the section headings clients already understand"""
+    return '\n\n'.join(
+        f"{heading}:\n{render_section(section, prd[section])}"
+        for section, heading in SECTION_HEADINGS
+    )
@@ -0,0 +1,262 @@
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a call could not be scheduled within the configured queue wait"""
+
+
+# Process-wide counters for quota handling and fallbacks
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def record_event(name, amount=1):
+    """Increment a rate limiting / fallback counter"""
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def get_rate_limit_stats():
+    """Return rate limiting, retry and fallback counters"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['queue_wait_seconds'] = round(stats.get('queue_wait_seconds', 0), 3)
+    return stats
+
+
+def is_rate_limit_error(error):
+    """True for quota / 429 errors returned by Gemini (or raised by our own limiter)"""
+    if isinstance(error, RateLimitExceeded):
+        return True
+    if type(error).__name__ in ('ResourceExhausted', 'TooManyRequests'):
+        return True
+    error_msg = str(error).lower()
+    return 'quota' in error_msg or 'rate limit' in error_msg or '429' in error_msg or 'resource exhausted' in error_msg
+
+
+def get_retry_after(error):
+    """Best-effort extraction of the server-suggested retry delay in seconds"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    retry_after = headers.get('retry-after') or headers.get('Retry-After')
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+
+    error_msg = str(error)
+    # Gemini reports e.g. "retry_delay { seconds: 13 }" or "Please retry in 13.2s"
+    match = (
+        re.search(r'retry_delay\s*\{\s*seconds:\s*(\d+)', error_msg)
+        or re.search(r'retry in\s*([\d.]+)\s*s', error_msg, re.IGNORECASE)
+        or re.search(r'retry[- ]after[:\s]*([\d.]+)', error_msg, re.IGNORECASE)
+    )
+    if match:
+        return float(match.group(1))
+    return None
+
+
+def estimate_tokens(messages):
+    """Rough token estimate (~4 characters per token) for a prompt string or list of messages"""
+    if isinstance(messages, str):
+        text = messages
+    else:
+        text = ''.join(str(getattr(message, 'content', message)) for message in messages)
+    return max(1, len(text) // 4)
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously up to its capacity"""
+
+    def __init__(self, capacity, refill_per_second):
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+
+    def refill(self, now):
+        elapsed = now - self.updated_at
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+        self.updated_at = now
+
+    def wait_time(self, amount):
+        """Seconds until `amount` tokens are available (0 if they are available now)"""
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.refill_per_second
+
+    def take(self, amount):
+        self.tokens -= min(amount, self.capacity)
+
+
+class GeminiRateLimiter:
+    """Shared requests-per-minute and tokens-per-minute limiter placed in front of every Gemini call"""
+
+    def __init__(self, requests_per_minute, tokens_per_minute, max_wait_seconds=60):
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60.0)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60.0)
+        self.max_wait_seconds = max_wait_seconds
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, estimated_tokens=1):
+        """Block until both buckets can serve the call, or raise RateLimitExceeded"""
+        started_at = time.monotonic()
+        deadline = started_at + self.max_wait_seconds
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.requests.refill(now)
+                self.tokens.refill(now)
+                wait = max(
+                    self._blocked_until - now,
+                    self.requests.wait_time(1),
+                    self.tokens.wait_time(estimated_tokens)
+                )
+                if wait <= 0:
+                    self.requests.take(1)
+                    self.tokens.take(estimated_tokens)
+                    waited = now - started_at
+                    if waited > 0.001:
+                        record_event('queued_calls')
+                        record_event('queue_wait_seconds', waited)
+                    return
+
+            if now + wait > deadline:
+                record_event('queue_timeouts')
+                raise RateLimitExceeded(
+                    f"Gemini rate limit queue wait exceeded {self.max_wait_seconds}s"
+                )
+            time.sleep(min(wait, 1.0))
+
+    def try_acquire(self, estimated_tokens=1):
+        """Take capacity for a call only if both buckets can serve it right now; returns whether it did"""
+        with self._lock:
+            now = time.monotonic()
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            if max(self._blocked_until - now, self.requests.wait_time(1), self.tokens.wait_time(estimated_tokens)) > 0:
+                return False
+            self.requests.take(1)
+            self.tokens.take(estimated_tokens)
+            return True
+
+    def pause(self, seconds):
+        """Hold back every caller for `seconds`, e.g. after the server returned a 429"""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+
+def call_with_retry(limiter, func, estimated_tokens=1, before_acquire=None):
+    """
+    Run func through the limiter, retrying rate limit errors with exponential backoff and jitter.
+    before_acquire() runs ahead of every attempt's wait for quota and may raise to abandon the call.
+    """
+    max_retries = settings.GEMINI_MAX_RETRIES
+    base_delay = settings.GEMINI_RETRY_BASE_DELAY
+    max_delay = settings.GEMINI_RETRY_MAX_DELAY
+
+    for attempt in range(max_retries + 1):
+        if before_acquire is not None:
+            before_acquire()
+        limiter.acquire(estimated_tokens)
+        try:
+            return func()
+        except Exception as e:
+            if isinstance(e, RateLimitExceeded) or not is_rate_limit_error(e) or attempt == max_retries:
+                if is_rate_limit_error(e):
+                    record_event('rate_limit_failures')
+                raise
+
+            record_event('retries')
+            retry_after = get_retry_after(e)
+            if retry_after is not None:
+                # Respect the server's hint, with a little jitter so callers don't stampede together
+                delay = min(max_delay, retry_after) + random.uniform(0, base_delay)
+            else:
+                # Full jitter exponential backoff
+                delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+            # Every caller in this process backs off, not just this one
+            limiter.pause(delay)
+            logger.warning("Gemini rate limited, retrying in %.1fs (attempt %d/%d)", delay, attempt + 1, max_retries)
+
+
+class RateLimitedChatModel:
+    """
+    Wraps a LangChain chat model so invoke/stream go through the shared limiter and retry policy.
+    With a circuit breaker, calls are rejected before queueing for quota while its circuit is open.
+    """
+
+    def __init__(self, llm, limiter, breaker=None):
+        self.llm = llm
+        self.limiter = limiter
+        self.breaker = breaker
+
+    @property
+    def _before_acquire(self):
+        return self.breaker.check if self.breaker is not None else None
+
+    def invoke(self, messages, **kwargs):
+        return call_with_retry(
+            self.limiter,
+            lambda: self.llm.invoke(messages, **kwargs),
+            estimated_tokens=estimate_tokens(messages) + settings.GEMINI_EXPECTED_OUTPUT_TOKENS,
+            before_acquire=self._before_acquire
+        )
+
+    def stream(self, messages, **kwargs):
+        # Only the start of the stream can be retried; chunks already yielded cannot be taken back
+        stream = call_with_retry(
+            self.limiter,
+            lambda: self._start_stream(messages, **kwargs),
+            estimated_tokens=estimate_tokens(messages) + settings.GEMINI_EXPECTED_OUTPUT_TOKENS,
+            before_acquire=self._before_acquire
+        )
+        yield from stream
+
+    def _start_stream(self, messages, **kwargs):
+        iterator = iter(self.llm.stream(messages, **kwargs))
+        try:
+            first = next(iterator)
+        except StopIteration:
+            return iter(())
+        return self._chain(first, iterator)
+
+    @staticmethod
+    def _chain(first, iterator):
+        yield first
+        yield from iterator
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """Return the process-wide Gemini rate limiter"""
+    global _limiter
+
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = GeminiRateLimiter(
+                requests_per_minute=settings.GEMINI_REQUESTS_PER_MINUTE,
+                tokens_per_minute=settings.GEMINI_TOKENS_PER_MINUTE,
+                max_wait_seconds=settings.GEMINI_QUEUE_MAX_WAIT_SECONDS
+            )
+        return _limiter
@@ -0,0 +1,348 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from bson import ObjectId
+from django.conf import settings
+from .idea_similarity import find_similar_ideas
+from .multi_agent import get_multi_agent_system
+from .prd_schema import SECTION_HEADINGS, render_section
+from .rate_limiter import record_event
+from .timing import get_request_timing, span
+
+
+# Credits charged for one requirement refinement
+REFINEMENT_CREDIT_COST = 2
+
+# Credits charged for one feedback iteration (re-runs only the affected agents)
+FEEDBACK_CREDIT_COST = 1
+
+
+def parse_requirement_sections(refined_text):
+    """Split aggregated requirements text into its refined requirements, trade-offs and next steps sections"""
+    # Simple parsing - look for section headers
+    sections = {
+        'refined_requirements': '',
+        'trade_offs': '',
+        'next_steps': ''
+    }
+
+    # Try to parse the sections
+    lines = refined_text.split('\n')
+    current_section = None
+
+    for line in lines:
+        line = line.strip()
+        if 'REFINED REQUIREMENTS' in line.upper():
+            current_section = 'refined_requirements'
+        elif 'TRADE-OFFS' in line.upper() or 'TRADE OFFS' in line.upper():
+            current_section = 'trade_offs'
+        elif 'NEXT STEPS' in line.upper():
+            current_section = 'next_steps'
+        elif current_section and line:
+            sections[current_section] += line + '\n'
+
+    return {
+        'refined_requirements': sections['refined_requirements'].strip(),
+        'trade_offs': sections['trade_offs'].strip(),
+        'next_steps': sections['next_steps'].strip()
+    }
+
+
+def reuse_prior_refinement(mongodb_service, user_id, idea_text):
+    """
+    Answer a near-duplicate of an idea the user already refined from that idea's stored debate.
+    The submission is still saved as a new idea, so it shows up in the user's history and stats;
+    it gets a copy of the prior debate and requirements and records the idea they came from in
+    reused_from. Returns the response for the new idea, or None when nothing can be reused.
+    """
+    with span('similarity.lookup'):
+        similar_ideas = find_similar_ideas(mongodb_service, user_id, idea_text)
+    
+    for similar_idea_id, score in similar_ideas:
+        requirement = mongodb_service.get_latest_requirement(similar_idea_id)
+        if not requirement:
+            continue
+        debate_log = mongodb_service.get_debate_log(similar_idea_id)
+        if not debate_log:
+            continue
+
+        refined_text = requirement.get('raw_text') or (
+            f"REFINED REQUIREMENTS:\n{requirement.get('refined_requirements', '')}\n\n"
+            f"TRADE-OFFS:\n{requirement.get('trade_offs', '')}\n\n"
+            f"NEXT STEPS:\n{requirement.get('next_steps', '')}"
+        )
+        idea_id = save_reused_refinement(mongodb_service, user_id, idea_text, similar_idea_id, debate_log, requirement)
+        return {
+            'success': True,
+            'reused': True,
+            'idea_id': idea_id,
+            'reused_from': similar_idea_id,
+            'similarity': score,
+            'refined_requirements': refined_text,
+            'structured_requirements': requirement.get('structured'),
+            'debate_log': debate_log
+        }
+    return None
+
+
+def save_reused_refinement(mongodb_service, user_id, idea_text, source_idea_id, debate_log, requirement):
+    """Save a submission answered from another idea's debate as a new idea linked to it, returning its ID"""
+    with span('idea.insert'):
+        idea_id = mongodb_service.save_idea({
+            'title': idea_text[:200],  # Truncate if too long
+            'description': idea_text,
+            'user_id': user_id,
+            'reused_from': source_idea_id
+        })
+    with span('debates.insert'):
+        mongodb_service.save_debates(idea_id, debate_log)
+    requirements_data = {
+        key: value for key, value in requirement.items()
+        if key not in ('_id', 'idea_id', 'created_at')
+    }
+    requirements_data['reused_from'] = source_idea_id
+    with span('requirements.insert'):
+        mongodb_service.save_requirements(idea_id, requirements_data)
+    record_event('refinements_reused')
+    return idea_id
+
+
+def reuse_batch_result(mongodb_service, user_id, idea_text, source_result):
+    """Answer an idea repeated within a batch from the finished refinement of its first occurrence"""
+    requirement = build_requirements_data(
+        source_result['refined_requirements'], source_result.get('missing_agents'), source_result.get('structured_requirements')
+    )
+    idea_id = save_reused_refinement(
+        mongodb_service, user_id, idea_text, source_result['idea_id'], source_result['debate_log'], requirement
+    )
+    return {
+        'success': True,
+        'reused': True,
+        'idea_id': idea_id,
+        'reused_from': source_result['idea_id'],
+        'refined_requirements': source_result['refined_requirements'],
+        'structured_requirements': source_result.get('structured_requirements'),
+        'debate_log': source_result['debate_log'],
+        'partial': source_result.get('partial', False),
+        'missing_agents': source_result.get('missing_agents', [])
+    }
+
+
+def build_requirements_data(refined_text, missing_agents=None, structured=None, version=1):
+    """
+    Requirements document stored for an aggregated PRD. A schema-validated PRD is stored as
+    item arrays under 'structured', with the per-section text rendered from it; only an
+    unstructured reply goes through the heading-based text parser. Feedback iterations of an
+    idea are stored as further documents with increasing version numbers.
+    """
+    if structured:
+        requirements_data = {section: render_section(section, structured[section]) for section, _ in SECTION_HEADINGS}
+        requirements_data['structured'] = structured
+    else:
+        with span('parse'):
+            requirements_data = parse_requirement_sections(refined_text)
+    requirements_data['raw_text'] = refined_text
+    requirements_data['version'] = version
+    if missing_agents:
+        requirements_data['partial'] = True
+        requirements_data['missing_agents'] = missing_agents
+    return requirements_data
+
+
+def save_refinement_result(mongodb_service, idea_id, debate_log, refined_text, user_id=None, token_usage=None,
+                           missing_agents=None, structured=None):
+    """
+    Persist a finished debate and its parsed requirements for an idea, with the request's stage
+    timings and the refinement's token usage (also added to the user's totals). Requirements
+    aggregated without some agents' responses are flagged partial.
+    """
+    with span('debates.insert'):
+        mongodb_service.save_debates(idea_id, debate_log)
+    requirements_data = build_requirements_data(refined_text, missing_agents, structured)
+    with span('requirements.insert'):
+        mongodb_service.save_requirements(idea_id, requirements_data)
+    
+    timing = get_request_timing()
+    mongodb_service.save_idea_metrics(
+        idea_id,
+        timings=timing.to_list() if timing is not None else None,
+        token_usage=token_usage
+    )
+    if user_id and token_usage:
+        mongodb_service.add_user_token_usage(user_id, token_usage)
+
+
+def run_refinement(mongodb_service, user_id, idea_text, rounds=None):
+    """
+    Save the idea, run the multi-agent refinement and persist its results.
+    Credits are the caller's responsibility.
+    """
+    # Save idea to MongoDB with user_id
+    with span('idea.insert'):
+        idea_id = mongodb_service.save_idea({
+            'title': idea_text[:200],  # Truncate if too long
+            'description': idea_text,
+            'user_id': user_id
+        })
+
+    # Run requirement refinement
+    result = get_multi_agent_system().refine_requirements(idea_text, rounds=rounds)
+    if not result['success']:
+        return {
+            'success': False,
+            'idea_id': idea_id,
+            'error': result.get('error', 'Unknown error occurred'),
+            'retry_after': result.get('retry_after')
+        }
+
+    save_refinement_result(
+        mongodb_service, idea_id, result['debate_log'], result['refined_requirements'],
+        user_id=user_id, token_usage=result.get('token_usage'), missing_agents=result.get('missing_agents'),
+        structured=result.get('structured_requirements')
+    )
+
+    return {
+        'success': True,
+        'idea_id': idea_id,
+        'refined_requirements': result['refined_requirements'],
+        'structured_requirements': result.get('structured_requirements'),
+        'debate_log': result['debate_log'],
+        'token_usage': result.get('token_usage'),
+        'partial': result.get('partial', False),
+        'missing_agents': result.get('missing_agents', [])
+    }
+
+
+def run_feedback_refinement(mongodb_service, user_id, idea, debate_log, feedback, agent_keys=None):
+    """
+    Apply user feedback to an already refined idea: re-run only the affected agents against its
+    stored debate, re-aggregate, and save the new responses and a new requirements version.
+    Loading the idea and its debate, ownership checks and credits are the caller's responsibility.
+    """
+    idea_id = str(idea['_id'])
+    result = get_multi_agent_system().refine_with_feedback(
+        idea.get('description', ''), debate_log, feedback, agent_keys=agent_keys
+    )
+    if not result['success']:
+        return {
+            'success': False,
+            'error': result.get('error', 'Unknown error occurred'),
+            'retry_after': result.get('retry_after')
+        }
+
+    latest = mongodb_service.get_latest_requirement(idea_id)
+    version = (latest.get('version', 1) if latest else 0) + 1
+    requirements_data = build_requirements_data(
+        result['refined_requirements'], result.get('missing_agents'), result.get('structured_requirements'), version
+    )
+    requirements_data['feedback'] = feedback
+    requirements_data['rerun_agents'] = result['rerun_agents']
+
+    with span('debates.insert'):
+        mongodb_service.save_debates(idea_id, result['debate_log'])
+    with span('requirements.insert'):
+        mongodb_service.save_requirements(idea_id, requirements_data)
+    if result.get('token_usage'):
+        mongodb_service.add_user_token_usage(user_id, result['token_usage'])
+
+    return {
+        'success': True,
+        'idea_id': idea_id,
+        'version': version,
+        'rerun_agents': result['rerun_agents'],
+        'refined_requirements': result['refined_requirements'],
+        'structured_requirements': result.get('structured_requirements'),
+        'debate_log': result['debate_log'],
+        'token_usage': result.get('token_usage'),
+        'partial': result.get('partial', False),
+        'missing_agents': result.get('missing_agents', [])
+    }
+
+
+def run_refinement_batch(mongodb_service, user_id, idea_texts, rounds=None):
+    """
+    Refine many ideas through a bounded-concurrency pipeline, yielding (index, result) as each finishes.
+    Each idea is saved only once its refinement finished (IDs are assigned up front), so ideas the
+    consumer never received leave nothing behind; ideas, debates and requirements are flushed with
+    bulk writes every REFINE_BATCH_WRITE_SIZE completions. Credits are the caller's responsibility.
+    """
+    idea_ids = [str(ObjectId()) for _ in idea_texts]
+
+    agent_system = get_multi_agent_system()
+    pending_ideas = []
+    pending_debates = {}
+    pending_requirements = []
+    pending_token_usage = {}
+
+    def flush():
+        if pending_ideas:
+            mongodb_service.save_ideas(pending_ideas)
+            pending_ideas.clear()
+        if pending_debates:
+            mongodb_service.save_debates_bulk(pending_debates)
+            pending_debates.clear()
+        if pending_requirements:
+            mongodb_service.save_requirements_bulk(pending_requirements)
+            pending_requirements.clear()
+        if pending_token_usage:
+            mongodb_service.save_token_usage_bulk(pending_token_usage)
+            mongodb_service.add_user_token_usage(user_id, {
+                key: sum(usage[key] for usage in pending_token_usage.values())
+                for key in ('input_tokens', 'output_tokens', 'calls')
+            }, refinements=len(pending_token_usage))
+            pending_token_usage.clear()
+
+    executor = ThreadPoolExecutor(max_workers=settings.REFINE_BATCH_MAX_CONCURRENCY, thread_name_prefix='refine-batch')
+    try:
+        futures = {
+            executor.submit(agent_system.refine_requirements, idea_text, rounds): index
+            for index, idea_text in enumerate(idea_texts)
+        }
+
+        for future in as_completed(futures):
+            index = futures[future]
+            idea_id = idea_ids[index]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'success': False, 'error': str(e)}
+
+            pending_ideas.append({
+                '_id': ObjectId(idea_id),
+                'title': idea_texts[index][:200],  # Truncate if too long
+                'description': idea_texts[index],
+                'user_id': user_id
+            })
+            if not result['success']:
+                yield index, {
+                    'success': False,
+                    'idea_id': idea_id,
+                    'error': result.get('error', 'Unknown error occurred')
+                }
+                continue
+
+            pending_debates[idea_id] = result['debate_log']
+            pending_requirements.append((
+                idea_id, build_requirements_data(
+                    result['refined_requirements'], result.get('missing_agents'), result.get('structured_requirements')
+                )
+            ))
+            if result.get('token_usage'):
+                pending_token_usage[idea_id] = result['token_usage']
+            if len(pending_ideas) >= settings.REFINE_BATCH_WRITE_SIZE:
+                flush()
+
+            yield index, {
+                'success': True,
+                'idea_id': idea_id,
+                'refined_requirements': result['refined_requirements'],
+                'structured_requirements': result.get('structured_requirements'),
+                'debate_log': result['debate_log'],
+                'token_usage': result.get('token_usage'),
+                'partial': result.get('partial', False),
+                'missing_agents': result.get('missing_agents', [])
+            }
+    finally:
+        # A consumer that stops early (client disconnected) must not wait for, or pay for, the
+        # remaining debates: ideas not yet started are cancelled, running ones finish unobserved
+        # and, never having been yielded, are not saved
+        executor.shutdown(wait=False, cancel_futures=True)
+        flush()
@@ -0,0 +1,155 @@
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+
+# Histogram bucket upper bounds in milliseconds
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+_current_timing = contextvars.ContextVar('request_timing', default=None)
+
+
+class RequestTiming:
+    """Timing spans recorded while one request (or background job) runs"""
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def record(self, name, started_at, duration, attributes=None):
+        span = {
+            'name': name,
+            'start_ms': round((started_at - self.started_at) * 1000, 2),
+            'duration_ms': round(duration * 1000, 2)
+        }
+        if attributes:
+            span['attributes'] = attributes
+        with self._lock:
+            self.spans.append(span)
+
+    def to_list(self):
+        with self._lock:
+            return sorted(self.spans, key=lambda span: span['start_ms'])
+
+    def server_timing_header(self):
+        """Server-Timing header value, summing spans that share a name (e.g. an agent across rounds)"""
+        totals = {}
+        for span in self.to_list():
+            totals[span['name']] = totals.get(span['name'], 0) + span['duration_ms']
+        totals['total'] = round((time.monotonic() - self.started_at) * 1000, 2)
+        return ', '.join(f"{name};dur={duration:.1f}" for name, duration in totals.items())
+
+
+class LatencyHistogram:
+    """Cumulative-bucket latency histogram in the Prometheus style"""
+
+    def __init__(self):
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+
+    def observe(self, duration_ms):
+        self.bucket_counts[bisect_left(LATENCY_BUCKETS_MS, duration_ms)] += 1
+        self.count += 1
+        self.sum_ms += duration_ms
+
+    def cumulative(self):
+        """[(le, cumulative count)] including the +Inf bucket"""
+        running = 0
+        buckets = []
+        for bound, count in zip(list(LATENCY_BUCKETS_MS) + ['+Inf'], self.bucket_counts):
+            running += count
+            buckets.append((bound, running))
+        return buckets
+
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+def observe_stage(name, duration_ms):
+    """Add one stage duration to this process's histograms"""
+    with _histograms_lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = LatencyHistogram()
+        histogram.observe(duration_ms)
+
+
+def start_request_timing():
+    """Begin collecting spans for the current request, returning (timing, token) for end_request_timing"""
+    timing = RequestTiming()
+    return timing, _current_timing.set(timing)
+
+
+def activate_request_timing(timing):
+    """Make an existing timing current again (e.g. inside a streaming response body), returning a token"""
+    return _current_timing.set(timing)
+
+
+def end_request_timing(token):
+    try:
+        _current_timing.reset(token)
+    except ValueError:
+        # Token created in another context (a generator resumed elsewhere); nothing left to restore
+        _current_timing.set(None)
+
+
+def get_request_timing():
+    """Timing of the request being served on this thread, or None outside a request"""
+    return _current_timing.get()
+
+
+@contextmanager
+def span(name, **attributes):
+    """Time a block as a named stage of the current request and record it in the stage histograms"""
+    started_at = time.monotonic()
+    try:
+        yield
+    finally:
+        duration = time.monotonic() - started_at
+        observe_stage(name, duration * 1000)
+        timing = _current_timing.get()
+        if timing is not None:
+            timing.record(name, started_at, duration, attributes or None)
+
+
+def bind_request_timing(func):
+    """Wrap func so it records spans into the caller's request timing when run on a pool thread"""
+    context = contextvars.copy_context()
+
+    def wrapper(*args, **kwargs):
+        # Each call gets its own copy; one Context cannot be entered by two threads at once
+        return context.copy().run(func, *args, **kwargs)
+    return wrapper
+
+
+def get_stage_histograms():
+    """Per-stage count, mean and bucket counts for the metrics endpoint"""
+    with _histograms_lock:
+        return {
+            name: {
+                'count': histogram.count,
+                'mean_ms': round(histogram.sum_ms / histogram.count, 2) if histogram.count else None,
+                'buckets': {str(bound): count for bound, count in histogram.cumulative()}
+            }
+            for name, histogram in sorted(_histograms.items())
+        }
+
+
+def render_prometheus():
+    """Stage histograms in the Prometheus text exposition format"""
+    lines = [
+        '# HELP focalai_stage_duration_ms Duration of refine pipeline stages in milliseconds',
+        '# TYPE focalai_stage_duration_ms histogram'
+    ]
+    with _histograms_lock:
+        for name, histogram in sorted(_histograms.items()):
+            for bound, count in histogram.cumulative():
+                lines.append(f'focalai_stage_duration_ms_bucket{{stage="{name}",le="{bound}"}} {count}')
+            lines.append(f'focalai_stage_duration_ms_sum{{stage="{name}"}} {histogram.sum_ms:.3f}')
+            lines.append(f'focalai_stage_duration_ms_count{{stage="{name}"}} {histogram.count}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,267 @@
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
+from django.conf import settings
+from .llm_cache import get_llm_cache, make_cache_key
+from .llm_clients import get_llm
+from .rate_limiter import record_event
+from .token_accounting import record_llm_usage
+
+
+logger = logging.getLogger(__name__)
+
+
+MAX_TITLE_CHARS = 40
+MAX_TITLE_WORDS = 5
+# Descriptions accepted by one title request (e.g. a page of history items)
+MAX_TITLES_PER_REQUEST = 100
+
+# Bump when the title prompt changes; part of the title cache key
+TITLE_PROMPT_VERSION = 'titles-v1'
+
+# Requests and filler in front of the actual subject ("i want to build a ...", "please create an ...")
+LEADING_REQUEST = re.compile(
+    r"^(?:please\s+|let'?s\s+|i\s+(?:want|would like|need|plan)(?:\s+to)?\s+|we\s+(?:want|would like|need|plan)(?:\s+to)?\s+|"
+    r"(?:create|build|develop|make|design|launch|start)\s+|an?\s+|the\s+|my\s+|our\s+|new\s+|simple\s+)",
+    re.IGNORECASE
+)
+PRODUCT_KIND = re.compile(
+    r'^(?:(?:mobile|web|ios|android)\s+)?(app|application|platform|system|tool|website|webapp|site|service|marketplace)'
+    r'\s+(?:for|to|that|which|where)\s+',
+    re.IGNORECASE
+)
+LEADING_CONNECTOR = re.compile(r'^(?:that|which|to|for|helps?|lets?|allows?)\s+', re.IGNORECASE)
+# Where the noun phrase ends and its explanation begins
+CLAUSE_BOUNDARY = re.compile(
+    r'[.,;:!?()\n]|\s(?:that|which|who|where|so|because|but|by|using|with|without|while|to help|to let|to allow)\s',
+    re.IGNORECASE
+)
+FILLER_WORDS = {'a', 'an', 'the', 'my', 'our', 'your', 'their', 'some', 'really', 'very', 'basically', 'just'}
+EDGE_WORDS = {'and', 'or', 'of', 'for', 'to', 'in', 'on', 'at', 'with', 'from', 'about'}
+PRODUCT_WORDS = {'app', 'application', 'platform', 'system', 'tool', 'website', 'webapp', 'site', 'service',
+                 'marketplace', 'network', 'media', 'tracker', 'manager', 'assistant', 'dashboard', 'portal', 'bot'}
+# Descriptions whose subject phrase has more content words than this are left to the LLM fallback
+CONFIDENT_MAX_WORDS = 8
+
+
+def _capitalize(word):
+    """Capitalize a word, leaving acronyms and mixed-case brand words (AI, FinTech, iOS) alone"""
+    if any(char.isupper() for char in word):
+        return word
+    return '-'.join(part[:1].upper() + part[1:] for part in word.split('-'))
+
+
+def _clip(title):
+    if len(title) > MAX_TITLE_CHARS:
+        title = title[:MAX_TITLE_CHARS - 3] + '...'
+    return title
+
+
+def _subject_phrase(description):
+    """The noun phrase naming what the idea is, and the kind of product it was described as"""
+    text = re.sub(r'\s+', ' ', description or '').strip()
+
+    # Peel request phrasing off the front until the subject starts
+    previous = None
+    while previous != text:
+        previous = text
+        text = LEADING_REQUEST.sub('', text)
+
+    kind = None
+    match = PRODUCT_KIND.match(text)
+    if match:
+        kind = match.group(1).lower()
+        text = text[match.end():]
+    text = LEADING_CONNECTOR.sub('', text)
+
+    phrase = CLAUSE_BOUNDARY.split(f' {text} ', maxsplit=1)[0].strip()
+
+    # "social media for cancer patients" reads better as "Cancer Patients Social Media"
+    head, separator, tail = phrase.partition(' for ')
+    if separator and head and len(tail.split()) <= 3:
+        phrase = f"{tail} {head}"
+    return phrase, kind
+
+
+def generate_local_title(description):
+    """
+    Title an idea without the LLM: strip request phrasing ("i want to build an app for ..."),
+    keep the leading noun phrase and title-case it. Returns (title, confident); confident is
+    False when the description did not reduce to a short phrase.
+    """
+    phrase, kind = _subject_phrase(description)
+    words = [word for word in re.findall(r"[\w][\w'&+-]*", phrase) if word.lower() not in FILLER_WORDS]
+    while words and words[0].lower() in EDGE_WORDS:
+        words.pop(0)
+    while words and words[-1].lower() in EDGE_WORDS:
+        words.pop()
+
+    if not words:
+        return _clip(' '.join(_capitalize(word) for word in (description or 'Untitled Idea').split()[:MAX_TITLE_WORDS])), False
+
+    # A bare "Platform" or a run-on clause is not a title
+    confident = len(words) <= CONFIDENT_MAX_WORDS and any(word.lower() not in PRODUCT_WORDS for word in words)
+    words = words[:MAX_TITLE_WORDS]
+    if not any(word.lower() in PRODUCT_WORDS for word in words):
+        words.append(kind or 'app')
+    return _clip(' '.join(_capitalize(word) for word in words)), confident
+
+
+def _title_cache_key(description):
+    return make_cache_key('title', description, None, TITLE_PROMPT_VERSION, settings.TITLE_LLM_MODEL, 0.3)
+
+
+def _request_llm_titles(descriptions):
+    """One LLM call that titles every description, returned in input order"""
+    numbered = '\n'.join(f'{number}. "{description[:500]}"' for number, description in enumerate(descriptions, 1))
+    prompt = f"""
+    Convert each of these app idea descriptions into a clean, concise title (max {MAX_TITLE_CHARS} characters).
+
+    Descriptions:
+    {numbered}
+
+    Rules:
+    1. Remove common prefixes like "i want", "create", "build", "develop", "make"
+    2. Make it concise and professional, and capitalize properly
+    3. Make it sound like a real app name
+
+    Examples:
+    - "i want to build social media for cancer patient" → "Cancer Patient Social Media"
+    - "create a mobile app for hospital patient monitoring" → "Hospital Patient Monitor"
+    - "build a fintech payment processing platform" → "FinTech Payment Platform"
+
+    Respond with only a JSON object of the form {{"titles": ["...", "..."]}} holding exactly
+    {len(descriptions)} titles in the same order as the descriptions.
+    """
+
+    llm = get_llm(settings.TITLE_LLM_MODEL, 0.3)
+    response = llm.invoke(prompt, deadline_seconds=settings.LLM_CALL_TIMEOUT_SECONDS, deadline_key='title')
+    record_llm_usage('title', prompt, response)
+
+    content = response.content.strip()
+    titles = json.loads(content[content.find('{'):content.rfind('}') + 1])['titles']
+    if not isinstance(titles, list) or len(titles) != len(descriptions):
+        raise ValueError(f"Expected {len(descriptions)} titles, got {len(titles) if isinstance(titles, list) else 'none'}")
+    return [_clip(str(title).strip().strip('"')) for title in titles]
+
+
+def _llm_titles(descriptions):
+    """LLM titles for descriptions, answered from the cache where possible (None where the LLM failed)"""
+    cache = get_llm_cache()
+    titles = [cache.get(_title_cache_key(description)) if cache else None for description in descriptions]
+    misses = [index for index, title in enumerate(titles) if title is None]
+
+    for start in range(0, len(misses), settings.TITLE_BATCH_SIZE):
+        chunk = misses[start:start + settings.TITLE_BATCH_SIZE]
+        try:
+            generated = _request_llm_titles([descriptions[index] for index in chunk])
+        except Exception as e:
+            record_event('title_llm_errors')
+            logger.warning("LLM title generation failed: %s", e)
+            continue
+        record_event('title_llm_batches')
+        for index, title in zip(chunk, generated):
+            titles[index] = title
+            if cache:
+                cache.set(_title_cache_key(descriptions[index]), title, {'kind': 'title'})
+    return titles
+
+
+class TitleBatcher:
+    """
+    Micro-batches single-title LLM requests: requests arriving within TITLE_BATCH_WINDOW_MS of
+    each other (up to TITLE_BATCH_SIZE) are answered by one LLM call made on a background thread.
+    """
+
+    def __init__(self, max_batch, window_seconds):
+        self.max_batch = max_batch
+        self.window_seconds = window_seconds
+        self._requests = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name='title-batcher', daemon=True)
+        self._worker.start()
+
+    def submit(self, description):
+        """Queue a description, returning a Future for its title (None if the LLM failed)"""
+        future = Future()
+        self._requests.put((description, future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self._requests.get()]
+            flush_at = time.monotonic() + self.window_seconds
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._requests.get(timeout=max(0, flush_at - time.monotonic())))
+                except queue.Empty:
+                    break
+
+            try:
+                titles = _llm_titles([description for description, _ in batch])
+            except Exception:
+                titles = [None] * len(batch)
+            for (_, future), title in zip(batch, titles):
+                future.set_result(title)
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+_batcher_pid = None
+
+
+def get_title_batcher():
+    """Return this process's title batcher, starting its thread on first use"""
+    global _batcher, _batcher_pid
+
+    with _batcher_lock:
+        # The batching thread does not survive a fork
+        if _batcher is None or _batcher_pid != os.getpid():
+            _batcher = TitleBatcher(settings.TITLE_BATCH_SIZE, settings.TITLE_BATCH_WINDOW_MS / 1000)
+            _batcher_pid = os.getpid()
+        return _batcher
+
+
+def generate_titles(descriptions, use_llm=None):
+    """
+    Titles for many idea descriptions as [(title, source)], source being 'local' or 'llm'.
+    Every description gets a local title; when the LLM fallback is enabled (TITLE_LLM_FALLBACK, or
+    use_llm) the ones the heuristic is not confident about are sent to the LLM together, as one
+    call per TITLE_BATCH_SIZE descriptions, with cached titles skipping the LLM entirely. Any LLM
+    failure keeps the local title.
+    """
+    use_llm = settings.TITLE_LLM_FALLBACK if use_llm is None else use_llm
+    results = []
+    unsure = []
+    for index, description in enumerate(descriptions):
+        title, confident = generate_local_title(description)
+        results.append((title, 'local'))
+        if not confident:
+            unsure.append(index)
+
+    if use_llm and unsure:
+        if len(descriptions) == 1:
+            # Single requests from concurrent clients are batched together
+            future = get_title_batcher().submit(descriptions[0])
+            try:
+                llm_titles = [future.result(timeout=settings.LLM_CALL_TIMEOUT_SECONDS + settings.TITLE_BATCH_WINDOW_MS / 1000)]
+            except Exception:
+                llm_titles = [None]
+        else:
+            llm_titles = _llm_titles([descriptions[index] for index in unsure])
+
+        for index, title in zip(unsure, llm_titles):
+            if title:
+                results[index] = (title, 'llm')
+
+    record_event('titles_local', sum(1 for _, source in results if source == 'local'))
+    return results
+
+
+def generate_title(description, use_llm=None):
+    """(title, source) for one idea description"""
+    return generate_titles([description], use_llm=use_llm)[0]
@@ -0,0 +1,103 @@
+import contextvars
+import re
+import threading
+from contextlib import contextmanager
+from .rate_limiter import estimate_tokens, record_event
+
+
+# Whitespace after sentence-ending punctuation (shared with the debate's extractive summaries)
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+
+_current_ledger = contextvars.ContextVar('token_ledger', default=None)
+
+
+class TokenLedger:
+    """Input/output tokens spent by the LLM calls of one refinement, broken down by stage"""
+
+    def __init__(self):
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, input_tokens, output_tokens):
+        with self._lock:
+            totals = self.stages.setdefault(stage, {'input_tokens': 0, 'output_tokens': 0, 'calls': 0})
+            totals['input_tokens'] += input_tokens
+            totals['output_tokens'] += output_tokens
+            totals['calls'] += 1
+
+    def to_dict(self):
+        with self._lock:
+            stages = {stage: dict(totals) for stage, totals in self.stages.items()}
+        return {
+            'input_tokens': sum(totals['input_tokens'] for totals in stages.values()),
+            'output_tokens': sum(totals['output_tokens'] for totals in stages.values()),
+            'calls': sum(totals['calls'] for totals in stages.values()),
+            'stages': stages
+        }
+
+
+@contextmanager
+def token_ledger():
+    """Collect the token usage of every LLM call made in this block (and on pool threads bound to it)"""
+    ledger = TokenLedger()
+    token = _current_ledger.set(ledger)
+    try:
+        yield ledger
+    finally:
+        try:
+            _current_ledger.reset(token)
+        except ValueError:
+            # Reset from another context (a generator resumed elsewhere)
+            _current_ledger.set(None)
+
+
+def record_llm_usage(stage, messages, response):
+    """
+    Account one LLM call. Uses the provider's reported usage when the response carries it
+    (LangChain usage_metadata) and the ~4 characters per token estimate otherwise.
+    """
+    usage = getattr(response, 'usage_metadata', None) or {}
+    content = getattr(response, 'content', response)
+    input_tokens = usage.get('input_tokens') or estimate_tokens(messages)
+    output_tokens = usage.get('output_tokens') or (estimate_tokens(content) if content else 0)
+
+    record_event('llm_input_tokens', input_tokens)
+    record_event('llm_output_tokens', output_tokens)
+    ledger = _current_ledger.get()
+    if ledger is not None:
+        ledger.add(stage, input_tokens, output_tokens)
+    return input_tokens, output_tokens
+
+
+def fit_to_budget(text, max_tokens):
+    """
+    Shrink text to roughly max_tokens. Whole sentences are kept from the start (about two thirds
+    of the budget) and from the end, with an omission marker between them, so both the framing
+    and the conclusion of a long input survive.
+    """
+    if not text or not max_tokens or estimate_tokens(text) <= max_tokens:
+        return text
+
+    max_chars = max_tokens * 4
+    sentences = SENTENCE_BOUNDARY.split(re.sub(r'\s+', ' ', text).strip())
+
+    head, head_chars = [], 0
+    for sentence in sentences:
+        if head_chars + len(sentence) + 1 > max_chars * 2 // 3:
+            break
+        head.append(sentence)
+        head_chars += len(sentence) + 1
+
+    tail, tail_chars = [], 0
+    for sentence in reversed(sentences[len(head):]):
+        if head_chars + tail_chars + len(sentence) + 1 > max_chars:
+            break
+        tail.insert(0, sentence)
+        tail_chars += len(sentence) + 1
+
+    if not head and not tail:
+        # A single oversized sentence; fall back to a hard cut
+        return text[:max_chars] + ' [...]'
+
+    record_event('prompt_truncations')
+    return ' '.join(head) + ' [...] ' + ' '.join(tail) if tail else ' '.join(head) + ' [...]'
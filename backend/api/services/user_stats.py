@@ -0,0 +1,158 @@
+import json
+from datetime import datetime
+from django.conf import settings
+from .deadlines import LLMDeadlineExceeded
+from .domain_classifier import classify_domains
+from .llm_clients import get_llm
+from .rate_limiter import record_event
+
+
+# Most recent idea descriptions kept on the stats document for the insight prompt
+RECENT_IDEAS_KEPT = 5
+
+WELCOME_RECOMMENDATIONS = [
+    'Start with a simple, focused idea to get familiar with the process',
+    'Consider problems you face daily as potential product opportunities',
+    'Use the AI agents to explore different perspectives on your idea',
+    'Don\'t worry about perfection - iterate and improve over time'
+]
+
+FALLBACK_RECOMMENDATIONS = [
+    'Consider exploring adjacent domains to expand your product portfolio',
+    'Focus on user pain points that your ideas address',
+    'Use the multi-agent system to get diverse perspectives on each idea',
+    'Document your learnings from each PRD to improve future ideas'
+]
+
+
+def growth_trend(total_ideas):
+    """Growth tier for a number of submitted ideas"""
+    if total_ideas <= 1:
+        return 'Getting Started'
+    elif total_ideas <= 3:
+        return 'Building Momentum'
+    elif total_ideas <= 5:
+        return 'Active Developer'
+    return 'Product Visionary'
+
+
+def stats_update(ideas):
+    """
+    Atomic update applying newly saved ideas (of one user, oldest first) to that user's
+    user_stats document: idea count, per-domain histogram and the most recent descriptions
+    """
+    domains = {}
+    for idea in ideas:
+        domains[idea['domain']] = domains.get(idea['domain'], 0) + 1
+
+    return {
+        '$inc': dict({'total_ideas': len(ideas)}, **{f'domains.{domain}': count for domain, count in domains.items()}),
+        '$push': {'recent_ideas': {
+            '$each': [idea.get('description', '')[:1000] for idea in ideas],
+            '$slice': -RECENT_IDEAS_KEPT
+        }},
+        '$set': {'updated_at': datetime.utcnow()}
+    }
+
+
+def build_stats_document(ideas):
+    """A complete user_stats document recounted from all of a user's ideas (oldest first)"""
+    # Ideas saved before domains were stored are classified here, in one batch
+    unclassified = [idea for idea in ideas if not idea.get('domain')]
+    for idea, domain in zip(unclassified, classify_domains([idea.get('description', '') for idea in unclassified])):
+        idea['domain'] = domain
+
+    domains = {}
+    for idea in ideas:
+        domains[idea['domain']] = domains.get(idea['domain'], 0) + 1
+
+    return {
+        'total_ideas': len(ideas),
+        'domains': domains,
+        'recent_ideas': [idea.get('description', '')[:1000] for idea in ideas[-RECENT_IDEAS_KEPT:]],
+        'complete': True,
+        'updated_at': datetime.utcnow()
+    }
+
+
+def summarize_stats(stats):
+    """The counters shown on the insights dashboard, derived from a user_stats document"""
+    total_ideas = stats.get('total_ideas', 0)
+    domains = stats.get('domains') or {}
+    return {
+        'total_ideas': total_ideas,
+        'most_common_domain': max(domains, key=domains.get) if domains else 'General',
+        'average_complexity': 'Intermediate' if total_ideas > 2 else 'Beginner',
+        'growth_trend': growth_trend(total_ideas)
+    }
+
+
+def generate_ai_insight(stats):
+    """
+    Personalized insight text and recommendations for a user's ideas. Falls back to template text
+    if the LLM fails or does not answer within INSIGHT_LLM_TIMEOUT_SECONDS
+    """
+    summary = summarize_stats(stats)
+    llm = get_llm("gemini-pro", 0.7)
+
+    ideas_text = '\n'.join([f"- {description}" for description in reversed(stats.get('recent_ideas') or [])])
+
+    prompt = f"""
+    Analyze this user's product ideas and provide personalized insights:
+
+    User's Ideas:
+    {ideas_text}
+
+    Total Ideas: {summary['total_ideas']}
+    Primary Domain: {summary['most_common_domain']}
+    Growth Trend: {summary['growth_trend']}
+
+    Provide:
+    1. A personalized AI insight (2-3 sentences) about their product development journey
+    2. 3-4 specific recommendations for improvement or next steps
+
+    Format as JSON:
+    {{
+        "ai_insight": "personalized insight here",
+        "recommendations": ["rec1", "rec2", "rec3", "rec4"]
+    }}
+
+    Make it encouraging, specific, and actionable.
+    """
+
+    try:
+        response = llm.invoke(prompt, deadline_seconds=settings.INSIGHT_LLM_TIMEOUT_SECONDS, deadline_key='insight')
+        ai_analysis = json.loads(response.content.strip())
+        return {
+            'ai_insight': ai_analysis.get('ai_insight', ''),
+            'recommendations': ai_analysis.get('recommendations', [])
+        }
+    except LLMDeadlineExceeded:
+        record_event('insight_timeouts')
+        return fallback_ai_insight(stats)
+    except Exception:
+        # Fallback if AI fails
+        record_event('insight_fallbacks')
+        return fallback_ai_insight(stats)
+
+
+def fallback_ai_insight(stats):
+    """Template insight used when no generated one is available"""
+    summary = summarize_stats(stats)
+    return {
+        'ai_insight': f"Based on your {summary['total_ideas']} ideas, you're showing great potential in {summary['most_common_domain'].lower()} product development. Keep exploring and refining your concepts!",
+        'recommendations': FALLBACK_RECOMMENDATIONS,
+        'fallback': True
+    }
+
+
+def welcome_insight(user):
+    """Insights shown before a user has submitted any idea"""
+    return {
+        'total_ideas': 0,
+        'most_common_domain': 'Getting Started',
+        'average_complexity': 'Beginner',
+        'growth_trend': 'Ready to Launch',
+        'recommendations': WELCOME_RECOMMENDATIONS,
+        'ai_insight': f"Welcome to Focal AI, {user.get('name', 'there')}! You're about to embark on an exciting journey of product development. Our AI-powered system will help you transform your ideas into detailed, actionable product requirements. Start with your first idea and watch how our multi-agent system provides comprehensive insights from different stakeholder perspectives."
+    }
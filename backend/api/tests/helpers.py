@@ -0,0 +1,329 @@
+import json
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from unittest import mock
+from bson import ObjectId
+from django.test import override_settings
+from ..services import llm_clients
+from ..services.idea_similarity import record_idea
+from ..services.llm_providers import FakeLLMMessage
+from ..services.multi_agent import MultiAgentSystem
+from ..services.user_stats import build_stats_document
+
+
+PERSONA_PATTERN = re.compile(r'As a (.+?), provide your perspective')
+
+PRD_REPLY = json.dumps({
+    'refined_requirements': [{'title': 'Core flow', 'description': 'Ship the main flow first', 'priority': 'high'}],
+    'trade_offs': [{'title': 'Scope vs speed', 'description': 'Fewer features, earlier launch'}],
+    'next_steps': [{'title': 'Prototype', 'description': 'Build a clickable prototype', 'timeline': '2 weeks'}]
+})
+
+
+def prompt_text(messages):
+    if isinstance(messages, str):
+        return messages
+    return '\n'.join(str(getattr(message, 'content', message)) for message in messages)
+
+
+class ScriptedLLM:
+    """
+    Chat model double for the debate. Persona prompts are answered with a short text naming the
+    persona, aggregation prompts with a small JSON PRD and condensation prompts with notes.
+    delays and errors map a stage (persona name, 'aggregation' or 'condensation') to seconds slept
+    before answering and to an exception raised instead. Every call is recorded in calls.
+    """
+
+    def __init__(self, delays=None, errors=None):
+        self.delays = delays or {}
+        self.errors = errors or {}
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def _stage(self, messages):
+        text = prompt_text(messages)
+        match = PERSONA_PATTERN.search(text)
+        if match:
+            return match.group(1), text
+        if '"refined_requirements"' in text:
+            return 'aggregation', text
+        if 'Condense this feedback' in text:
+            return 'condensation', text
+        return 'other', text
+
+    def _reply(self, messages):
+        stage, text = self._stage(messages)
+        with self._lock:
+            self.calls.append((stage, text))
+        if stage in self.delays:
+            time.sleep(self.delays[stage])
+        if stage in self.errors:
+            raise self.errors[stage]
+        if stage == 'aggregation':
+            return PRD_REPLY
+        if stage == 'condensation':
+            return 'Condensed notes.'
+        return f"{stage} finds the idea promising. {stage} suggests starting with an MVP."
+
+    def invoke(self, messages, **kwargs):
+        return FakeLLMMessage(self._reply(messages))
+
+    def stream(self, messages, **kwargs):
+        words = self._reply(messages).split(' ')
+        for index, word in enumerate(words):
+            yield FakeLLMMessage(word if index == 0 else ' ' + word)
+
+    def stages(self):
+        with self._lock:
+            return [stage for stage, _ in self.calls]
+
+    def prompts(self, stage):
+        with self._lock:
+            return [text for call_stage, text in self.calls if call_stage == stage]
+
+
+class ScriptedMultiAgentSystem(MultiAgentSystem):
+    """MultiAgentSystem talking to a given chat model double, with an optional response cache"""
+
+    def __init__(self, llm, cache=None, max_parallelism=None):
+        super().__init__(max_parallelism=max_parallelism)
+        self.scripted_llm = llm
+        self.cache = cache
+
+    @property
+    def llm(self):
+        return self.scripted_llm
+
+
+def use_fake_provider(test_case, **settings_overrides):
+    """
+    For the rest of a test, build LLM clients from the fake provider with no latency, starting
+    from an empty client table; settings_overrides adjust the provider (e.g. FAKE_LLM_ERROR_RATE)
+    """
+    overrides = dict(LLM_PROVIDER='fake', FAKE_LLM_LATENCY_DISTRIBUTION='fixed', FAKE_LLM_LATENCY_MS_MEAN=0)
+    overrides.update(settings_overrides)
+    settings_override = override_settings(**overrides)
+    settings_override.enable()
+    test_case.addCleanup(settings_override.disable)
+
+    # Clients are rebuilt when the recorded pid does not match, exactly as after a fork
+    llm_clients._clients_pid = None
+    test_case.addCleanup(setattr, llm_clients, '_clients_pid', None)
+
+
+class FakeCursor:
+    """The find().sort().limit() chain of a pymongo cursor over a list of documents"""
+
+    def __init__(self, docs):
+        self.docs = list(docs)
+
+    def sort(self, key, direction=1):
+        self.docs.sort(key=lambda doc: doc.get(key), reverse=direction < 0)
+        return self
+
+    def limit(self, count):
+        self.docs = self.docs[:count]
+        return self
+
+    def __iter__(self):
+        return iter(self.docs)
+
+
+class FakeCollection:
+    """Just enough of a collection for the similarity index to load a user's ideas"""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query, projection=None):
+        return FakeCursor(doc for doc in self.docs.values() if all(doc.get(key) == value for key, value in query.items()))
+
+
+class FakeMongoDBService:
+    """
+    In-memory stand-in for MongoDBService covering users, credits, ideas, debates, requirements,
+    refinement jobs and user stats. Documents are kept in plain dicts and lists so tests can inspect them.
+    """
+
+    def __init__(self, credits=10):
+        self.users = {}
+        self.ideas = {}
+        self.debates = {}
+        self.requirements = []
+        self.transactions = []
+        self.idea_metrics = {}
+        self.token_usage = {}
+        self.jobs = {}
+        self.user_stats = {}
+        self.closed = 0
+        self.ideas_collection = FakeCollection(self.ideas)
+        self.user_id = self.create_user({'email': 'ada@example.com', 'name': 'Ada'}, credits=credits)
+
+    def create_user(self, user_data, credits=10):
+        user_id = str(ObjectId())
+        self.users[user_id] = {'_id': user_id, 'email': user_data['email'], 'name': user_data.get('name', ''), 'credits': credits}
+        return user_id
+
+    def get_user_by_email(self, email):
+        return next((dict(user) for user in self.users.values() if user['email'] == email), None)
+
+    def get_user_by_id(self, user_id):
+        user = self.users.get(user_id)
+        return dict(user) if user else None
+
+    def update_user_login(self, user_id):
+        return True
+
+    def get_user_credits(self, user_id):
+        return self.users[user_id]['credits']
+
+    def deduct_credits(self, user_id, amount=2, description='Requirement generation'):
+        if self.users[user_id]['credits'] < amount:
+            return False, 'Insufficient credits'
+        self.users[user_id]['credits'] -= amount
+        self.transactions.append(('deduction', -amount, description))
+        return True, f"Successfully deducted {amount} credits"
+
+    def add_credits(self, user_id, amount, description='Credit purchase'):
+        self.users[user_id]['credits'] += amount
+        self.transactions.append(('addition', amount, description))
+        return True, f"Successfully added {amount} credits"
+
+    def save_idea(self, idea_data):
+        if 'user_id' not in idea_data:
+            raise ValueError("user_id is required for idea creation")
+        return self.save_ideas([idea_data])[0]
+
+    def save_ideas(self, ideas):
+        idea_ids = []
+        for idea_data in ideas:
+            idea_data.setdefault('_id', ObjectId())
+            idea_data.setdefault('created_at', datetime.utcnow())
+            idea_id = str(idea_data['_id'])
+            self.ideas[idea_id] = idea_data
+            record_idea(idea_data['user_id'], idea_id, idea_data.get('description', ''))
+            idea_ids.append(idea_id)
+        return idea_ids
+
+    def get_idea(self, idea_id):
+        return self.ideas.get(idea_id)
+
+    def save_debates(self, idea_id, debates):
+        self.debates.setdefault(idea_id, []).extend(dict(debate) for debate in debates)
+
+    def save_debates_bulk(self, debates_by_idea):
+        for idea_id, debates in debates_by_idea.items():
+            self.save_debates(idea_id, debates)
+
+    def get_debate_log(self, idea_id):
+        return [dict(debate) for debate in self.debates.get(idea_id, [])]
+
+    def save_requirements(self, idea_id, requirements_data):
+        requirements_data['idea_id'] = idea_id
+        requirements_data['created_at'] = datetime.utcnow()
+        self.requirements.append(requirements_data)
+
+    def save_requirements_bulk(self, requirements):
+        for idea_id, requirements_data in requirements:
+            self.save_requirements(idea_id, requirements_data)
+
+    def get_latest_requirement(self, idea_id):
+        matches = [requirement for requirement in self.requirements if requirement['idea_id'] == idea_id]
+        return dict(matches[-1]) if matches else None
+
+    def save_idea_metrics(self, idea_id, timings=None, token_usage=None):
+        self.idea_metrics[idea_id] = {'timings': timings, 'token_usage': token_usage}
+
+    def save_token_usage_bulk(self, token_usage_by_idea):
+        for idea_id, token_usage in token_usage_by_idea.items():
+            self.idea_metrics.setdefault(idea_id, {})['token_usage'] = token_usage
+
+    def add_user_token_usage(self, user_id, token_usage, refinements=1):
+        totals = self.token_usage.setdefault(user_id, {'input_tokens': 0, 'output_tokens': 0, 'calls': 0, 'refinements': 0})
+        for key in ('input_tokens', 'output_tokens', 'calls'):
+            totals[key] += token_usage[key]
+        totals['refinements'] += refinements
+
+    def create_refinement_job(self, job_data):
+        job_id = str(ObjectId())
+        self.jobs[job_id] = dict(job_data, _id=job_id, created_at=datetime.utcnow())
+        return job_id
+
+    def get_refinement_job(self, job_id):
+        job = self.jobs.get(job_id)
+        return dict(job) if job else None
+
+    def claim_refinement_job(self, job_id, lease_seconds):
+        job = self.jobs.get(job_id)
+        if not job or job['status'] != 'queued':
+            return None
+        now = datetime.utcnow()
+        job.update(status='running', started_at=now, lease_id=uuid.uuid4().hex,
+                   lease_expires_at=now + timedelta(seconds=lease_seconds))
+        return dict(job)
+
+    def finish_refinement_job(self, job_id, lease_id, updates):
+        job = self.jobs.get(job_id)
+        if not job or job['status'] != 'running' or job.get('lease_id') != lease_id:
+            return False
+        job.update(updates)
+        return True
+
+    def fail_stale_refinement_jobs(self, lease_seconds, queued_timeout_seconds, error):
+        now = datetime.utcnow()
+        failed = []
+        for job in self.jobs.values():
+            expired = (
+                (job['status'] == 'running' and job['lease_expires_at'] < now)
+                or (job['status'] == 'queued' and job['created_at'] < now - timedelta(seconds=queued_timeout_seconds))
+            )
+            if expired:
+                job.update(status='failed', error=error, finished_at=now)
+                failed.append(dict(job))
+        return failed
+
+    def get_user_stats(self, user_id):
+        stats = self.user_stats.get(user_id)
+        if stats is None:
+            ideas = [idea for idea in self.ideas.values() if idea['user_id'] == user_id]
+            stats = self.user_stats[user_id] = dict(build_stats_document(ideas), _id=user_id)
+        return stats
+
+    def claim_insight_refresh(self, user_id, lease_seconds):
+        stats = self.get_user_stats(user_id)
+        started_at = stats.get('insight_refresh_started_at')
+        now = datetime.utcnow()
+        if started_at is not None and started_at >= now - timedelta(seconds=lease_seconds):
+            return False
+        stats['insight_refresh_started_at'] = now
+        return True
+
+    def save_user_insight(self, user_id, insight):
+        stats = self.get_user_stats(user_id)
+        stats['insight'] = insight
+        stats.pop('insight_refresh_started_at', None)
+
+    def close(self):
+        self.closed += 1
+
+
+def sign_in(test_case, mongodb_service, *modules):
+    """
+    For the rest of a test, accept any bearer token as the fake service's user and have
+    MongoDBService in the auth middleware and the given modules return that service
+    """
+    user = mongodb_service.users[mongodb_service.user_id]
+    patchers = [
+        mock.patch('api.auth_middleware.verify_google_token', return_value={
+            'success': True,
+            'user_info': {'email': user['email'], 'name': user['name'], 'picture': '', 'sub': '1'}
+        }),
+        mock.patch('api.auth_middleware.MongoDBService', return_value=mongodb_service)
+    ]
+    patchers.extend(mock.patch(f'{module}.MongoDBService', return_value=mongodb_service) for module in modules)
+    for patcher in patchers:
+        patcher.start()
+        test_case.addCleanup(patcher.stop)
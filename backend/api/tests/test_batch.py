@@ -0,0 +1,111 @@
+import json
+from unittest import mock
+from django.test import SimpleTestCase, override_settings
+from ..services.idea_similarity import find_batch_duplicates
+from ..services.refinement import run_refinement_batch
+from .helpers import FakeMongoDBService, ScriptedLLM, ScriptedMultiAgentSystem, sign_in
+
+
+IDEAS = [
+    'A budgeting app for college students',
+    'A recipe sharing site for home cooks',
+    'A fitness tracker for marathon runners',
+    'A marketplace for used textbooks',
+    'A language exchange platform for travelers'
+]
+
+
+class BatchDuplicateTests(SimpleTestCase):
+
+    def test_repeats_point_at_the_first_occurrence(self):
+        self.assertEqual(
+            find_batch_duplicates([IDEAS[0], IDEAS[1], 'Build a budgeting application for college students', IDEAS[0]]),
+            [None, None, 0, 0]
+        )
+
+    def test_distinct_ideas_are_kept(self):
+        self.assertEqual(find_batch_duplicates(IDEAS), [None] * len(IDEAS))
+
+
+@override_settings(DEBATE_DEFAULT_ROUNDS=1, REFINE_DEADLINE_SECONDS=0, AGGREGATION_MODE='single')
+class RefinementBatchTests(SimpleTestCase):
+
+    def setUp(self):
+        self.mongodb_service = FakeMongoDBService()
+        self.user_id = self.mongodb_service.user_id
+
+    def run_batch(self, llm, idea_texts=IDEAS):
+        # The batch generator looks the system up once it starts, so the patch must outlive this call
+        patcher = mock.patch('api.services.refinement.get_multi_agent_system', return_value=ScriptedMultiAgentSystem(llm))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return run_refinement_batch(self.mongodb_service, self.user_id, idea_texts)
+
+    @override_settings(REFINE_BATCH_WRITE_SIZE=2)
+    def test_every_finished_idea_is_saved_with_its_debate(self):
+        results = dict(self.run_batch(ScriptedLLM()))
+
+        self.assertEqual(sorted(results), list(range(len(IDEAS))))
+        self.assertTrue(all(result['success'] for result in results.values()))
+        for index, result in results.items():
+            self.assertEqual(self.mongodb_service.get_idea(result['idea_id'])['description'], IDEAS[index])
+            self.assertEqual(len(self.mongodb_service.debates[result['idea_id']]), 5)
+            self.assertIsNotNone(self.mongodb_service.get_latest_requirement(result['idea_id']))
+
+    @override_settings(REFINE_BATCH_MAX_CONCURRENCY=1)
+    def test_consumer_leaving_stops_new_work_and_saves_only_what_it_received(self):
+        llm = ScriptedLLM(delays={'aggregation': 0.05})
+        batch = self.run_batch(llm)
+        index, result = next(batch)
+        batch.close()
+
+        self.assertEqual(list(self.mongodb_service.ideas), [result['idea_id']])
+        # At most the idea that was already running when the consumer left is debated as well
+        self.assertLessEqual(len(llm.prompts('aggregation')), 2)
+
+    def test_failed_idea_is_saved_without_a_debate(self):
+        with mock.patch.object(ScriptedMultiAgentSystem, 'refine_requirements', side_effect=RuntimeError('provider down')):
+            results = dict(self.run_batch(ScriptedLLM(), IDEAS[:1]))
+
+        self.assertEqual(results[0]['error'], 'provider down')
+        self.assertIn(results[0]['idea_id'], self.mongodb_service.ideas)
+        self.assertNotIn(results[0]['idea_id'], self.mongodb_service.debates)
+
+
+@override_settings(DEBATE_DEFAULT_ROUNDS=1, REFINE_DEADLINE_SECONDS=0, AGGREGATION_MODE='single')
+class BatchEndpointTests(SimpleTestCase):
+
+    def setUp(self):
+        self.mongodb_service = FakeMongoDBService()
+        self.user_id = self.mongodb_service.user_id
+        sign_in(self, self.mongodb_service, 'api.views')
+        self.llm = ScriptedLLM()
+        patcher = mock.patch('api.services.refinement.get_multi_agent_system', return_value=ScriptedMultiAgentSystem(self.llm))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, ideas, **options):
+        return self.client.post(
+            '/api/refine/batch/', json.dumps(dict(options, ideas=ideas)),
+            content_type='application/json', HTTP_AUTHORIZATION='Bearer token'
+        )
+
+    def test_idea_repeated_in_a_batch_is_refined_and_charged_once(self):
+        ideas = [IDEAS[0], IDEAS[1], 'Build a budgeting application for college students']
+        data = self.post(ideas).json()
+
+        self.assertEqual(data['succeeded'], 3)
+        self.assertEqual(len(self.llm.prompts('aggregation')), 2)
+        self.assertEqual(self.mongodb_service.get_user_credits(self.user_id), 6)
+
+        first, _, repeat = data['results']
+        self.assertEqual(repeat['reused_from'], first['idea_id'])
+        self.assertEqual(self.mongodb_service.get_idea(repeat['idea_id'])['description'], ideas[2])
+
+    def test_streamed_batch_closed_before_reading_refunds_everything(self):
+        response = self.post(IDEAS[:3], stream=True)
+        self.assertEqual(self.mongodb_service.get_user_credits(self.user_id), 4)
+
+        response.close()
+        self.assertEqual(self.mongodb_service.get_user_credits(self.user_id), 10)
+        self.assertEqual(self.mongodb_service.ideas, {})
@@ -0,0 +1,136 @@
+import time
+from django.test import SimpleTestCase, override_settings
+from ..services.circuit_breaker import (
+    CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitBreakerChatModel, CircuitOpenError
+)
+from ..services.llm_clients import get_llm_circuit_breaker
+from ..services.rate_limiter import GeminiRateLimiter, RateLimitedChatModel
+
+
+def make_breaker(**overrides):
+    options = dict(window_seconds=60, min_calls=4, failure_rate=0.5, slow_call_seconds=10,
+                   slow_call_rate=0.8, open_seconds=30, half_open_calls=1)
+    options.update(overrides)
+    return CircuitBreaker('test', **options)
+
+
+def fail(message='boom', error=RuntimeError):
+    raise error(message)
+
+
+def open_breaker(**overrides):
+    breaker = make_breaker(min_calls=1, **overrides)
+    breaker.record(False, True, 0.1, RuntimeError('boom'))
+    return breaker
+
+
+class CircuitBreakerTests(SimpleTestCase):
+
+    def test_stays_closed_until_min_calls(self):
+        breaker = make_breaker()
+        for _ in range(3):
+            breaker.record(False, True, 0.1, RuntimeError('boom'))
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_opens_at_failure_rate_and_rejects(self):
+        breaker = make_breaker()
+        breaker.call(lambda: 'ok')
+        breaker.call(lambda: 'ok')
+        for _ in range(2):
+            with self.assertRaises(RuntimeError):
+                breaker.call(fail)
+        self.assertEqual(breaker.state, OPEN)
+
+        with self.assertRaises(CircuitOpenError):
+            breaker.call(lambda: 'ok')
+        self.assertEqual(breaker.rejected_calls, 1)
+
+    def test_opens_on_slow_calls(self):
+        breaker = make_breaker(slow_call_seconds=1)
+        for _ in range(4):
+            breaker.record(False, False, 5)
+        self.assertEqual(breaker.state, OPEN)
+
+    def test_rate_limit_errors_do_not_count(self):
+        breaker = make_breaker()
+        for _ in range(6):
+            with self.assertRaises(RuntimeError):
+                breaker.call(lambda: fail('429 Resource exhausted: quota exceeded'))
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_successful_trial_closes(self):
+        breaker = open_breaker(open_seconds=0.01)
+        self.assertEqual(breaker.state, OPEN)
+        time.sleep(0.02)
+
+        self.assertEqual(breaker.call(lambda: 'ok'), 'ok')
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_failed_trial_reopens(self):
+        breaker = open_breaker(open_seconds=0.01)
+        time.sleep(0.02)
+
+        self.assertTrue(breaker.before_call())
+        self.assertEqual(breaker.state, HALF_OPEN)
+        # Only half_open_calls trials may be in flight
+        with self.assertRaises(CircuitOpenError):
+            breaker.check()
+        breaker.record(True, True, 0.1, RuntimeError('boom'))
+        self.assertEqual(breaker.state, OPEN)
+        self.assertEqual(breaker.times_opened, 2)
+
+    def test_check_does_not_admit_a_trial(self):
+        breaker = open_breaker(open_seconds=0.01)
+        with self.assertRaises(CircuitOpenError):
+            breaker.check()
+        time.sleep(0.02)
+
+        breaker.check()
+        self.assertEqual(breaker.state, OPEN)
+        self.assertTrue(breaker.before_call())
+
+    def test_last_failure_keeps_only_the_exception_type(self):
+        breaker = make_breaker()
+        with self.assertRaises(ValueError):
+            breaker.call(lambda: fail('API key AIza-secret rejected', ValueError))
+        self.assertEqual(breaker.get_state()['last_failure']['error'], 'ValueError')
+
+    def test_stream_failures_count(self):
+        class Model:
+            def stream(self, messages, **kwargs):
+                yield 'partial'
+                raise RuntimeError('connection reset')
+
+        model = CircuitBreakerChatModel(Model(), make_breaker(min_calls=1))
+        with self.assertRaises(RuntimeError):
+            list(model.stream('hello'))
+        self.assertEqual(model.breaker.state, OPEN)
+
+    def test_open_circuit_fails_before_waiting_for_quota(self):
+        breaker = open_breaker()
+        limiter = GeminiRateLimiter(requests_per_minute=1, tokens_per_minute=10 ** 6, max_wait_seconds=30)
+        limiter.acquire()
+
+        class Model:
+            def invoke(self, messages, **kwargs):
+                return 'ok'
+
+        started_at = time.monotonic()
+        with self.assertRaises(CircuitOpenError):
+            RateLimitedChatModel(Model(), limiter, breaker).invoke('hello')
+        self.assertLess(time.monotonic() - started_at, 1)
+
+
+class CircuitBreakerEndpointTests(SimpleTestCase):
+
+    def test_requires_metrics_token(self):
+        with override_settings(METRICS_TOKEN=''):
+            self.assertEqual(self.client.get('/api/circuit-breaker/').status_code, 403)
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/api/circuit-breaker/').status_code, 401)
+            self.assertEqual(
+                self.client.get('/api/circuit-breaker/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401
+            )
+            response = self.client.get('/api/circuit-breaker/', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(get_llm_circuit_breaker().name, response.json()['circuit_breakers'])
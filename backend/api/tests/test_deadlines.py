@@ -0,0 +1,68 @@
+import time
+from django.test import SimpleTestCase, override_settings
+from ..services.deadlines import LLMDeadlineExceeded, call_with_deadline
+from .helpers import ScriptedLLM, ScriptedMultiAgentSystem
+
+
+def fail():
+    raise RuntimeError('boom')
+
+
+@override_settings(LLM_HEDGE_ENABLED=False)
+class CallWithDeadlineTests(SimpleTestCase):
+
+    def test_returns_result(self):
+        self.assertEqual(call_with_deadline('test.fast', lambda: 'ok', 5), 'ok')
+
+    def test_raises_when_deadline_passes(self):
+        with self.assertRaises(LLMDeadlineExceeded):
+            call_with_deadline('test.slow', lambda: time.sleep(0.5), 0.05)
+
+    def test_propagates_errors(self):
+        with self.assertRaises(RuntimeError):
+            call_with_deadline('test.error', fail, 5)
+
+    @override_settings(LLM_HEDGE_ENABLED=True, LLM_HEDGE_MIN_SAMPLES=1, LLM_HEDGE_MIN_DELAY_SECONDS=0.01)
+    def test_hedge_wins_over_a_stuck_call(self):
+        call_with_deadline('test.hedge', lambda: 'warm', 5)
+        attempts = []
+
+        def stuck_once():
+            attempts.append(None)
+            if len(attempts) == 1:
+                time.sleep(0.5)
+                return 'slow'
+            return 'hedged'
+
+        self.assertEqual(call_with_deadline('test.hedge', stuck_once, 5), 'hedged')
+
+    @override_settings(LLM_HEDGE_ENABLED=True, LLM_HEDGE_MIN_SAMPLES=1, LLM_HEDGE_MIN_DELAY_SECONDS=0.01)
+    def test_hedge_needs_admission(self):
+        call_with_deadline('test.hedge_denied', lambda: 'warm', 5)
+        with self.assertRaises(LLMDeadlineExceeded):
+            call_with_deadline('test.hedge_denied', lambda: time.sleep(0.5), 0.1, admit_hedge=lambda: False)
+
+
+@override_settings(DEBATE_DEFAULT_ROUNDS=1, AGGREGATION_MODE='single', REFINE_DEADLINE_SECONDS=0.2)
+class RefinementDeadlineTests(SimpleTestCase):
+
+    def test_agent_missing_the_deadline_is_left_out_of_a_partial_result(self):
+        llm = ScriptedLLM(delays={'Customer': 1})
+
+        started_at = time.monotonic()
+        result = ScriptedMultiAgentSystem(llm, max_parallelism=5).refine_requirements('A budgeting app for students')
+        self.assertLess(time.monotonic() - started_at, 0.8)
+
+        self.assertTrue(result['success'])
+        self.assertTrue(result['partial'])
+        self.assertEqual(result['missing_agents'], [{'agent': 'Customer', 'round': 1}])
+        self.assertEqual(len(result['debate_log']), 4)
+        self.assertNotIn('Customer (Round 1)', llm.prompts('aggregation')[0])
+
+    def test_no_response_before_the_deadline_fails_the_refinement(self):
+        llm = ScriptedLLM(delays={name: 1 for name in ('Business Manager', 'Engineer', 'Designer', 'Customer', 'Product Manager')})
+        result = ScriptedMultiAgentSystem(llm, max_parallelism=5).refine_requirements('A budgeting app for students')
+
+        self.assertFalse(result['success'])
+        self.assertIn('deadline', result['error'])
+        self.assertEqual(llm.prompts('aggregation'), [])
@@ -0,0 +1,141 @@
+import time
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+from .helpers import ScriptedLLM, ScriptedMultiAgentSystem
+
+
+PERSONAS = ['Business Manager', 'Engineer', 'Designer', 'Customer', 'Product Manager']
+
+
+@override_settings(DEBATE_DEFAULT_ROUNDS=1, REFINE_DEADLINE_SECONDS=0, AGGREGATION_MODE='single')
+class ConcurrentDebateTests(SimpleTestCase):
+
+    def test_agents_of_a_round_run_concurrently(self):
+        llm = ScriptedLLM(delays={name: 0.2 for name in PERSONAS})
+        system = ScriptedMultiAgentSystem(llm, max_parallelism=5)
+
+        started_at = time.monotonic()
+        debate_log = system.run_debate(system._personas(), 'A budgeting app for students')
+        self.assertLess(time.monotonic() - started_at, 0.6)
+        self.assertEqual(len(debate_log), 5)
+
+    def test_debate_log_keeps_persona_order(self):
+        # Later personas answer first
+        llm = ScriptedLLM(delays={name: 0.05 * (len(PERSONAS) - position) for position, name in enumerate(PERSONAS)})
+        system = ScriptedMultiAgentSystem(llm, max_parallelism=5)
+
+        debate_log = system.run_debate(system._personas(), 'A budgeting app for students')
+        self.assertEqual([resp['agent'] for resp in debate_log], PERSONAS)
+        self.assertTrue(all(resp['response'].startswith(resp['agent']) for resp in debate_log))
+
+    def test_parallelism_of_one_runs_agents_in_order(self):
+        llm = ScriptedLLM()
+        system = ScriptedMultiAgentSystem(llm, max_parallelism=1)
+
+        system.run_debate(system._personas(), 'A budgeting app for students')
+        self.assertEqual(llm.stages(), PERSONAS)
+
+    def test_failing_agent_does_not_sink_the_round(self):
+        llm = ScriptedLLM(errors={'Designer': ValueError('bad request')})
+        system = ScriptedMultiAgentSystem(llm, max_parallelism=5)
+
+        result = system.refine_requirements('A budgeting app for students')
+        self.assertTrue(result['success'])
+        designer = [resp for resp in result['debate_log'] if resp['agent'] == 'Designer'][0]
+        self.assertIn('Error getting response from Designer', designer['response'])
+
+
+@override_settings(REFINE_DEADLINE_SECONDS=0, AGGREGATION_MODE='single', DEBATE_MAX_ROUNDS=3)
+class MultiRoundDebateTests(SimpleTestCase):
+
+    def setUp(self):
+        self.llm = ScriptedLLM()
+        self.system = ScriptedMultiAgentSystem(self.llm, max_parallelism=5)
+
+    def test_a_single_round_is_the_default(self):
+        # Multi-round debates are opt-in: one round costs 5 agent calls, three cost 15
+        self.assertEqual(settings.DEBATE_DEFAULT_ROUNDS, 1)
+        debate_log = self.system.run_debate(self.system._personas(), 'A budgeting app for students')
+        self.assertEqual({resp['round'] for resp in debate_log}, {1})
+
+    def test_requested_rounds_are_clamped(self):
+        debate_log = self.system.run_debate(self.system._personas(), 'A budgeting app for students', rounds=10)
+        self.assertEqual(len(debate_log), 15)
+        self.assertEqual(max(resp['round'] for resp in debate_log), 3)
+
+        debate_log = self.system.run_debate(self.system._personas(), 'A budgeting app for students', rounds=0)
+        self.assertEqual(len(debate_log), 5)
+
+    def test_later_rounds_see_a_summary_of_earlier_ones(self):
+        self.system.run_debate(self.system._personas(), 'A budgeting app for students', rounds=2)
+
+        first, second = self.llm.prompts('Engineer')
+        self.assertNotIn('Summary of the discussion so far', first)
+        self.assertIn('This is debate round 2', second)
+        self.assertIn('Round 1 - Designer: Designer finds the idea promising.', second)
+
+    @override_settings(DEBATE_TOKEN_BUDGET=1)
+    def test_token_budget_stops_further_rounds(self):
+        debate_log = self.system.run_debate(self.system._personas(), 'A budgeting app for students', rounds=3)
+        self.assertEqual(len(debate_log), 5)
+
+        events = [event for event, _ in self.system.stream_refinement('A budgeting app for students', rounds=3)]
+        self.assertIn('result', events)
+        self.assertEqual(len(self.llm.prompts('Engineer')), 2)
+
+    @override_settings(LLM_CALL_TIMEOUT_SECONDS=0.2)
+    def test_stalled_agent_stream_is_dropped_at_the_call_timeout(self):
+        system = ScriptedMultiAgentSystem(ScriptedLLM(delays={'Designer': 2}), max_parallelism=5)
+
+        started_at = time.monotonic()
+        events = list(system.stream_refinement('A budgeting app for students', rounds=1))
+        self.assertLess(time.monotonic() - started_at, 1.5)
+
+        timeouts = [data['agent'] for event, data in events if event == 'agent_timeout']
+        self.assertEqual(timeouts, ['Designer'])
+        result = events[-1][1]
+        self.assertTrue(result['partial'])
+        self.assertEqual(result['missing_agents'], [{'agent': 'Designer', 'round': 1}])
+        self.assertNotIn('Designer', [resp['agent'] for resp in result['debate_log']])
+
+
+@override_settings(DEBATE_DEFAULT_ROUNDS=1, REFINE_DEADLINE_SECONDS=0, AGGREGATION_MODE='map_reduce', DEBATE_MAX_ROUNDS=3)
+class MapReduceAggregationTests(SimpleTestCase):
+
+    def test_final_round_is_condensed_and_aggregated_from_the_notes(self):
+        llm = ScriptedLLM()
+        result = ScriptedMultiAgentSystem(llm, max_parallelism=5).refine_requirements('A budgeting app for students', rounds=2)
+
+        self.assertEqual(len(llm.prompts('condensation')), 5)
+        final_round = [resp for resp in result['debate_log'] if resp['round'] == 2]
+        self.assertTrue(all(resp['notes'] == 'Condensed notes.' for resp in final_round))
+
+        aggregation_prompt, = llm.prompts('aggregation')
+        self.assertIn('Earlier rounds (summarized)', aggregation_prompt)
+        self.assertIn('Engineer (Round 2, condensed notes):\nCondensed notes.', aggregation_prompt)
+        self.assertNotIn('Engineer (Round 2): Engineer finds', aggregation_prompt)
+
+    def test_failed_condensation_falls_back_to_extractive_notes(self):
+        llm = ScriptedLLM(errors={'condensation': RuntimeError('provider down')})
+        result = ScriptedMultiAgentSystem(llm, max_parallelism=5).refine_requirements('A budgeting app for students')
+
+        self.assertTrue(result['success'])
+        engineer = [resp for resp in result['debate_log'] if resp['agent'] == 'Engineer'][0]
+        self.assertEqual(engineer['notes'], 'Engineer finds the idea promising. Engineer suggests starting with an MVP.')
+
+    def test_streamed_refinement_sends_notes_as_agents_finish(self):
+        system = ScriptedMultiAgentSystem(ScriptedLLM(), max_parallelism=5)
+        events = list(system.stream_refinement('A budgeting app for students'))
+
+        notes = [data['agent'] for event, data in events if event == 'agent_notes']
+        self.assertEqual(sorted(notes), sorted(PERSONAS))
+        self.assertTrue(all(resp['notes'] for resp in events[-1][1]['debate_log']))
+
+    def test_stored_debate_without_notes_is_condensed_before_aggregation(self):
+        llm = ScriptedLLM()
+        system = ScriptedMultiAgentSystem(llm, max_parallelism=5)
+        debate_log = [{'agent': name, 'response': f'{name} likes it.', 'round': 1} for name in PERSONAS]
+
+        system.aggregate_results(system._personas(), 'A budgeting app for students', debate_log)
+        self.assertEqual(len(llm.prompts('condensation')), 5)
+        self.assertIn('condensed notes', llm.prompts('aggregation')[0])
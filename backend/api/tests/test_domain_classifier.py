@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.test import SimpleTestCase
+from ..services.domain_classifier import DomainClassifier, classify_domains, load_taxonomy
+
+
+class DomainClassifierTests(SimpleTestCase):
+
+    def setUp(self):
+        self.classifier = DomainClassifier({
+            'Healthcare': ['health', 'mental health', 'nurse', 'diagnos*'],
+            'Education': ['exam', 'student'],
+            'E-commerce': ['e-commerce', 'online store'],
+        })
+
+    def test_matches_whole_words_and_plurals(self):
+        self.assertEqual(self.classifier.scores('students preparing for exams'), {'Education': 2})
+        self.assertEqual(self.classifier.classify('For example, a habit tracker'), 'General')
+        self.assertEqual(self.classifier.classify('a nursery finder'), 'General')
+
+    def test_stems_match_word_prefixes(self):
+        self.assertEqual(self.classifier.classify('AI diagnostics'), 'Healthcare')
+
+    def test_separators_are_interchangeable(self):
+        self.assertEqual(self.classifier.classify('an e commerce site'), 'E-commerce')
+        self.assertEqual(self.classifier.classify('online_store builder'), 'E-commerce')
+
+    def test_longest_keyword_wins_and_ties_go_to_taxonomy_order(self):
+        self.assertEqual(self.classifier.scores('mental health'), {'Healthcare': 1})
+        self.assertEqual(self.classifier.classify('health exam'), 'Healthcare')
+
+    def test_classify_many_keeps_input_order(self):
+        self.assertEqual(
+            self.classifier.classify_many(['exam practice', 'a habit tracker', 'nurse rota']),
+            ['Education', 'General', 'Healthcare']
+        )
+
+    def test_shipped_taxonomy(self):
+        taxonomy, default = load_taxonomy(settings.DOMAIN_TAXONOMY_PATH)
+        classifier = DomainClassifier(taxonomy, default=default)
+        self.assertEqual(classifier.classify('For example, an app to track habits'), 'General')
+        self.assertEqual(classifier.classify('chatbot for customer support'), 'General')
+        self.assertEqual(classifier.classify('a nursery finder app'), 'General')
+        self.assertEqual(classifier.classify('remote patient monitoring for hospitals'), 'Healthcare')
+
+    def test_process_classifier_uses_the_shipped_taxonomy(self):
+        self.assertEqual(classify_domains(['remote patient monitoring for hospitals', '']), ['Healthcare', 'General'])
@@ -0,0 +1,97 @@
+import json
+from unittest import mock
+from django.test import SimpleTestCase, override_settings
+from .helpers import FakeMongoDBService, ScriptedLLM, ScriptedMultiAgentSystem, sign_in
+
+
+IDEA = 'A budgeting app for students'
+
+DEBATE_LOG = [
+    {'agent': name, 'response': f'{name} thinks a spending tracker comes first.', 'round': 1}
+    for name in ('Business Manager', 'Engineer', 'Designer', 'Customer', 'Product Manager')
+]
+
+
+@override_settings(REFINE_DEADLINE_SECONDS=0, AGGREGATION_MODE='single')
+class FeedbackRoutingTests(SimpleTestCase):
+
+    def setUp(self):
+        self.llm = ScriptedLLM()
+        self.system = ScriptedMultiAgentSystem(self.llm, max_parallelism=5)
+
+    def test_feedback_goes_to_the_personas_it_mentions(self):
+        self.assertEqual(self.system.select_feedback_agents('The pricing feels too high'), ['business_manager'])
+        self.assertEqual(
+            self.system.select_feedback_agents('It must work offline and the onboarding flow is confusing'),
+            ['engineer', 'designer']
+        )
+        self.assertEqual(self.system.select_feedback_agents('Ask the product-manager'), ['product_manager'])
+
+    def test_feedback_naming_no_persona_goes_to_the_default_agents(self):
+        self.assertEqual(self.system.select_feedback_agents('Make it better'), ['product_manager'])
+
+    def test_only_affected_agents_are_asked_again(self):
+        result = self.system.refine_with_feedback(IDEA, DEBATE_LOG, 'It must work offline')
+
+        self.assertTrue(result['success'])
+        self.assertEqual(self.llm.stages(), ['Engineer', 'aggregation'])
+        self.assertEqual(result['rerun_agents'], ['Engineer'])
+        self.assertEqual(result['round'], 2)
+        self.assertEqual([(resp['agent'], resp['round']) for resp in result['debate_log']], [('Engineer', 2)])
+
+        engineer_prompt, = self.llm.prompts('Engineer')
+        self.assertIn('Engineer thinks a spending tracker comes first.', engineer_prompt)
+        self.assertIn('It must work offline', engineer_prompt)
+        # Unchanged agents keep their last response in the final round that is aggregated
+        aggregation_prompt, = self.llm.prompts('aggregation')
+        self.assertIn('Designer (Round 2): Designer thinks a spending tracker comes first.', aggregation_prompt)
+
+    def test_explicit_agents_override_the_routing(self):
+        result = self.system.refine_with_feedback(IDEA, DEBATE_LOG, 'It must work offline', agent_keys=['customer'])
+        self.assertEqual(result['rerun_agents'], ['Customer'])
+
+
+@override_settings(REFINE_DEADLINE_SECONDS=0, AGGREGATION_MODE='single')
+class FeedbackEndpointTests(SimpleTestCase):
+
+    def setUp(self):
+        self.mongodb_service = FakeMongoDBService()
+        self.user_id = self.mongodb_service.user_id
+        self.idea_id = self.mongodb_service.save_idea({'title': IDEA, 'description': IDEA, 'user_id': self.user_id})
+        self.mongodb_service.save_debates(self.idea_id, DEBATE_LOG)
+        self.mongodb_service.save_requirements(self.idea_id, {'raw_text': 'REFINED REQUIREMENTS:\nTracker', 'version': 1})
+        sign_in(self, self.mongodb_service, 'api.views')
+
+        self.llm = ScriptedLLM()
+        system = ScriptedMultiAgentSystem(self.llm, max_parallelism=5)
+        for target in ('api.views.get_multi_agent_system', 'api.services.refinement.get_multi_agent_system'):
+            patcher = mock.patch(target, return_value=system)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def post(self, idea_id, feedback):
+        return self.client.post(
+            f'/api/idea/{idea_id}/feedback/', json.dumps({'feedback': feedback}),
+            content_type='application/json', HTTP_AUTHORIZATION='Bearer token'
+        )
+
+    def test_feedback_is_stored_as_a_new_requirements_version(self):
+        data = self.post(self.idea_id, 'The pricing feels too high').json()
+
+        self.assertEqual(data['version'], 2)
+        self.assertEqual(self.mongodb_service.get_user_credits(self.user_id), 9)
+        requirement = self.mongodb_service.get_latest_requirement(self.idea_id)
+        self.assertEqual((requirement['version'], requirement['feedback']), (2, 'The pricing feels too high'))
+        self.assertEqual(requirement['rerun_agents'], ['Business Manager'])
+        self.assertEqual(self.mongodb_service.get_debate_log(self.idea_id)[-1]['round'], 2)
+
+    def test_failed_iteration_is_refunded(self):
+        with mock.patch.object(ScriptedMultiAgentSystem, 'refine_with_feedback', return_value={'success': False, 'error': 'provider down'}):
+            response = self.post(self.idea_id, 'The pricing feels too high')
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(self.mongodb_service.get_user_credits(self.user_id), 10)
+
+    def test_other_users_idea_is_not_found(self):
+        other_idea = self.mongodb_service.save_idea({'title': IDEA, 'description': IDEA, 'user_id': 'someone-else'})
+        self.assertEqual(self.post(other_idea, 'The pricing feels too high').status_code, 404)
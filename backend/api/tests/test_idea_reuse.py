@@ -0,0 +1,101 @@
+import json
+from unittest import mock
+from django.test import SimpleTestCase
+from ..services.idea_similarity import IdeaSimilarityIndex
+from ..services.rate_limiter import get_rate_limit_stats
+from ..services.refinement import reuse_prior_refinement
+from .helpers import FakeMongoDBService, sign_in
+
+
+IDEA = 'A budgeting app for college students to track spending'
+REPHRASED = 'I want to build a budgeting application for college students that tracks their spending'
+UNRELATED = 'A recipe sharing site for home cooks'
+
+DEBATE_LOG = [
+    {'agent': 'Engineer', 'response': 'Start with manual expense entry.', 'round': 1},
+    {'agent': 'Designer', 'response': 'Keep the dashboard to one screen.', 'round': 1}
+]
+
+
+def seed_refined_idea(mongodb_service, text=IDEA):
+    """Store an idea with a finished debate and requirements, returning its ID"""
+    idea_id = mongodb_service.save_idea({'title': text, 'description': text, 'user_id': mongodb_service.user_id})
+    mongodb_service.save_debates(idea_id, DEBATE_LOG)
+    mongodb_service.save_requirements(idea_id, {
+        'refined_requirements': 'Expense entry', 'trade_offs': 'No bank sync', 'next_steps': 'Prototype',
+        'raw_text': 'REFINED REQUIREMENTS:\nExpense entry', 'version': 1
+    })
+    return idea_id
+
+
+class IdeaSimilarityIndexTests(SimpleTestCase):
+
+    def test_rephrased_idea_scores_above_the_threshold(self):
+        index = IdeaSimilarityIndex()
+        index.add('budget', IDEA)
+        index.add('recipes', UNRELATED)
+
+        self.assertEqual(index.query(REPHRASED, threshold=0.85), [('budget', 1.0)])
+        self.assertEqual(index.query('A fitness tracker for runners', threshold=0.85), [])
+
+    def test_removed_idea_is_no_longer_matched(self):
+        index = IdeaSimilarityIndex()
+        index.add('budget', IDEA)
+        index.remove('budget')
+        self.assertEqual(index.query(IDEA), [])
+        self.assertEqual(len(index), 0)
+
+
+class ReusePriorRefinementTests(SimpleTestCase):
+
+    def setUp(self):
+        self.mongodb_service = FakeMongoDBService()
+        self.user_id = self.mongodb_service.user_id
+        self.source_id = seed_refined_idea(self.mongodb_service)
+
+    def test_near_duplicate_is_saved_as_a_new_idea_linked_to_the_source(self):
+        reused_before = get_rate_limit_stats().get('refinements_reused', 0)
+
+        result = reuse_prior_refinement(self.mongodb_service, self.user_id, REPHRASED)
+
+        self.assertTrue(result['reused'])
+        self.assertEqual(result['reused_from'], self.source_id)
+        self.assertNotEqual(result['idea_id'], self.source_id)
+        self.assertEqual(result['debate_log'], DEBATE_LOG)
+
+        idea = self.mongodb_service.get_idea(result['idea_id'])
+        self.assertEqual(idea['description'], REPHRASED)
+        self.assertEqual(idea['reused_from'], self.source_id)
+        self.assertEqual(self.mongodb_service.get_debate_log(result['idea_id']), DEBATE_LOG)
+        requirement = self.mongodb_service.get_latest_requirement(result['idea_id'])
+        self.assertEqual(requirement['refined_requirements'], 'Expense entry')
+        self.assertEqual(requirement['reused_from'], self.source_id)
+        self.assertEqual(get_rate_limit_stats()['refinements_reused'], reused_before + 1)
+
+    def test_unrelated_idea_is_not_reused(self):
+        self.assertIsNone(reuse_prior_refinement(self.mongodb_service, self.user_id, UNRELATED))
+        self.assertEqual(len(self.mongodb_service.ideas), 1)
+
+    def test_idea_without_stored_requirements_is_skipped(self):
+        self.mongodb_service.requirements.clear()
+        self.assertIsNone(reuse_prior_refinement(self.mongodb_service, self.user_id, REPHRASED))
+
+
+class ReuseEndpointTests(SimpleTestCase):
+
+    def test_near_duplicate_is_answered_without_charging_or_calling_the_llm(self):
+        mongodb_service = FakeMongoDBService()
+        source_id = seed_refined_idea(mongodb_service)
+        sign_in(self, mongodb_service, 'api.views')
+
+        with mock.patch('api.services.refinement.get_multi_agent_system') as get_system:
+            response = self.client.post(
+                '/api/refine/', json.dumps({'idea': REPHRASED}),
+                content_type='application/json', HTTP_AUTHORIZATION='Bearer token'
+            )
+
+        data = response.json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['reused_from'], source_id)
+        self.assertEqual(mongodb_service.get_user_credits(mongodb_service.user_id), 10)
+        get_system.assert_not_called()
@@ -0,0 +1,110 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from unittest import mock
+from django.test import SimpleTestCase, override_settings
+from ..services import insight_refresher
+from ..services.insight_refresher import (
+    INSIGHT_FRESH, INSIGHT_MISSING, INSIGHT_STALE, insight_freshness, refresh_user_insight, schedule_insight_refresh
+)
+from ..services.user_stats import generate_ai_insight
+from .helpers import FakeMongoDBService, use_fake_provider
+
+
+STATS = {'total_ideas': 2, 'domains': {'Healthcare': 2}, 'recent_ideas': ['Nurse scheduling', 'Remote patient monitoring']}
+
+
+def wait_until_idle(user_id, timeout=5):
+    """Wait for a scheduled refresh of user_id to finish"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with insight_refresher._executor_lock:
+            if user_id not in insight_refresher._pending:
+                return
+        time.sleep(0.01)
+    raise AssertionError(f'Insight refresh for {user_id} still pending')
+
+
+@override_settings(INSIGHT_MAX_AGE_SECONDS=3600)
+class InsightFreshnessTests(SimpleTestCase):
+
+    def test_states(self):
+        now = datetime.utcnow()
+        insight = {'ai_insight': 'Keep going', 'total_ideas': 2, 'generated_at': now - timedelta(minutes=5)}
+
+        self.assertEqual(insight_freshness(dict(STATS)), INSIGHT_MISSING)
+        self.assertEqual(insight_freshness(dict(STATS, insight=insight), now), INSIGHT_FRESH)
+        self.assertEqual(insight_freshness(dict(STATS, total_ideas=3, insight=insight), now), INSIGHT_STALE)
+        self.assertEqual(insight_freshness(dict(STATS, insight=insight), now + timedelta(hours=2)), INSIGHT_STALE)
+
+
+@override_settings(LLM_CACHE_ENABLED=False, LLM_HEDGE_ENABLED=False)
+class GenerateInsightTests(SimpleTestCase):
+
+    def test_generated_insight(self):
+        use_fake_provider(self)
+        insight = generate_ai_insight(STATS)
+        self.assertNotIn('fallback', insight)
+        self.assertTrue(insight['ai_insight'])
+        self.assertEqual(len(insight['recommendations']), 4)
+
+    @override_settings(INSIGHT_LLM_TIMEOUT_SECONDS=0.05)
+    def test_slow_llm_gets_the_fallback_at_the_deadline(self):
+        use_fake_provider(self, FAKE_LLM_LATENCY_MS_MEAN=1000)
+
+        started_at = time.monotonic()
+        insight = generate_ai_insight(STATS)
+        self.assertLess(time.monotonic() - started_at, 0.5)
+        self.assertTrue(insight['fallback'])
+
+
+@override_settings(LLM_CACHE_ENABLED=False, LLM_HEDGE_ENABLED=False, INSIGHT_REFRESH_LEASE_SECONDS=120)
+class InsightRefreshTests(SimpleTestCase):
+
+    def setUp(self):
+        self.mongodb_service = FakeMongoDBService()
+        self.user_id = self.mongodb_service.user_id
+        self.mongodb_service.user_stats[self.user_id] = dict(STATS, _id=self.user_id)
+        patcher = mock.patch('api.services.insight_refresher.MongoDBService', return_value=self.mongodb_service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_refresh_stores_the_insight_for_the_current_idea_count(self):
+        use_fake_provider(self)
+        refresh_user_insight(self.user_id)
+
+        insight = self.mongodb_service.get_user_stats(self.user_id)['insight']
+        self.assertEqual(insight['total_ideas'], 2)
+        self.assertEqual(insight_freshness(self.mongodb_service.get_user_stats(self.user_id)), INSIGHT_FRESH)
+
+    def test_refresh_is_skipped_while_another_worker_holds_the_lease(self):
+        self.assertTrue(self.mongodb_service.claim_insight_refresh(self.user_id, 120))
+        with mock.patch('api.services.insight_refresher.generate_ai_insight') as generate:
+            refresh_user_insight(self.user_id)
+        generate.assert_not_called()
+
+    def test_pending_refreshes_are_not_scheduled_twice(self):
+        release = threading.Event()
+        calls = []
+
+        def slow_refresh(user_id):
+            calls.append(user_id)
+            release.wait(5)
+
+        with mock.patch('api.services.insight_refresher.refresh_user_insight', side_effect=slow_refresh):
+            for _ in range(3):
+                schedule_insight_refresh(self.user_id)
+            release.set()
+            wait_until_idle(self.user_id)
+            schedule_insight_refresh(self.user_id)
+            wait_until_idle(self.user_id)
+
+        self.assertEqual(calls, [self.user_id, self.user_id])
+
+    @override_settings(INSIGHT_LLM_TIMEOUT_SECONDS=0.05)
+    def test_timed_out_refresh_keeps_the_old_insight_and_clears_the_pending_entry(self):
+        use_fake_provider(self, FAKE_LLM_LATENCY_MS_MEAN=1000)
+        schedule_insight_refresh(self.user_id)
+        wait_until_idle(self.user_id, timeout=1)
+
+        self.assertNotIn('insight', self.mongodb_service.get_user_stats(self.user_id))
@@ -0,0 +1,117 @@
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+from unittest import mock
+from django.test import SimpleTestCase
+from ..services.job_queue import JOB_FAILED, JOB_QUEUED, JOB_SUCCEEDED, SQLiteJobQueue, execute_refinement_job, recover_stale_jobs
+from .helpers import FakeMongoDBService
+
+
+class RefinementJobTests(SimpleTestCase):
+
+    def setUp(self):
+        self.mongodb_service = FakeMongoDBService()
+        self.user_id = self.mongodb_service.user_id
+        patcher = mock.patch('api.services.job_queue.MongoDBService', return_value=self.mongodb_service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def submit(self):
+        """Charge for and create a queued job, as the submit endpoint does"""
+        self.mongodb_service.deduct_credits(self.user_id, 2)
+        return self.mongodb_service.create_refinement_job({
+            'user_id': self.user_id, 'idea': 'A budgeting app for students', 'status': JOB_QUEUED
+        })
+
+    def expire_lease(self, job_id):
+        self.mongodb_service.jobs[job_id]['lease_expires_at'] = datetime.utcnow() - timedelta(seconds=1)
+
+    def credits(self):
+        return self.mongodb_service.get_user_credits(self.user_id)
+
+    def test_successful_job_keeps_the_charge(self):
+        job_id = self.submit()
+        with mock.patch('api.services.job_queue.run_refinement', return_value={'success': True, 'idea_id': 'idea'}):
+            execute_refinement_job(job_id)
+
+        job = self.mongodb_service.get_refinement_job(job_id)
+        self.assertEqual(job['status'], JOB_SUCCEEDED)
+        self.assertEqual(job['result']['idea_id'], 'idea')
+        self.assertEqual(self.credits(), 8)
+
+    def test_failed_job_is_refunded(self):
+        job_id = self.submit()
+        with mock.patch('api.services.job_queue.run_refinement', side_effect=RuntimeError('provider down')):
+            execute_refinement_job(job_id)
+
+        job = self.mongodb_service.get_refinement_job(job_id)
+        self.assertEqual(job['status'], JOB_FAILED)
+        self.assertEqual(job['error'], 'provider down')
+        self.assertEqual(self.credits(), 10)
+
+    def test_expired_lease_is_failed_and_refunded_once(self):
+        job_id = self.submit()
+        self.mongodb_service.claim_refinement_job(job_id, lease_seconds=600)
+        self.assertEqual(recover_stale_jobs(), 0)
+
+        self.expire_lease(job_id)
+        self.assertEqual(recover_stale_jobs(), 1)
+        self.assertEqual(recover_stale_jobs(), 0)
+
+        self.assertEqual(self.mongodb_service.get_refinement_job(job_id)['status'], JOB_FAILED)
+        self.assertEqual(self.credits(), 10)
+
+    def test_worker_finishing_after_its_lease_was_recovered_does_not_refund_again(self):
+        job_id = self.submit()
+
+        def refinement_outlives_its_lease(*args, **kwargs):
+            self.expire_lease(job_id)
+            recover_stale_jobs()
+            return {'success': False, 'error': 'provider down'}
+
+        with mock.patch('api.services.job_queue.run_refinement', side_effect=refinement_outlives_its_lease):
+            execute_refinement_job(job_id)
+
+        job = self.mongodb_service.get_refinement_job(job_id)
+        self.assertEqual(job['status'], JOB_FAILED)
+        self.assertIn('interrupted', job['error'])
+        self.assertEqual(self.credits(), 10)
+
+    def test_job_claimed_elsewhere_is_not_run_twice(self):
+        job_id = self.submit()
+        self.mongodb_service.claim_refinement_job(job_id, lease_seconds=600)
+        with mock.patch('api.services.job_queue.run_refinement') as run_refinement:
+            execute_refinement_job(job_id)
+        run_refinement.assert_not_called()
+
+
+class SQLiteJobQueueTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        # No worker threads: claims are driven by the test
+        self.queue = SQLiteJobQueue(max_workers=0, path=os.path.join(directory, 'jobs.sqlite3'))
+        self.connection = self.queue._connect()
+        self.addCleanup(self.connection.close)
+
+    def test_jobs_are_claimed_oldest_first_and_once(self):
+        self.queue.submit('first')
+        time.sleep(0.01)
+        self.queue.submit('second')
+        self.queue.submit('first')
+
+        self.assertEqual(self.queue._claim(self.connection, 'worker-a'), 'first')
+        self.assertEqual(self.queue._claim(self.connection, 'worker-b'), 'second')
+        self.assertIsNone(self.queue._claim(self.connection, 'worker-a'))
+
+    def test_claim_of_a_dead_worker_is_released(self):
+        self.queue.submit('job')
+        self.assertEqual(self.queue._claim(self.connection, 'worker-a'), 'job')
+        self.assertIsNone(self.queue._claim(self.connection, 'worker-b'))
+
+        self.connection.execute("UPDATE refinement_jobs SET claimed_at = claimed_at - 3600")
+        with self.settings(REFINE_JOB_LEASE_SECONDS=600):
+            self.assertEqual(self.queue._claim(self.connection, 'worker-b'), 'job')
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+from unittest import mock
+from django.test import SimpleTestCase, override_settings
+from ..services.llm_cache import LLMResponseCache, make_cache_key
+from .helpers import ScriptedLLM, ScriptedMultiAgentSystem
+
+
+class LLMResponseCacheTests(SimpleTestCase):
+
+    def test_cache_key_ignores_case_and_whitespace_of_the_idea(self):
+        self.assertEqual(
+            make_cache_key('agent', 'A  budgeting app\n', 'engineer', 'v1', 'model', 0.7),
+            make_cache_key('agent', 'a budgeting APP', 'engineer', 'v1', 'model', 0.7)
+        )
+        self.assertNotEqual(
+            make_cache_key('agent', 'a budgeting app', 'engineer', 'v1', 'model', 0.7),
+            make_cache_key('agent', 'a budgeting app', 'engineer', 'v2', 'model', 0.7)
+        )
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = LLMResponseCache(max_entries=2, use_mongo=False)
+        cache.set('a', 'first')
+        cache.set('b', 'second')
+        cache.get('a')
+        cache.set('c', 'third')
+
+        self.assertEqual(cache.get('a'), 'first')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 'third')
+
+    def test_expired_entry_is_a_miss(self):
+        cache = LLMResponseCache(ttl_seconds=60, use_mongo=False)
+        cache.set('a', 'first')
+        later = datetime.utcnow() + timedelta(seconds=61)
+        with mock.patch('api.services.llm_cache.datetime') as clock:
+            clock.utcnow.return_value = later
+            self.assertIsNone(cache.get('a'))
+
+        stats = cache.get_stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['memory_entries'], 0)
+
+
+@override_settings(DEBATE_DEFAULT_ROUNDS=1, REFINE_DEADLINE_SECONDS=0, AGGREGATION_MODE='single')
+class CachedRefinementTests(SimpleTestCase):
+
+    def test_repeated_idea_is_answered_from_the_cache(self):
+        cache = LLMResponseCache(use_mongo=False)
+        first = ScriptedLLM()
+        ScriptedMultiAgentSystem(first, cache=cache).refine_requirements('A budgeting app for students')
+        self.assertEqual(len(first.calls), 6)
+
+        second = ScriptedLLM()
+        result = ScriptedMultiAgentSystem(second, cache=cache).refine_requirements('a budgeting app  for STUDENTS')
+        self.assertTrue(result['success'])
+        self.assertEqual(second.calls, [])
+        self.assertEqual(cache.get_stats()['memory_hits'], 6)
+
+    def test_failed_agent_call_is_not_cached(self):
+        cache = LLMResponseCache(use_mongo=False)
+        failing = ScriptedLLM(errors={'Engineer': ValueError('bad request')})
+        ScriptedMultiAgentSystem(failing, cache=cache).refine_requirements('A budgeting app for students')
+
+        retry = ScriptedLLM()
+        ScriptedMultiAgentSystem(retry, cache=cache).refine_requirements('A budgeting app for students')
+        self.assertIn('Engineer', retry.stages())
+        self.assertNotIn('Designer', retry.stages())
@@ -0,0 +1,53 @@
+import os
+import shutil
+import tempfile
+from django.test import SimpleTestCase, override_settings
+from ..services.llm_cassettes import CassetteMissError, CassetteRecordProvider, CassetteReplayProvider
+
+
+class CassetteTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings_override = override_settings(
+            LLM_CASSETTE_PATH=os.path.join(directory, 'cassette.jsonl'),
+            LLM_CASSETTE_RECORD_PROVIDER='fake',
+            LLM_CASSETTE_KEEP_LATENCY=False,
+            FAKE_LLM_LATENCY_DISTRIBUTION='fixed',
+            FAKE_LLM_LATENCY_MS_MEAN=0,
+            FAKE_LLM_ERROR_RATE=0,
+            FAKE_LLM_RATE_LIMIT_RATE=0
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_recorded_calls_replay_offline(self):
+        recorder = CassetteRecordProvider().create_chat_model('gemini-1.5-flash', 0.7)
+        answer = recorder.invoke('Describe a budgeting app').content
+        streamed = [chunk.content for chunk in recorder.stream('Describe a recipe site')]
+
+        replay = CassetteReplayProvider().create_chat_model('gemini-1.5-flash', 0.7)
+        self.assertEqual(replay.invoke('Describe a budgeting app').content, answer)
+        self.assertEqual([chunk.content for chunk in replay.stream('Describe a recipe site')], streamed)
+
+    def test_unrecorded_prompt_fails_instead_of_calling_out(self):
+        CassetteRecordProvider().create_chat_model('gemini-1.5-flash', 0.7).invoke('Describe a budgeting app')
+        replay = CassetteReplayProvider().create_chat_model('gemini-1.5-flash', 0.7)
+
+        with self.assertRaises(CassetteMissError):
+            replay.invoke('Describe a recipe site')
+        # Same prompt, different model settings: a different request
+        with self.assertRaises(CassetteMissError):
+            CassetteReplayProvider().create_chat_model('gemini-1.5-flash', 0.2).invoke('Describe a budgeting app')
+
+    def test_replays_cycle_through_repeated_recordings(self):
+        recorder = CassetteRecordProvider().create_chat_model('gemini-1.5-flash', 0.7)
+        recorder.invoke('Describe a budgeting app')
+        recorder.invoke('Describe a budgeting app')
+
+        replay = CassetteReplayProvider()
+        self.assertEqual(len(replay.cassette), 2)
+        model = replay.create_chat_model('gemini-1.5-flash', 0.7)
+        for _ in range(3):
+            model.invoke('Describe a budgeting app')
@@ -0,0 +1,31 @@
+import os
+from django.test import SimpleTestCase
+from ..services import llm_clients
+from ..services.llm_clients import get_client_stats, get_llm
+from .helpers import use_fake_provider
+
+
+class SharedClientTests(SimpleTestCase):
+
+    def setUp(self):
+        use_fake_provider(self)
+
+    def test_clients_are_shared_per_model_and_temperature(self):
+        client = get_llm('gemini-2.0-flash', 0.7)
+        self.assertIs(get_llm('gemini-2.0-flash', 0.7), client)
+        self.assertIsNot(get_llm('gemini-2.0-flash', 0.3), client)
+
+        stats = get_client_stats()
+        self.assertEqual(stats['pid'], os.getpid())
+        self.assertEqual(stats['provider'], 'fake')
+        self.assertEqual(len(stats['clients']), 2)
+
+    def test_clients_inherited_through_a_fork_are_replaced(self):
+        client = get_llm('gemini-2.0-flash', 0.7)
+        llm_clients._clients_pid = -1
+
+        self.assertIsNot(get_llm('gemini-2.0-flash', 0.7), client)
+        self.assertEqual(get_client_stats()['pid'], os.getpid())
+
+    def test_shared_client_answers(self):
+        self.assertTrue(get_llm('gemini-2.0-flash', 0.7).invoke('Say hello').content)
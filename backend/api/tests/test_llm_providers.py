@@ -0,0 +1,61 @@
+import time
+from django.test import SimpleTestCase, override_settings
+from ..services.llm_providers import FakeLLMError, FakeProvider, FakeRateLimitError, create_llm_provider
+from ..services.prd_schema import parse_prd
+from ..services.rate_limiter import is_rate_limit_error
+
+
+def fake_model(**overrides):
+    config = dict(latency_distribution='fixed', latency_ms_mean=0, error_rate=0, rate_limit_rate=0)
+    config.update(overrides)
+    return FakeProvider(**config).create_chat_model('gemini-1.5-flash', 0.7)
+
+
+class FakeProviderTests(SimpleTestCase):
+
+    def test_replies_depend_only_on_the_prompt(self):
+        first = fake_model().invoke('Describe a budgeting app').content
+        self.assertEqual(fake_model().invoke('Describe a budgeting app').content, first)
+        self.assertNotEqual(fake_model().invoke('Describe a recipe site').content, first)
+
+    def test_seed_changes_the_replies(self):
+        self.assertNotEqual(
+            fake_model(seed=1).invoke('Describe a budgeting app').content,
+            fake_model(seed=2).invoke('Describe a budgeting app').content
+        )
+
+    def test_stream_chunks_add_up_to_the_reply(self):
+        # Output length is drawn per call; fix it so both calls produce the same text
+        model = fake_model(output_tokens_stddev=0)
+        chunks = [chunk.content for chunk in model.stream('Describe a budgeting app')]
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(''.join(chunks), model.invoke('Describe a budgeting app').content)
+
+    def test_injected_failures(self):
+        with self.assertRaises(FakeRateLimitError) as raised:
+            fake_model(rate_limit_rate=1).invoke('hello')
+        self.assertTrue(is_rate_limit_error(raised.exception))
+
+        with self.assertRaises(FakeLLMError) as raised:
+            fake_model(error_rate=1).invoke('hello')
+        self.assertFalse(is_rate_limit_error(raised.exception))
+
+    def test_latency_is_applied(self):
+        started_at = time.monotonic()
+        fake_model(latency_ms_mean=50).invoke('hello')
+        self.assertGreaterEqual(time.monotonic() - started_at, 0.05)
+
+    def test_prd_prompts_get_a_parseable_prd(self):
+        prd = parse_prd(fake_model().invoke('Reply with JSON: {"refined_requirements": [...]}').content)
+        self.assertEqual(len(prd['refined_requirements']), 6)
+        self.assertEqual(len(prd['next_steps']), 4)
+
+
+class CreateProviderTests(SimpleTestCase):
+
+    @override_settings(LLM_PROVIDER='fake')
+    def test_short_name_from_settings(self):
+        self.assertIsInstance(create_llm_provider(), FakeProvider)
+
+    def test_dotted_class_path(self):
+        self.assertIsInstance(create_llm_provider('api.services.llm_providers.FakeProvider'), FakeProvider)
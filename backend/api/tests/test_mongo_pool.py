@@ -0,0 +1,62 @@
+from unittest import mock
+from django.test import SimpleTestCase, override_settings
+from ..services import mongodb_service
+from ..services.mongodb_service import ConnectionPoolStats, MongoDBService, get_mongo_client, get_mongo_pool_stats
+
+
+@override_settings(MONGODB_MAX_POOL_SIZE=20, MONGODB_MIN_POOL_SIZE=2)
+class SharedMongoClientTests(SimpleTestCase):
+
+    def setUp(self):
+        self.reset_client()
+        self.addCleanup(self.reset_client)
+        patcher = mock.patch('api.services.mongodb_service.MongoClient')
+        self.client_class = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client_class.side_effect = lambda *args, **kwargs: mock.MagicMock()
+
+    def reset_client(self):
+        mongodb_service._client = mongodb_service._client_pid = mongodb_service._pool_stats = None
+
+    def test_services_share_one_pooled_client(self):
+        first, second = MongoDBService(), MongoDBService()
+
+        self.assertIs(first.client, second.client)
+        self.client_class.assert_called_once()
+        options = self.client_class.call_args.kwargs
+        self.assertEqual((options['maxPoolSize'], options['minPoolSize']), (20, 2))
+        self.assertIsInstance(options['event_listeners'][0], ConnectionPoolStats)
+
+    def test_client_inherited_through_a_fork_is_replaced(self):
+        client = get_mongo_client()
+        mongodb_service._client_pid = -1
+
+        self.assertIsNot(get_mongo_client(), client)
+        self.assertEqual(self.client_class.call_count, 2)
+
+    def test_failed_connection_is_not_kept(self):
+        unreachable = mock.MagicMock()
+        unreachable.admin.command.side_effect = RuntimeError('no server')
+        self.client_class.side_effect = [unreachable, mock.MagicMock()]
+        with self.assertRaises(Exception):
+            get_mongo_client()
+        self.assertEqual(get_mongo_pool_stats(), {'connected': False})
+
+        get_mongo_client()
+        self.assertTrue(get_mongo_pool_stats()['connected'])
+
+    def test_pool_stats_follow_pool_events(self):
+        get_mongo_client()
+        listener = self.client_class.call_args.kwargs['event_listeners'][0]
+        for _ in range(3):
+            listener.connection_created(None)
+        listener.connection_closed(None)
+        listener.connection_checked_out(None)
+        listener.connection_checked_out(None)
+        listener.connection_checked_in(None)
+        listener.connection_check_out_failed(None)
+
+        stats = get_mongo_pool_stats()
+        self.assertEqual(stats['open_connections'], 2)
+        self.assertEqual((stats['checkouts'], stats['checked_out'], stats['checkout_failures']), (2, 1, 1))
+        self.assertEqual(stats['max_pool_size'], 20)
@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+import yaml
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+from ..services.persona_registry import PersonaRegistry, PersonaRegistrySnapshot
+from .helpers import ScriptedLLM, ScriptedMultiAgentSystem
+
+
+class PersonaRegistryTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'personas.yaml')
+        shutil.copy(settings.PERSONA_REGISTRY_PATH, self.path)
+        self.registry = PersonaRegistry(self.path, reload_interval=0)
+
+    def edit(self, update):
+        """Rewrite the registry file and move its mtime forward so the change is noticed"""
+        with open(self.path) as registry_file:
+            text = registry_file.read()
+        with open(self.path, 'w') as registry_file:
+            registry_file.write(update(text))
+        mtime = os.path.getmtime(self.path) + 10
+        os.utime(self.path, (mtime, mtime))
+
+    def test_edited_file_is_picked_up(self):
+        before = self.registry.snapshot()
+        self.edit(lambda text: text.replace('name: Engineer', 'name: Architect'))
+
+        after = self.registry.snapshot()
+        self.assertEqual(after.agents['engineer']['name'], 'Architect')
+        self.assertNotEqual(after.version, before.version)
+        self.assertEqual(before.agents['engineer']['name'], 'Engineer')
+
+    def test_invalid_edit_keeps_the_last_good_registry(self):
+        before = self.registry.snapshot()
+        self.edit(lambda text: text + '\nagents: [unclosed\n')
+
+        self.assertIs(self.registry.snapshot(), before)
+
+    def test_unchanged_file_is_not_reloaded(self):
+        self.assertIs(self.registry.snapshot(), self.registry.snapshot())
+
+
+class RegistryDouble:
+    """Registry whose snapshot() moves through a fixed sequence of snapshots, as if edited between calls"""
+
+    def __init__(self, snapshots):
+        self.snapshots = list(snapshots)
+
+    def snapshot(self):
+        return self.snapshots.pop(0) if len(self.snapshots) > 1 else self.snapshots[0]
+
+
+@override_settings(DEBATE_DEFAULT_ROUNDS=1, REFINE_DEADLINE_SECONDS=0, AGGREGATION_MODE='single')
+class SnapshotPerRefinementTests(SimpleTestCase):
+
+    def test_reload_during_a_refinement_does_not_change_its_personas(self):
+        with open(settings.PERSONA_REGISTRY_PATH) as registry_file:
+            data = yaml.safe_load(registry_file)
+        original = PersonaRegistrySnapshot(data, 'a' * 64)
+        data['agents']['engineer']['name'] = 'Architect'
+        edited = PersonaRegistrySnapshot(data, 'b' * 64)
+
+        llm = ScriptedLLM()
+        with mock.patch('api.services.multi_agent.get_persona_registry', return_value=RegistryDouble([original, edited])):
+            result = ScriptedMultiAgentSystem(llm).refine_requirements('A budgeting app for students')
+
+        self.assertIn('Engineer', llm.stages())
+        self.assertNotIn('Architect', llm.stages())
+        self.assertIn('Engineer', [resp['agent'] for resp in result['debate_log']])
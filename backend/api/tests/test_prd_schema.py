@@ -0,0 +1,65 @@
+from django.test import SimpleTestCase, override_settings
+from ..services.prd_schema import parse_prd, render_prd_text
+from ..services.refinement import build_requirements_data
+from .helpers import ScriptedLLM, ScriptedMultiAgentSystem
+
+
+class PRDSchemaTests(SimpleTestCase):
+
+    def test_parses_fenced_json(self):
+        prd = parse_prd('```json\n{"refined_requirements": [{"title": "Login", "priority": "High"}],'
+                        ' "trade_offs": [], "next_steps": [{"title": "Prototype", "timeline": "2 weeks"}]}\n```')
+        self.assertEqual(prd['refined_requirements'], [{'title': 'Login', 'description': '', 'priority': 'high'}])
+        self.assertEqual(prd['next_steps'][0]['timeline'], '2 weeks')
+
+    def test_schema_slips_do_not_reject_the_document(self):
+        prd = parse_prd('{"refined_requirements": [{"title": "Login", "priority": "critical"}, {"title": ""},'
+                        ' "Offline mode", {"title": 3, "description": null}], "next_steps": null}')
+        self.assertEqual(
+            [(item['title'], item['priority']) for item in prd['refined_requirements']],
+            [('Login', 'medium'), ('Offline mode', 'medium'), ('3', 'medium')]
+        )
+        self.assertEqual(prd['trade_offs'], [])
+        self.assertEqual(prd['next_steps'], [])
+
+    def test_replies_without_json_are_unstructured(self):
+        self.assertIsNone(parse_prd('REFINED REQUIREMENTS:\n1. Login'))
+        self.assertIsNone(parse_prd('[1, 2]'))
+
+    def test_rendered_text_keeps_section_headings(self):
+        text = render_prd_text(parse_prd('{"refined_requirements": [{"title": "Login", "description": "OAuth"}]}'))
+        self.assertIn('REFINED REQUIREMENTS:\n1. Login (Medium priority): OAuth', text)
+        self.assertIn('TRADE-OFFS:', text)
+        self.assertIn('NEXT STEPS:', text)
+
+
+class StoredRequirementsTests(SimpleTestCase):
+
+    def test_structured_prd_is_stored_as_items_and_rendered_sections(self):
+        structured = parse_prd('{"refined_requirements": [{"title": "Login", "description": "OAuth"}],'
+                               ' "next_steps": [{"title": "Prototype", "timeline": "2 weeks"}]}')
+        requirements = build_requirements_data(render_prd_text(structured), structured=structured)
+
+        self.assertEqual(requirements['structured'], structured)
+        self.assertIn('Login', requirements['refined_requirements'])
+        self.assertIn('Prototype', requirements['next_steps'])
+        self.assertEqual(requirements['version'], 1)
+
+    def test_unstructured_reply_is_split_on_its_headings(self):
+        requirements = build_requirements_data('REFINED REQUIREMENTS:\n1. Login\nTRADE-OFFS:\nNo SSO\nNEXT STEPS:\nShip')
+        self.assertNotIn('structured', requirements)
+        self.assertEqual(
+            (requirements['refined_requirements'], requirements['trade_offs'], requirements['next_steps']),
+            ('1. Login', 'No SSO', 'Ship')
+        )
+
+
+@override_settings(DEBATE_DEFAULT_ROUNDS=1, REFINE_DEADLINE_SECONDS=0, AGGREGATION_MODE='single')
+class StructuredRefinementTests(SimpleTestCase):
+
+    def test_json_aggregation_reply_becomes_a_structured_prd(self):
+        result = ScriptedMultiAgentSystem(ScriptedLLM()).refine_requirements('A budgeting app for students')
+
+        self.assertEqual(result['structured_requirements']['refined_requirements'][0]['title'], 'Core flow')
+        self.assertTrue(result['refined_requirements'].startswith('REFINED REQUIREMENTS:'))
+        self.assertIn('Prototype', result['refined_requirements'])
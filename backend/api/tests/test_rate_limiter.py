@@ -0,0 +1,103 @@
+from django.test import SimpleTestCase, override_settings
+from ..services.circuit_breaker import CircuitOpenError
+from ..services.llm_providers import FakeLLMMessage
+from ..services.rate_limiter import (
+    GeminiRateLimiter, RateLimitedChatModel, RateLimitExceeded, TokenBucket, call_with_retry, is_rate_limit_error
+)
+
+
+def fail_open():
+    raise CircuitOpenError('test', 5)
+
+
+class TokenBucketTests(SimpleTestCase):
+
+    def test_wait_time_and_refill(self):
+        bucket = TokenBucket(capacity=10, refill_per_second=2)
+        self.assertEqual(bucket.wait_time(10), 0)
+        bucket.take(10)
+        self.assertEqual(bucket.wait_time(4), 2)
+
+        bucket.refill(bucket.updated_at + 1)
+        self.assertEqual(bucket.tokens, 2)
+        bucket.refill(bucket.updated_at + 100)
+        self.assertEqual(bucket.tokens, 10)
+
+    def test_requests_above_capacity_are_capped(self):
+        bucket = TokenBucket(capacity=10, refill_per_second=1)
+        self.assertEqual(bucket.wait_time(50), 0)
+        bucket.take(50)
+        self.assertEqual(bucket.tokens, 0)
+
+
+class RateLimiterTests(SimpleTestCase):
+
+    def test_acquire_gives_up_after_max_wait(self):
+        limiter = GeminiRateLimiter(requests_per_minute=1, tokens_per_minute=10 ** 6, max_wait_seconds=0)
+        limiter.acquire()
+        with self.assertRaises(RateLimitExceeded):
+            limiter.acquire()
+
+    def test_try_acquire_never_waits(self):
+        limiter = GeminiRateLimiter(requests_per_minute=1, tokens_per_minute=10 ** 6)
+        self.assertTrue(limiter.try_acquire())
+        self.assertFalse(limiter.try_acquire())
+
+    def test_quota_errors_are_recognised(self):
+        self.assertTrue(is_rate_limit_error(RuntimeError('429 Resource has been exhausted (e.g. check quota).')))
+        self.assertFalse(is_rate_limit_error(RuntimeError('400 invalid argument')))
+
+
+@override_settings(GEMINI_MAX_RETRIES=2, GEMINI_RETRY_BASE_DELAY=0, GEMINI_RETRY_MAX_DELAY=0)
+class CallWithRetryTests(SimpleTestCase):
+
+    def setUp(self):
+        self.limiter = GeminiRateLimiter(requests_per_minute=10 ** 6, tokens_per_minute=10 ** 9)
+        self.calls = 0
+
+    def flaky(self, failures, message='429 quota exceeded'):
+        def func():
+            self.calls += 1
+            if self.calls <= failures:
+                raise RuntimeError(message)
+            return 'ok'
+        return func
+
+    def test_retries_rate_limit_errors(self):
+        self.assertEqual(call_with_retry(self.limiter, self.flaky(2)), 'ok')
+        self.assertEqual(self.calls, 3)
+
+    def test_gives_up_after_max_retries(self):
+        with self.assertRaises(RuntimeError):
+            call_with_retry(self.limiter, self.flaky(3))
+        self.assertEqual(self.calls, 3)
+
+    def test_other_errors_are_not_retried(self):
+        with self.assertRaises(RuntimeError):
+            call_with_retry(self.limiter, self.flaky(1, 'invalid argument'))
+        self.assertEqual(self.calls, 1)
+
+    def test_before_acquire_can_abandon_the_call(self):
+        with self.assertRaises(CircuitOpenError):
+            call_with_retry(self.limiter, self.flaky(0), before_acquire=fail_open)
+        self.assertEqual(self.calls, 0)
+
+
+@override_settings(GEMINI_MAX_RETRIES=2, GEMINI_RETRY_BASE_DELAY=0, GEMINI_RETRY_MAX_DELAY=0)
+class RateLimitedChatModelTests(SimpleTestCase):
+
+    def test_stream_retries_a_quota_error_before_the_first_chunk(self):
+        attempts = []
+
+        class Model:
+            def stream(self, messages, **kwargs):
+                attempts.append(None)
+                if len(attempts) == 1:
+                    raise RuntimeError('429 quota exceeded')
+                yield FakeLLMMessage('Hello')
+                yield FakeLLMMessage(' world')
+
+        limiter = GeminiRateLimiter(requests_per_minute=10 ** 6, tokens_per_minute=10 ** 9)
+        chunks = [chunk.content for chunk in RateLimitedChatModel(Model(), limiter).stream('hi')]
+        self.assertEqual(chunks, ['Hello', ' world'])
+        self.assertEqual(len(attempts), 2)
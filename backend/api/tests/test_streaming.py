@@ -0,0 +1,77 @@
+import json
+from unittest import mock
+from django.test import SimpleTestCase, override_settings
+from .helpers import FakeMongoDBService, ScriptedLLM, ScriptedMultiAgentSystem, sign_in
+
+
+def parse_events(chunks):
+    """(event, data) pairs of a Server-Sent Events body"""
+    events = []
+    for message in b''.join(chunks).decode('utf-8').split('\n\n'):
+        if not message.strip():
+            continue
+        event, data = message.split('\n', 1)
+        events.append((event[len('event: '):], json.loads(data[len('data: '):])))
+    return events
+
+
+@override_settings(DEBATE_DEFAULT_ROUNDS=1, REFINE_DEADLINE_SECONDS=0, AGGREGATION_MODE='single')
+class RefinementStreamTests(SimpleTestCase):
+
+    def setUp(self):
+        self.mongodb_service = FakeMongoDBService()
+        self.user_id = self.mongodb_service.user_id
+        sign_in(self, self.mongodb_service, 'api.views')
+        self.llm = ScriptedLLM()
+        patcher = mock.patch('api.views.get_multi_agent_system', return_value=ScriptedMultiAgentSystem(self.llm))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, idea='A budgeting app for students'):
+        return self.client.post(
+            '/api/refine/stream/', json.dumps({'idea': idea}),
+            content_type='application/json', HTTP_AUTHORIZATION='Bearer token'
+        )
+
+    def test_streams_agent_responses_and_finishes_with_the_result(self):
+        response = self.post()
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = parse_events(response.streaming_content)
+        response.close()
+
+        names = [event for event, _ in events]
+        self.assertEqual(names[0], 'idea')
+        self.assertEqual(names[-1], 'done')
+        self.assertEqual(names.count('agent_done'), 5)
+        self.assertLess(names.index('agent_token'), names.index('agent_done'))
+        self.assertLess(names.index('prd'), names.index('done'))
+
+        idea_id = events[0][1]['idea_id']
+        done = events[-1][1]
+        self.assertTrue(done['success'])
+        self.assertEqual(done['idea_id'], idea_id)
+        self.assertEqual(len(self.mongodb_service.debates[idea_id]), 5)
+        self.assertEqual(self.mongodb_service.get_user_credits(self.user_id), 8)
+
+    def test_client_leaving_before_the_body_is_read_refunds_credits(self):
+        response = self.post()
+        self.assertEqual(self.mongodb_service.get_user_credits(self.user_id), 8)
+
+        response.close()
+        self.assertEqual(self.mongodb_service.get_user_credits(self.user_id), 10)
+        self.assertEqual(self.llm.calls, [])
+
+    def test_failed_refinement_sends_an_error_event_and_refunds(self):
+        with mock.patch.object(ScriptedMultiAgentSystem, 'stream_refinement', side_effect=RuntimeError('provider down')):
+            response = self.post()
+            events = parse_events(response.streaming_content)
+            response.close()
+
+        self.assertEqual(events[-1], ('error', {'success': False, 'error': 'provider down'}))
+        self.assertEqual(self.mongodb_service.get_user_credits(self.user_id), 10)
+
+    def test_insufficient_credits_is_rejected_before_streaming(self):
+        self.mongodb_service.users[self.user_id]['credits'] = 1
+        response = self.post()
+        self.assertEqual(response.status_code, 402)
+        self.assertEqual(self.llm.calls, [])
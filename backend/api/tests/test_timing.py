@@ -0,0 +1,93 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.test import SimpleTestCase, override_settings
+from ..services.timing import (
+    LatencyHistogram, bind_request_timing, end_request_timing, get_stage_histograms, observe_stage,
+    render_prometheus, span, start_request_timing
+)
+
+
+class RequestTimingTests(SimpleTestCase):
+
+    def setUp(self):
+        self.timing, token = start_request_timing()
+        self.addCleanup(end_request_timing, token)
+
+    def test_spans_are_recorded_in_order_with_attributes(self):
+        with span('auth.verify'):
+            pass
+        with span('agent', agent='Engineer'):
+            time.sleep(0.01)
+
+        names = [recorded['name'] for recorded in self.timing.to_list()]
+        self.assertEqual(names, ['auth.verify', 'agent'])
+        agent = self.timing.to_list()[1]
+        self.assertEqual(agent['attributes'], {'agent': 'Engineer'})
+        self.assertGreaterEqual(agent['duration_ms'], 10)
+
+    def test_server_timing_header_sums_repeated_stages(self):
+        self.timing.record('agent', self.timing.started_at, 0.010)
+        self.timing.record('agent', self.timing.started_at, 0.015)
+        self.timing.record('aggregation', self.timing.started_at, 0.005)
+
+        header = self.timing.server_timing_header()
+        self.assertTrue(header.startswith('agent;dur=25.0, aggregation;dur=5.0, total;dur='))
+
+    def test_pool_threads_record_into_the_callers_timing(self):
+        def work():
+            with span('pooled'):
+                pass
+
+        bound = bind_request_timing(work)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            for future in [executor.submit(bound) for _ in range(3)]:
+                future.result()
+        self.assertEqual([recorded['name'] for recorded in self.timing.to_list()], ['pooled'] * 3)
+
+
+class StageHistogramTests(SimpleTestCase):
+
+    def test_buckets_are_cumulative(self):
+        histogram = LatencyHistogram()
+        for duration_ms in (3, 7, 7, 70000):
+            histogram.observe(duration_ms)
+
+        buckets = dict(histogram.cumulative())
+        self.assertEqual(buckets[5], 1)
+        self.assertEqual(buckets[10], 3)
+        self.assertEqual(buckets[60000], 3)
+        self.assertEqual(buckets['+Inf'], 4)
+
+    def test_stages_are_exported(self):
+        observe_stage('test.export', 20)
+        observe_stage('test.export', 40)
+
+        self.assertEqual(get_stage_histograms()['test.export']['mean_ms'], 30)
+        text = render_prometheus()
+        self.assertIn('focalai_stage_duration_ms_bucket{stage="test.export",le="25"} 1', text)
+        self.assertIn('focalai_stage_duration_ms_count{stage="test.export"} 2', text)
+
+
+class MetricsEndpointTests(SimpleTestCase):
+
+    def test_responses_carry_a_server_timing_header(self):
+        response = self.client.get('/api/test/')
+        self.assertIn('total;dur=', response['Server-Timing'])
+
+    @override_settings(METRICS_TOKEN='')
+    def test_metrics_are_disabled_without_a_token(self):
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+        self.assertEqual(self.client.get('/api/metrics/prometheus/').status_code, 403)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_require_the_token(self):
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 401)
+        self.assertEqual(self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+
+        response = self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('stage_latency', response.json())
+
+        response = self.client.get('/api/metrics/prometheus/', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# TYPE focalai_stage_duration_ms histogram', response.content.decode())
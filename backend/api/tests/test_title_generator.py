@@ -0,0 +1,73 @@
+from unittest import mock
+from django.test import SimpleTestCase, override_settings
+from ..services.title_generator import TitleBatcher, generate_local_title, generate_titles
+from .helpers import use_fake_provider
+
+
+class LocalTitleTests(SimpleTestCase):
+
+    def test_strips_request_phrasing(self):
+        self.assertEqual(
+            generate_local_title('i want to build social media for cancer patient'),
+            ('Cancer Patient Social Media', True)
+        )
+        self.assertEqual(
+            generate_local_title('create a mobile app for hospital patient monitoring'),
+            ('Hospital Patient Monitoring App', True)
+        )
+
+    def test_bare_product_word_is_not_confident(self):
+        self.assertEqual(generate_local_title('platform'), ('Platform', False))
+        self.assertEqual(generate_local_title(''), ('Untitled Idea', False))
+
+    def test_titles_are_short(self):
+        title, _ = generate_local_title(
+            'Please create an app that helps freelancers track invoices, expenses and taxes so they can file on time'
+        )
+        self.assertLessEqual(len(title), 40)
+        self.assertLessEqual(len(title.split()), 6)
+
+
+@override_settings(LLM_CACHE_ENABLED=False, TITLE_BATCH_SIZE=2)
+class LLMTitleFallbackTests(SimpleTestCase):
+
+    def test_confident_titles_never_reach_the_llm(self):
+        with mock.patch('api.services.title_generator._request_llm_titles') as request_titles:
+            titles = generate_titles(['i want to build social media for cancer patient', 'platform'], use_llm=False)
+            self.assertEqual(titles, [('Cancer Patient Social Media', 'local'), ('Platform', 'local')])
+
+            generate_titles(['i want to build social media for cancer patient', 'create a mobile app for hospital patient monitoring'], use_llm=True)
+        request_titles.assert_not_called()
+
+    def test_unsure_titles_are_requested_in_batches(self):
+        descriptions = ['platform', 'i want to build social media for cancer patient', 'tool', 'app']
+        with mock.patch('api.services.title_generator._request_llm_titles', side_effect=lambda batch: [f'Title {text}' for text in batch]) as request_titles:
+            titles = generate_titles(descriptions, use_llm=True)
+
+        self.assertEqual(titles, [
+            ('Title platform', 'llm'), ('Cancer Patient Social Media', 'local'), ('Title tool', 'llm'), ('Title app', 'llm')
+        ])
+        self.assertEqual([call.args[0] for call in request_titles.call_args_list], [['platform', 'tool'], ['app']])
+
+    def test_llm_failure_keeps_the_local_title(self):
+        with mock.patch('api.services.title_generator._request_llm_titles', side_effect=ValueError('bad JSON')):
+            self.assertEqual(generate_titles(['platform', 'tool'], use_llm=True), [('Platform', 'local'), ('Tool', 'local')])
+
+    def test_fake_provider_titles_parse(self):
+        use_fake_provider(self)
+        titles = generate_titles(['platform', 'tool'], use_llm=True)
+        self.assertEqual([source for _, source in titles], ['llm', 'llm'])
+        self.assertTrue(all(len(title) <= 40 for title, _ in titles))
+
+
+@override_settings(LLM_CACHE_ENABLED=False)
+class TitleBatcherTests(SimpleTestCase):
+
+    def test_requests_within_the_window_share_one_llm_call(self):
+        with mock.patch('api.services.title_generator._request_llm_titles', side_effect=lambda batch: [text.title() for text in batch]) as request_titles:
+            batcher = TitleBatcher(max_batch=10, window_seconds=0.1)
+            futures = [batcher.submit(text) for text in ('platform', 'tool', 'app')]
+            titles = [future.result(timeout=2) for future in futures]
+
+        self.assertEqual(titles, ['Platform', 'Tool', 'App'])
+        request_titles.assert_called_once_with(['platform', 'tool', 'app'])
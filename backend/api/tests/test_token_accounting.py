@@ -0,0 +1,65 @@
+from django.test import SimpleTestCase, override_settings
+from ..services.llm_providers import FakeLLMMessage
+from ..services.rate_limiter import estimate_tokens
+from ..services.token_accounting import fit_to_budget, record_llm_usage, token_ledger
+from .helpers import ScriptedLLM, ScriptedMultiAgentSystem
+
+
+class FitToBudgetTests(SimpleTestCase):
+
+    def test_text_within_budget_is_unchanged(self):
+        self.assertEqual(fit_to_budget('A budgeting app.  For students.', 100), 'A budgeting app.  For students.')
+        self.assertEqual(fit_to_budget('Anything at all.', 0), 'Anything at all.')
+
+    def test_long_text_keeps_its_opening_and_conclusion(self):
+        sentences = [f'Sentence number {index} adds detail.' for index in range(200)]
+        fitted = fit_to_budget(' '.join(sentences), 100)
+
+        self.assertTrue(fitted.startswith('Sentence number 0 adds detail.'))
+        self.assertTrue(fitted.endswith('Sentence number 199 adds detail.'))
+        self.assertIn(' [...] ', fitted)
+        self.assertLessEqual(estimate_tokens(fitted), 105)
+
+    def test_single_oversized_sentence_is_cut(self):
+        fitted = fit_to_budget('word ' * 1000, 10)
+        self.assertEqual(len(fitted), 40 + len(' [...]'))
+
+
+class TokenLedgerTests(SimpleTestCase):
+
+    def test_usage_is_broken_down_by_stage(self):
+        with token_ledger() as ledger:
+            record_llm_usage('agent.engineer', 'x' * 400, FakeLLMMessage('y' * 80))
+            record_llm_usage('agent.engineer', 'x' * 40, FakeLLMMessage('y' * 8))
+            response = FakeLLMMessage('ignored')
+            response.usage_metadata = {'input_tokens': 7, 'output_tokens': 3}
+            record_llm_usage('aggregation', 'x' * 400, response)
+
+        usage = ledger.to_dict()
+        self.assertEqual(usage['stages']['agent.engineer'], {'input_tokens': 110, 'output_tokens': 22, 'calls': 2})
+        self.assertEqual(usage['stages']['aggregation'], {'input_tokens': 7, 'output_tokens': 3, 'calls': 1})
+        self.assertEqual((usage['input_tokens'], usage['output_tokens'], usage['calls']), (117, 25, 3))
+
+    def test_calls_outside_a_ledger_are_still_counted(self):
+        self.assertEqual(record_llm_usage('title', 'x' * 40, 'y' * 20), (10, 5))
+
+
+@override_settings(DEBATE_DEFAULT_ROUNDS=1, REFINE_DEADLINE_SECONDS=0, AGGREGATION_MODE='single')
+class RefinementTokenUsageTests(SimpleTestCase):
+
+    def test_refinement_reports_every_call(self):
+        result = ScriptedMultiAgentSystem(ScriptedLLM()).refine_requirements('A budgeting app for students')
+        self.assertEqual(result['token_usage']['calls'], 6)
+        self.assertGreater(result['token_usage']['input_tokens'], result['token_usage']['output_tokens'])
+
+    @override_settings(PROMPT_BUDGET_IDEA_TOKENS=50)
+    def test_oversized_idea_is_shortened_in_agent_prompts(self):
+        llm = ScriptedLLM()
+        idea = 'A budgeting app for students. ' + 'It has many more details. ' * 200 + 'It launches in May.'
+        ScriptedMultiAgentSystem(llm).refine_requirements(idea)
+
+        prompt = llm.prompts('Engineer')[0]
+        self.assertIn('Product Idea: A budgeting app for students.', prompt)
+        self.assertIn(' [...] ', prompt)
+        self.assertIn('It launches in May.', prompt)
+        self.assertLess(len(prompt), len(idea))
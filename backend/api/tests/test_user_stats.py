@@ -0,0 +1,51 @@
+from django.test import SimpleTestCase
+from ..services.user_stats import RECENT_IDEAS_KEPT, build_stats_document, fallback_ai_insight, stats_update, summarize_stats
+
+
+class StatsUpdateTests(SimpleTestCase):
+
+    def test_update_counts_ideas_per_domain_and_keeps_recent_descriptions(self):
+        update = stats_update([
+            {'domain': 'Healthcare', 'description': 'Remote patient monitoring'},
+            {'domain': 'Healthcare', 'description': 'Nurse scheduling'},
+            {'domain': 'Education', 'description': 'Exam practice'}
+        ])
+
+        self.assertEqual(update['$inc'], {'total_ideas': 3, 'domains.Healthcare': 2, 'domains.Education': 1})
+        self.assertEqual(update['$push']['recent_ideas'], {
+            '$each': ['Remote patient monitoring', 'Nurse scheduling', 'Exam practice'],
+            '$slice': -RECENT_IDEAS_KEPT
+        })
+
+    def test_recount_classifies_ideas_saved_without_a_domain(self):
+        ideas = [{'description': f'Idea {index}', 'domain': 'Education'} for index in range(6)]
+        ideas.append({'description': 'remote patient monitoring for hospitals'})
+
+        stats = build_stats_document(ideas)
+        self.assertEqual(stats['total_ideas'], 7)
+        self.assertEqual(stats['domains'], {'Education': 6, 'Healthcare': 1})
+        self.assertEqual(stats['recent_ideas'][-1], 'remote patient monitoring for hospitals')
+        self.assertEqual(len(stats['recent_ideas']), RECENT_IDEAS_KEPT)
+        self.assertTrue(stats['complete'])
+
+
+class SummarizeStatsTests(SimpleTestCase):
+
+    def test_dashboard_counters(self):
+        summary = summarize_stats({'total_ideas': 4, 'domains': {'Education': 1, 'Healthcare': 3}})
+        self.assertEqual(summary, {
+            'total_ideas': 4,
+            'most_common_domain': 'Healthcare',
+            'average_complexity': 'Intermediate',
+            'growth_trend': 'Active Developer'
+        })
+
+    def test_empty_stats(self):
+        summary = summarize_stats({})
+        self.assertEqual((summary['most_common_domain'], summary['growth_trend']), ('General', 'Getting Started'))
+
+    def test_fallback_insight_names_the_main_domain(self):
+        insight = fallback_ai_insight({'total_ideas': 2, 'domains': {'Healthcare': 2}})
+        self.assertTrue(insight['fallback'])
+        self.assertIn('2 ideas', insight['ai_insight'])
+        self.assertIn('healthcare', insight['ai_insight'])
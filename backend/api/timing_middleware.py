@@ -0,0 +1,22 @@
+from .services.timing import end_request_timing, start_request_timing
+
+
+class ServerTimingMiddleware:
+    """
+    Collect per-stage timing spans for each request and report them in a Server-Timing header.
+    Streaming responses only carry the stages finished before the body starts.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timing, token = start_request_timing()
+        request.timing = timing
+        try:
+            response = self.get_response(request)
+        finally:
+            end_request_timing(token)
+
+        response['Server-Timing'] = timing.server_timing_header()
+        return response
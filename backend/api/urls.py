@@ -9,11 +9,19 @@ urlpatterns = [
     
     # Main functionality
     path('refine/', views.refine_requirements, name='refine_requirements'),
+    path('refine/stream/', views.refine_requirements_stream, name='refine_requirements_stream'),
+    path('refine/batch/', views.refine_requirements_batch, name='refine_requirements_batch'),
+    path('refine/jobs/', views.submit_refinement_job, name='submit_refinement_job'),
+    path('refine/jobs/<str:job_id>/', views.get_refinement_job, name='get_refinement_job'),
     path('history/', views.get_history, name='get_history'),
     path('user-history/', views.get_user_history, name='get_user_history'),
     path('generate-title/', views.generate_title, name='generate_title'),
     path('user-insights/', views.get_user_insights, name='get_user_insights'),
-    path('idea/<int:idea_id>/', views.get_idea_details, name='get_idea_details'),
+    path('idea/<str:idea_id>/', views.get_idea_details, name='get_idea_details'),
+    path('idea/<str:idea_id>/feedback/', views.refine_with_feedback, name='refine_with_feedback'),
+    path('metrics/', views.get_metrics, name='get_metrics'),
+    path('metrics/prometheus/', views.get_metrics_prometheus, name='get_metrics_prometheus'),
+    path('circuit-breaker/', views.get_circuit_breaker_state, name='get_circuit_breaker_state'),
     
     # User Management URLs (now require authentication)
     path('users/profile/', user_views.get_user_profile, name='get_user_profile'),
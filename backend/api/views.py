@@ -1,15 +1,105 @@
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.utils import timezone
+from django.conf import settings
 import json
-from .services.multi_agent import MultiAgentSystem
-from .services.mongodb_service import MongoDBService
-from .auth_middleware import require_auth, get_user_from_request
+import math
+from .services.multi_agent import get_multi_agent_system
+from .services.job_queue import JOB_QUEUED, JOB_SUCCEEDED, ensure_job_reaper, get_job_queue, wait_for_job
+from .services.llm_clients import get_client_stats, get_llm_circuit_breaker
+from .services.circuit_breaker import get_circuit_breaker_states
+from .services.rate_limiter import get_rate_limit_stats, record_event
+from .services.mongodb_service import MongoDBService, get_mongo_pool_stats
+from .services.llm_cache import get_llm_cache
+from .services.idea_similarity import find_batch_duplicates
+from .services.deadlines import get_latency_stats
+from .services.insight_refresher import INSIGHT_FRESH, insight_freshness, schedule_insight_refresh
+from .services.user_stats import fallback_ai_insight, summarize_stats, welcome_insight
+from .services.title_generator import MAX_TITLES_PER_REQUEST, generate_titles
+from .services.timing import (
+    activate_request_timing,
+    end_request_timing,
+    get_stage_histograms,
+    render_prometheus,
+    span
+)
+from .services.refinement import (
+    FEEDBACK_CREDIT_COST,
+    REFINEMENT_CREDIT_COST,
+    reuse_batch_result,
+    reuse_prior_refinement,
+    run_feedback_refinement,
+    run_refinement,
+    run_refinement_batch,
+    save_refinement_result
+)
+from .auth_middleware import require_auth, require_metrics_token, get_user_from_request
 from .user_views import get_user_profile, deduct_credits, get_user_transactions
 
 
+def _parse_rounds(data):
+    """Read the optional per-request number of debate rounds, raising ValueError when invalid"""
+    rounds = data.get('rounds')
+    if rounds is None:
+        return None
+    rounds = int(rounds)
+    if rounds < 1:
+        raise ValueError('rounds must be a positive integer')
+    return rounds
+
+
+def _llm_unavailable_response():
+    """503 response while the LLM circuit breaker is open, or None when calls are being let through"""
+    breaker = get_llm_circuit_breaker()
+    if breaker is None or not breaker.is_open():
+        return None
+    
+    retry_after = breaker.retry_after()
+    response = JsonResponse({
+        'success': False,
+        'error': 'The AI service is temporarily unavailable. Please try again shortly.',
+        'retry_after': round(retry_after, 1)
+    }, status=503)
+    response['Retry-After'] = str(math.ceil(retry_after))
+    return response
+
+
+def _sse_event(event, data):
+    """Format a Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class _StreamingBody:
+    """
+    Streaming response body that runs on_close() once when Django closes the response. Unlike a
+    generator's finally block, this also runs when the client went away before the body was ever
+    iterated, so charged credits are always settled.
+    """
+    
+    def __init__(self, iterable, on_close):
+        self._iterator = iter(iterable)
+        self._on_close = on_close
+        self._closed = False
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self):
+        return next(self._iterator)
+    
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            if hasattr(self._iterator, 'close'):
+                self._iterator.close()
+        finally:
+            self._on_close()
+
+
 @csrf_exempt
 @require_http_methods(["GET"])
 def test_connection(request):
@@ -50,6 +140,14 @@ def refine_requirements(request):
                 'error': 'Idea text is required'
             }, status=400)
         
+        try:
+            rounds = _parse_rounds(data)
+        except (TypeError, ValueError):
+            return JsonResponse({
+                'success': False,
+                'error': 'rounds must be a positive integer'
+            }, status=400)
+        
         # Get authenticated user
         user = get_user_from_request(request)
         if not user:
@@ -58,19 +156,36 @@ def refine_requirements(request):
                 'error': 'User authentication required'
             }, status=401)
         
-        # Check if user has sufficient credits
         mongodb_service = MongoDBService()
-        current_credits = mongodb_service.get_user_credits(user['_id'])
         
-        if current_credits < 2:
+        # Return the existing debate for a near-duplicate idea instead of regenerating it
+        if not data.get('force_new', False):
+            reused = reuse_prior_refinement(mongodb_service, user['_id'], idea_text)
+            if reused:
+                reused['user'] = mongodb_service.get_user_by_id(user['_id'])
+                mongodb_service.close()
+                return JsonResponse(reused)
+        
+        # Fail fast, before charging, while the LLM service is known to be down
+        unavailable = _llm_unavailable_response()
+        if unavailable:
+            mongodb_service.close()
+            return unavailable
+        
+        # Check if user has sufficient credits
+        with span('credits.check'):
+            current_credits = mongodb_service.get_user_credits(user['_id'])
+        
+        if current_credits < REFINEMENT_CREDIT_COST:
             mongodb_service.close()
             return JsonResponse({
                 'success': False,
-                'error': f'Insufficient credits. Required: 2, Available: {current_credits}'
+                'error': f'Insufficient credits. Required: {REFINEMENT_CREDIT_COST}, Available: {current_credits}'
             }, status=402)
         
         # Deduct credits first
-        success, message = mongodb_service.deduct_credits(user['_id'], 2, 'Requirement generation')
+        with span('credits.deduct'):
+            success, message = mongodb_service.deduct_credits(user['_id'], REFINEMENT_CREDIT_COST, 'Requirement generation')
         if not success:
             mongodb_service.close()
             return JsonResponse({
@@ -78,78 +193,550 @@ def refine_requirements(request):
                 'error': message
             }, status=402)
         
-        # Initialize services
-        agent_system = MultiAgentSystem()
+        # Save the idea, run the debate and persist the results
+        result = run_refinement(mongodb_service, user['_id'], idea_text, rounds=rounds)
         
-        # Save idea to MongoDB with user_id
-        idea_data = {
-            'title': idea_text[:200],  # Truncate if too long
-            'description': idea_text,
-            'user_id': user['_id']
-        }
-        idea_id = mongodb_service.save_idea(idea_data)
+        if result['success']:
+            # Get updated user data
+            updated_user = mongodb_service.get_user_by_id(user['_id'])
+            mongodb_service.close()
+            
+            return JsonResponse({
+                'success': True,
+                'idea_id': result['idea_id'],
+                'refined_requirements': result['refined_requirements'],
+                'structured_requirements': result.get('structured_requirements'),
+                'debate_log': result['debate_log'],
+                'token_usage': result.get('token_usage'),
+                'partial': result.get('partial', False),
+                'missing_agents': result.get('missing_agents', []),
+                'user': updated_user
+            })
+        else:
+            # Refund credits if requirement generation failed
+            mongodb_service.add_credits(user['_id'], REFINEMENT_CREDIT_COST, 'Credit refund - requirement generation failed')
+            mongodb_service.close()
+            
+            return JsonResponse({
+                'success': False,
+                'error': result.get('error', 'Unknown error occurred')
+            }, status=503 if result.get('retry_after') is not None else 500)
+            
+    except json.JSONDecodeError:
+        return JsonResponse({
+            'success': False,
+            'error': 'Invalid JSON data'
+        }, status=400)
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@require_auth
+def refine_with_feedback(request, idea_id):
+    """
+    API endpoint to iterate on an idea's requirements with user feedback. Only the agents the
+    feedback concerns (or the optional 'agents' list of agent keys) are asked again; the result
+    is stored as a new requirements version.
+    """
+    try:
+        data = json.loads(request.body)
+        feedback = data.get('feedback', '').strip()
+        
+        if not feedback:
+            return JsonResponse({
+                'success': False,
+                'error': 'Feedback text is required'
+            }, status=400)
+        
+        agent_keys = data.get('agents')
+        known_agents = get_multi_agent_system().agents
+        if agent_keys is not None and (
+            not isinstance(agent_keys, list) or not agent_keys or any(agent_key not in known_agents for agent_key in agent_keys)
+        ):
+            return JsonResponse({
+                'success': False,
+                'error': f"agents must be a non-empty list of: {', '.join(known_agents)}"
+            }, status=400)
+        
+        # Get authenticated user
+        user = get_user_from_request(request)
+        if not user:
+            return JsonResponse({
+                'success': False,
+                'error': 'User authentication required'
+            }, status=401)
+        
+        mongodb_service = MongoDBService()
+        
+        idea = mongodb_service.get_idea(idea_id)
+        if not idea or idea.get('user_id') != user['_id']:
+            mongodb_service.close()
+            return JsonResponse({
+                'success': False,
+                'error': 'Idea not found'
+            }, status=404)
+        
+        debate_log = mongodb_service.get_debate_log(idea_id)
+        if not debate_log:
+            mongodb_service.close()
+            return JsonResponse({
+                'success': False,
+                'error': 'This idea has no stored debate to refine yet'
+            }, status=409)
+        
+        # Fail fast, before charging, while the LLM service is known to be down
+        unavailable = _llm_unavailable_response()
+        if unavailable:
+            mongodb_service.close()
+            return unavailable
+        
+        # Check if user has sufficient credits
+        with span('credits.check'):
+            current_credits = mongodb_service.get_user_credits(user['_id'])
+        
+        if current_credits < FEEDBACK_CREDIT_COST:
+            mongodb_service.close()
+            return JsonResponse({
+                'success': False,
+                'error': f'Insufficient credits. Required: {FEEDBACK_CREDIT_COST}, Available: {current_credits}'
+            }, status=402)
+        
+        # Deduct credits first
+        with span('credits.deduct'):
+            success, message = mongodb_service.deduct_credits(user['_id'], FEEDBACK_CREDIT_COST, 'Requirement feedback iteration')
+        if not success:
+            mongodb_service.close()
+            return JsonResponse({
+                'success': False,
+                'error': message
+            }, status=402)
         
-        # Run requirement refinement
-        result = agent_system.refine_requirements(idea_text)
+        result = run_feedback_refinement(mongodb_service, user['_id'], idea, debate_log, feedback, agent_keys=agent_keys)
         
         if result['success']:
-            # Save debate log to MongoDB
-            mongodb_service.save_debates(idea_id, result['debate_log'])
+            # Get updated user data
+            updated_user = mongodb_service.get_user_by_id(user['_id'])
+            mongodb_service.close()
             
-            # Parse refined requirements to extract sections
-            refined_text = result['refined_requirements']
+            result['user'] = updated_user
+            return JsonResponse(result)
+        else:
+            # Refund credits if the iteration failed
+            mongodb_service.add_credits(user['_id'], FEEDBACK_CREDIT_COST, 'Credit refund - feedback iteration failed')
+            mongodb_service.close()
             
-            # Simple parsing - look for section headers
-            sections = {
-                'refined_requirements': '',
-                'trade_offs': '',
-                'next_steps': ''
-            }
+            return JsonResponse({
+                'success': False,
+                'error': result.get('error', 'Unknown error occurred')
+            }, status=503 if result.get('retry_after') is not None else 500)
             
-            # Try to parse the sections
-            lines = refined_text.split('\n')
-            current_section = None
+    except json.JSONDecodeError:
+        return JsonResponse({
+            'success': False,
+            'error': 'Invalid JSON data'
+        }, status=400)
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@require_auth
+def refine_requirements_stream(request):
+    """Streaming variant of refine_requirements that emits Server-Sent Events as agents respond"""
+    try:
+        data = json.loads(request.body)
+        idea_text = data.get('idea', '').strip()
+        
+        if not idea_text:
+            return JsonResponse({
+                'success': False,
+                'error': 'Idea text is required'
+            }, status=400)
+        
+        try:
+            rounds = _parse_rounds(data)
+        except (TypeError, ValueError):
+            return JsonResponse({
+                'success': False,
+                'error': 'rounds must be a positive integer'
+            }, status=400)
+        
+        # Get authenticated user
+        user = get_user_from_request(request)
+        if not user:
+            return JsonResponse({
+                'success': False,
+                'error': 'User authentication required'
+            }, status=401)
+        
+        mongodb_service = MongoDBService()
+        
+        # Return the existing debate for a near-duplicate idea instead of regenerating it
+        if not data.get('force_new', False):
+            reused = reuse_prior_refinement(mongodb_service, user['_id'], idea_text)
+            if reused:
+                reused['user'] = mongodb_service.get_user_by_id(user['_id'])
+                mongodb_service.close()
+                response = StreamingHttpResponse(iter([_sse_event('done', reused)]), content_type='text/event-stream')
+                response['Cache-Control'] = 'no-cache'
+                return response
+        
+        # Fail fast, before charging, while the LLM service is known to be down
+        unavailable = _llm_unavailable_response()
+        if unavailable:
+            mongodb_service.close()
+            return unavailable
+        
+        # Check if user has sufficient credits
+        with span('credits.check'):
+            current_credits = mongodb_service.get_user_credits(user['_id'])
+        
+        if current_credits < REFINEMENT_CREDIT_COST:
+            mongodb_service.close()
+            return JsonResponse({
+                'success': False,
+                'error': f'Insufficient credits. Required: {REFINEMENT_CREDIT_COST}, Available: {current_credits}'
+            }, status=402)
+        
+        # Deduct credits first
+        with span('credits.deduct'):
+            success, message = mongodb_service.deduct_credits(user['_id'], REFINEMENT_CREDIT_COST, 'Requirement generation')
+        if not success:
+            mongodb_service.close()
+            return JsonResponse({
+                'success': False,
+                'error': message
+            }, status=402)
+        
+    except json.JSONDecodeError:
+        return JsonResponse({
+            'success': False,
+            'error': 'Invalid JSON data'
+        }, status=400)
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+    
+    completed = False
+    
+    def event_stream():
+        nonlocal completed
+        # The body runs after the middleware returned; keep recording into this request's timing
+        timing_token = activate_request_timing(getattr(request, 'timing', None))
+        try:
+            agent_system = get_multi_agent_system()
+            
+            # Save idea to MongoDB with user_id
+            with span('idea.insert'):
+                idea_id = mongodb_service.save_idea({
+                    'title': idea_text[:200],  # Truncate if too long
+                    'description': idea_text,
+                    'user_id': user['_id']
+                })
+            yield _sse_event('idea', {'idea_id': idea_id})
             
-            for line in lines:
-                line = line.strip()
-                if 'REFINED REQUIREMENTS' in line.upper():
-                    current_section = 'refined_requirements'
-                elif 'TRADE-OFFS' in line.upper() or 'TRADE OFFS' in line.upper():
-                    current_section = 'trade_offs'
-                elif 'NEXT STEPS' in line.upper():
-                    current_section = 'next_steps'
-                elif current_section and line:
-                    sections[current_section] += line + '\n'
+            result = None
+            for event, payload in agent_system.stream_refinement(idea_text, rounds=rounds):
+                if event == 'result':
+                    result = payload
+                else:
+                    yield _sse_event(event, payload)
             
-            # Save requirements to MongoDB
-            requirements_data = {
-                'refined_requirements': sections['refined_requirements'].strip(),
-                'trade_offs': sections['trade_offs'].strip(),
-                'next_steps': sections['next_steps'].strip()
-            }
-            mongodb_service.save_requirements(idea_id, requirements_data)
+            # Save debate log and parsed requirements to MongoDB
+            yield _sse_event('stage', {'stage': 'saving', 'status': 'started'})
+            save_refinement_result(
+                mongodb_service, idea_id, result['debate_log'], result['refined_requirements'],
+                user_id=user['_id'], token_usage=result.get('token_usage'),
+                missing_agents=result.get('missing_agents'),
+                structured=result.get('structured_requirements')
+            )
+            completed = True
             
             # Get updated user data
             updated_user = mongodb_service.get_user_by_id(user['_id'])
-            mongodb_service.close()
-            
-            return JsonResponse({
+            yield _sse_event('done', {
                 'success': True,
                 'idea_id': idea_id,
                 'refined_requirements': result['refined_requirements'],
+                'structured_requirements': result.get('structured_requirements'),
                 'debate_log': result['debate_log'],
+                'token_usage': result.get('token_usage'),
+                'partial': result.get('partial', False),
+                'missing_agents': result.get('missing_agents', []),
                 'user': updated_user
             })
-        else:
-            # Refund credits if requirement generation failed
-            mongodb_service.add_credits(user['_id'], 2, 'Credit refund - requirement generation failed')
-            mongodb_service.close()
             
+        except Exception as e:
+            yield _sse_event('error', {'success': False, 'error': str(e)})
+        finally:
+            end_request_timing(timing_token)
+    
+    def settle():
+        # Refund credits if the stream failed or the client went away before completion
+        if not completed:
+            mongodb_service.add_credits(user['_id'], REFINEMENT_CREDIT_COST, 'Credit refund - requirement generation failed')
+        mongodb_service.close()
+    
+    response = StreamingHttpResponse(_StreamingBody(event_stream(), settle), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Disable proxy buffering (nginx)
+    return response
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@require_auth
+def submit_refinement_job(request):
+    """API endpoint to queue a requirement refinement and return its job id immediately"""
+    try:
+        data = json.loads(request.body)
+        idea_text = data.get('idea', '').strip()
+        
+        if not idea_text:
             return JsonResponse({
                 'success': False,
-                'error': result.get('error', 'Unknown error occurred')
-            }, status=500)
+                'error': 'Idea text is required'
+            }, status=400)
+        
+        try:
+            rounds = _parse_rounds(data)
+        except (TypeError, ValueError):
+            return JsonResponse({
+                'success': False,
+                'error': 'rounds must be a positive integer'
+            }, status=400)
+        
+        # Get authenticated user
+        user = get_user_from_request(request)
+        if not user:
+            return JsonResponse({
+                'success': False,
+                'error': 'User authentication required'
+            }, status=401)
+        
+        mongodb_service = MongoDBService()
+        job_data = {
+            'user_id': user['_id'],
+            'idea': idea_text,
+            'rounds': rounds
+        }
+        
+        # A near-duplicate idea is answered from its stored debate; record it as an already finished job
+        if not data.get('force_new', False):
+            reused = reuse_prior_refinement(mongodb_service, user['_id'], idea_text)
+            if reused:
+                job_data.update({'status': JOB_SUCCEEDED, 'result': reused})
+                job_id = mongodb_service.create_refinement_job(job_data)
+                mongodb_service.close()
+                return JsonResponse({
+                    'success': True,
+                    'job_id': job_id,
+                    'status': JOB_SUCCEEDED
+                }, status=202)
+        
+        # Fail fast, before charging, while the LLM service is known to be down
+        unavailable = _llm_unavailable_response()
+        if unavailable:
+            mongodb_service.close()
+            return unavailable
+        
+        # Check if user has sufficient credits
+        with span('credits.check'):
+            current_credits = mongodb_service.get_user_credits(user['_id'])
+        
+        if current_credits < REFINEMENT_CREDIT_COST:
+            mongodb_service.close()
+            return JsonResponse({
+                'success': False,
+                'error': f'Insufficient credits. Required: {REFINEMENT_CREDIT_COST}, Available: {current_credits}'
+            }, status=402)
+        
+        # Deduct credits up front; the worker refunds them if the job fails
+        success, message = mongodb_service.deduct_credits(user['_id'], REFINEMENT_CREDIT_COST, 'Requirement generation')
+        if not success:
+            mongodb_service.close()
+            return JsonResponse({
+                'success': False,
+                'error': message
+            }, status=402)
+        
+        job_data['status'] = JOB_QUEUED
+        job_id = mongodb_service.create_refinement_job(job_data)
+        mongodb_service.close()
+        
+        get_job_queue().submit(job_id)
+        
+        return JsonResponse({
+            'success': True,
+            'job_id': job_id,
+            'status': JOB_QUEUED
+        }, status=202)
+        
+    except json.JSONDecodeError:
+        return JsonResponse({
+            'success': False,
+            'error': 'Invalid JSON data'
+        }, status=400)
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+
+@require_http_methods(["GET"])
+@require_auth
+def get_refinement_job(request, job_id):
+    """API endpoint to poll a refinement job; ?wait=<seconds> blocks until it finishes or the wait elapses"""
+    try:
+        user = get_user_from_request(request)
+        if not user:
+            return JsonResponse({
+                'success': False,
+                'error': 'User authentication required'
+            }, status=401)
+        
+        try:
+            wait = min(float(request.GET.get('wait', 0)), settings.REFINE_JOB_MAX_WAIT_SECONDS)
+        except ValueError:
+            return JsonResponse({
+                'success': False,
+                'error': 'wait must be a number of seconds'
+            }, status=400)
+        
+        # Jobs of a process that died are recovered even if this process never submitted one
+        ensure_job_reaper()
+        
+        mongodb_service = MongoDBService()
+        job = mongodb_service.get_refinement_job(job_id)
+        if job and job['user_id'] == user['_id'] and wait > 0:
+            job = wait_for_job(mongodb_service, job_id, wait)
+        mongodb_service.close()
+        
+        if not job or job['user_id'] != user['_id']:
+            return JsonResponse({
+                'success': False,
+                'error': 'Job not found'
+            }, status=404)
+        
+        return JsonResponse({
+            'success': True,
+            'job_id': job['_id'],
+            'status': job['status'],
+            'result': job.get('result'),
+            'error': job.get('error'),
+            'created_at': job['created_at'].isoformat(),
+            'finished_at': job['finished_at'].isoformat() if job.get('finished_at') else None
+        })
+        
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@require_auth
+def refine_requirements_batch(request):
+    """
+    API endpoint to refine many ideas in one request. Credits are checked and charged once for the
+    whole batch. With "stream": true, results are sent as NDJSON lines as each idea finishes.
+    """
+    try:
+        data = json.loads(request.body)
+        ideas = data.get('ideas')
+        
+        if not isinstance(ideas, list) or not ideas:
+            return JsonResponse({
+                'success': False,
+                'error': 'ideas must be a non-empty list'
+            }, status=400)
+        
+        if len(ideas) > settings.REFINE_BATCH_MAX_IDEAS:
+            return JsonResponse({
+                'success': False,
+                'error': f'A batch may contain at most {settings.REFINE_BATCH_MAX_IDEAS} ideas'
+            }, status=400)
+        
+        idea_texts = [idea.strip() if isinstance(idea, str) else '' for idea in ideas]
+        if not all(idea_texts):
+            return JsonResponse({
+                'success': False,
+                'error': 'Every idea must be a non-empty string'
+            }, status=400)
+        
+        try:
+            rounds = _parse_rounds(data)
+        except (TypeError, ValueError):
+            return JsonResponse({
+                'success': False,
+                'error': 'rounds must be a positive integer'
+            }, status=400)
+        
+        # Get authenticated user
+        user = get_user_from_request(request)
+        if not user:
+            return JsonResponse({
+                'success': False,
+                'error': 'User authentication required'
+            }, status=401)
+        
+        mongodb_service = MongoDBService()
+        
+        # Near-duplicates of earlier ideas are answered from their stored debates and not charged
+        results = [None] * len(idea_texts)
+        # Ideas repeated within the batch are refined (and charged) once: {index: [indexes of its repeats]}
+        repeats = {}
+        if not data.get('force_new', False):
+            for index, idea_text in enumerate(idea_texts):
+                results[index] = reuse_prior_refinement(mongodb_service, user['_id'], idea_text)
+        new_indexes = [index for index, result in enumerate(results) if result is None]
+        if not data.get('force_new', False):
+            duplicate_of = find_batch_duplicates([idea_texts[index] for index in new_indexes])
+            for index, first in zip(new_indexes, duplicate_of):
+                if first is not None:
+                    repeats.setdefault(new_indexes[first], []).append(index)
+            new_indexes = [index for index, first in zip(new_indexes, duplicate_of) if first is None]
+        
+        # Check and charge credits once for the whole batch
+        total_cost = REFINEMENT_CREDIT_COST * len(new_indexes)
+        if total_cost:
+            unavailable = _llm_unavailable_response()
+            if unavailable:
+                mongodb_service.close()
+                return unavailable
+            
+            current_credits = mongodb_service.get_user_credits(user['_id'])
+            if current_credits < total_cost:
+                mongodb_service.close()
+                return JsonResponse({
+                    'success': False,
+                    'error': f'Insufficient credits. Required: {total_cost}, Available: {current_credits}'
+                }, status=402)
             
+            success, message = mongodb_service.deduct_credits(
+                user['_id'], total_cost, f'Batch requirement generation ({len(new_indexes)} ideas)'
+            )
+            if not success:
+                mongodb_service.close()
+                return JsonResponse({
+                    'success': False,
+                    'error': message
+                }, status=402)
+        
     except json.JSONDecodeError:
         return JsonResponse({
             'success': False,
@@ -160,6 +747,91 @@ def refine_requirements(request):
             'success': False,
             'error': str(e)
         }, status=500)
+    
+    # Charged ideas that have not succeeded (yet); refunded once, however the request ends
+    unsettled = len(new_indexes)
+    
+    def refund_unsettled():
+        nonlocal unsettled
+        # Refund failed (or never finished) ideas with a single credit transaction
+        if unsettled:
+            mongodb_service.add_credits(
+                user['_id'], REFINEMENT_CREDIT_COST * unsettled, 'Credit refund - batch requirement generation failed'
+            )
+            unsettled = 0
+    
+    def batch_results():
+        """Yield (index, result) for every idea: reused ones first, then new ones (and their repeats) as they finish"""
+        nonlocal unsettled
+        batch = None
+        try:
+            for index, result in enumerate(results):
+                if result is not None:
+                    yield index, result
+            
+            batch = run_refinement_batch(
+                mongodb_service, user['_id'], [idea_texts[index] for index in new_indexes], rounds=rounds
+            )
+            for batch_index, result in batch:
+                index = new_indexes[batch_index]
+                if result['success']:
+                    unsettled -= 1
+                yield index, result
+                for repeat_index in repeats.get(index, []):
+                    if result['success']:
+                        yield repeat_index, reuse_batch_result(mongodb_service, user['_id'], idea_texts[repeat_index], result)
+                    else:
+                        yield repeat_index, {'success': False, 'error': result.get('error', 'Unknown error occurred')}
+        finally:
+            # Stop the pipeline right away (cancelling ideas not yet started) if the consumer went away
+            if batch is not None:
+                batch.close()
+            refund_unsettled()
+    
+    if data.get('stream', False):
+        def ndjson_stream():
+            results_iterator = batch_results()
+            try:
+                for index, result in results_iterator:
+                    result['index'] = index
+                    yield json.dumps(result, default=str) + '\n'
+            except Exception as e:
+                yield json.dumps({'success': False, 'error': str(e)}) + '\n'
+            finally:
+                results_iterator.close()
+        
+        def settle():
+            # Also runs when the body was never iterated, so batch_results never started
+            refund_unsettled()
+            mongodb_service.close()
+        
+        response = StreamingHttpResponse(_StreamingBody(ndjson_stream(), settle), content_type='application/x-ndjson')
+        response['X-Accel-Buffering'] = 'no'  # Disable proxy buffering (nginx)
+        return response
+    
+    try:
+        for index, result in batch_results():
+            result['index'] = index
+            results[index] = result
+        
+        # Get updated user data
+        updated_user = mongodb_service.get_user_by_id(user['_id'])
+        mongodb_service.close()
+        
+        return JsonResponse({
+            'success': True,
+            'results': results,
+            'succeeded': sum(1 for result in results if result['success']),
+            'failed': sum(1 for result in results if not result['success']),
+            'user': updated_user
+        })
+        
+    except Exception as e:
+        mongodb_service.close()
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
 
 
 @require_http_methods(["GET"])
@@ -200,13 +872,27 @@ def get_user_history(request):
 @require_http_methods(["POST"])
 @require_auth
 def generate_title(request):
-    """API endpoint to generate clean titles using Gemini"""
+    """
+    API endpoint to generate clean titles. Titles come from the local heuristic; the LLM is only a
+    (cached, batched) fallback. Accepts one 'description' (with optional 'idea_id') or 'items', a
+    list of {'idea_id', 'description'} such as a page of history, answered with one response.
+    """
     try:
         data = json.loads(request.body)
-        description = data.get('description', '').strip()
-        idea_id = data.get('idea_id', '').strip()
+        items = data.get('items')
+        
+        if items is not None:
+            if (not isinstance(items, list) or not items or len(items) > MAX_TITLES_PER_REQUEST
+                    or not all(isinstance(item, dict) for item in items)):
+                return JsonResponse({
+                    'success': False,
+                    'error': f'items must be a list of 1 to {MAX_TITLES_PER_REQUEST} ideas'
+                }, status=400)
+        else:
+            items = [{'idea_id': data.get('idea_id', ''), 'description': data.get('description', '')}]
         
-        if not description:
+        descriptions = [str(item.get('description', '')).strip() for item in items]
+        if not all(descriptions):
             return JsonResponse({
                 'success': False,
                 'error': 'Description is required'
@@ -220,48 +906,17 @@ def generate_title(request):
                 'error': 'User authentication required'
             }, status=401)
         
-        # Use Gemini to generate a clean title
-        from langchain_google_genai import ChatGoogleGenerativeAI
-        from django.conf import settings
-        
-        llm = ChatGoogleGenerativeAI(
-            model="gemini-pro",
-            google_api_key=settings.GOOGLE_API_KEY,
-            temperature=0.3
-        )
-        
-        prompt = f"""
-        Convert this app idea description into a clean, concise title (max 40 characters):
-        
-        Description: "{description}"
-        
-        Rules:
-        1. Remove common prefixes like "i want", "create", "build", "develop", "make"
-        2. Make it concise and professional
-        3. Capitalize properly
-        4. Keep it under 40 characters
-        5. Make it sound like a real app name
-        
-        Examples:
-        - "i want to build social media for cancer patient" → "Cancer Patient Social Media"
-        - "create a mobile app for hospital patient monitoring" → "Hospital Patient Monitor"
-        - "build a fintech payment processing platform" → "FinTech Payment Platform"
+        titles = [
+            {'idea_id': str(item.get('idea_id', '')).strip(), 'title': title, 'source': source}
+            for item, (title, source) in zip(items, generate_titles(descriptions))
+        ]
         
-        Return only the clean title, nothing else.
-        """
-        
-        response = llm.invoke(prompt)
-        clean_title = response.content.strip()
-        
-        # Ensure it's not too long
-        if len(clean_title) > 40:
-            clean_title = clean_title[:37] + '...'
-        
-        return JsonResponse({
-            'success': True,
-            'title': clean_title,
-            'idea_id': idea_id
-        })
+        if 'items' in data:
+            return JsonResponse({
+                'success': True,
+                'titles': titles
+            })
+        return JsonResponse(dict(titles[0], success=True))
         
     except json.JSONDecodeError:
         return JsonResponse({
@@ -278,7 +933,11 @@ def generate_title(request):
 @require_http_methods(["GET"])
 @require_auth
 def get_user_insights(request):
-    """API endpoint to get AI-powered user insights"""
+    """
+    API endpoint to get AI-powered user insights. Counters come from the user's stats document
+    (kept current as ideas are saved). The stored AI narrative is returned immediately and, when
+    stale or missing, regenerated in the background for later views (stale-while-revalidate).
+    """
     try:
         # Get authenticated user
         user = get_user_from_request(request)
@@ -289,122 +948,25 @@ def get_user_insights(request):
             }, status=401)
         
         mongodb_service = MongoDBService()
+        stats = mongodb_service.get_user_stats(user['_id'])
         
-        # Get user's ideas
-        ideas = list(mongodb_service.ideas_collection.find(
-            {'user_id': user['_id']},
-            {'description': 1, 'created_at': 1}
-        ).sort('created_at', -1))
-        
-        if not ideas:
+        if not stats.get('total_ideas'):
             # Return default insights for new users
-            insight = {
-                'total_ideas': 0,
-                'most_common_domain': 'Getting Started',
-                'average_complexity': 'Beginner',
-                'growth_trend': 'Ready to Launch',
-                'recommendations': [
-                    'Start with a simple, focused idea to get familiar with the process',
-                    'Consider problems you face daily as potential product opportunities',
-                    'Use the AI agents to explore different perspectives on your idea',
-                    'Don\'t worry about perfection - iterate and improve over time'
-                ],
-                'ai_insight': f"Welcome to Focal AI, {user.get('name', 'there')}! You're about to embark on an exciting journey of product development. Our AI-powered system will help you transform your ideas into detailed, actionable product requirements. Start with your first idea and watch how our multi-agent system provides comprehensive insights from different stakeholder perspectives."
-            }
+            insight = welcome_insight(user)
         else:
-            # Analyze user's ideas with Gemini
-            from langchain_google_genai import ChatGoogleGenerativeAI
-            from django.conf import settings
-            import re
-            from collections import Counter
-            
-            # Basic analysis
-            total_ideas = len(ideas)
-            
-            # Extract domains from descriptions
-            domains = []
-            for idea in ideas:
-                description = idea.get('description', '').lower()
-                if 'health' in description or 'medical' in description or 'patient' in description:
-                    domains.append('Healthcare')
-                elif 'finance' in description or 'payment' in description or 'banking' in description:
-                    domains.append('FinTech')
-                elif 'education' in description or 'learning' in description or 'school' in description:
-                    domains.append('Education')
-                elif 'social' in description or 'community' in description:
-                    domains.append('Social Media')
-                elif 'e-commerce' in description or 'shopping' in description:
-                    domains.append('E-commerce')
-                else:
-                    domains.append('General')
+            freshness = insight_freshness(stats)
+            if freshness != INSIGHT_FRESH:
+                record_event(f'insight_{freshness}_served')
+                schedule_insight_refresh(user['_id'])
             
-            most_common_domain = Counter(domains).most_common(1)[0][0] if domains else 'General'
-            
-            # Determine growth trend
-            if total_ideas == 1:
-                growth_trend = 'Getting Started'
-            elif total_ideas <= 3:
-                growth_trend = 'Building Momentum'
-            elif total_ideas <= 5:
-                growth_trend = 'Active Developer'
-            else:
-                growth_trend = 'Product Visionary'
-            
-            # Use Gemini for AI insights
-            llm = ChatGoogleGenerativeAI(
-                model="gemini-pro",
-                google_api_key=settings.GOOGLE_API_KEY,
-                temperature=0.7
+            ai_analysis = stats.get('insight') or fallback_ai_insight(stats)
+            insight = dict(
+                summarize_stats(stats),
+                recommendations=ai_analysis['recommendations'],
+                ai_insight=ai_analysis['ai_insight'],
+                insight_status=freshness,
+                insight_generated_at=ai_analysis.get('generated_at')
             )
-            
-            ideas_text = '\n'.join([f"- {idea.get('description', '')}" for idea in ideas[:5]])
-            
-            prompt = f"""
-            Analyze this user's product ideas and provide personalized insights:
-            
-            User's Ideas:
-            {ideas_text}
-            
-            Total Ideas: {total_ideas}
-            Primary Domain: {most_common_domain}
-            Growth Trend: {growth_trend}
-            
-            Provide:
-            1. A personalized AI insight (2-3 sentences) about their product development journey
-            2. 3-4 specific recommendations for improvement or next steps
-            
-            Format as JSON:
-            {{
-                "ai_insight": "personalized insight here",
-                "recommendations": ["rec1", "rec2", "rec3", "rec4"]
-            }}
-            
-            Make it encouraging, specific, and actionable.
-            """
-            
-            try:
-                response = llm.invoke(prompt)
-                ai_analysis = json.loads(response.content.strip())
-                ai_insight = ai_analysis.get('ai_insight', '')
-                recommendations = ai_analysis.get('recommendations', [])
-            except:
-                # Fallback if AI fails
-                ai_insight = f"Based on your {total_ideas} ideas, you're showing great potential in {most_common_domain.lower()} product development. Keep exploring and refining your concepts!"
-                recommendations = [
-                    'Consider exploring adjacent domains to expand your product portfolio',
-                    'Focus on user pain points that your ideas address',
-                    'Use the multi-agent system to get diverse perspectives on each idea',
-                    'Document your learnings from each PRD to improve future ideas'
-                ]
-            
-            insight = {
-                'total_ideas': total_ideas,
-                'most_common_domain': most_common_domain,
-                'average_complexity': 'Intermediate' if total_ideas > 2 else 'Beginner',
-                'growth_trend': growth_trend,
-                'recommendations': recommendations,
-                'ai_insight': ai_insight
-            }
         
         mongodb_service.close()
         
@@ -447,11 +1009,20 @@ def get_history(request):
 
 
 @require_http_methods(["GET"])
+@require_auth
 def get_idea_details(request, idea_id):
-    """API endpoint to get detailed information about a specific idea"""
+    """API endpoint to get detailed information about one of the authenticated user's ideas"""
     try:
+        # Get authenticated user
+        user = get_user_from_request(request)
+        if not user:
+            return JsonResponse({
+                'success': False,
+                'error': 'User authentication required'
+            }, status=401)
+        
         mongodb_service = MongoDBService()
-        details = mongodb_service.get_idea_details(idea_id)
+        details = mongodb_service.get_idea_details(idea_id, user_id=user['_id'])
         mongodb_service.close()
         
         if not details:
@@ -477,3 +1048,38 @@ def get_idea_details(request, idea_id):
             'success': False,
             'error': str(e)
         }, status=500)
+
+
+@require_http_methods(["GET"])
+@require_metrics_token
+def get_metrics(request):
+    """API endpoint exposing in-process performance counters"""
+    cache = get_llm_cache()
+    return JsonResponse({
+        'success': True,
+        'llm_cache': cache.get_stats() if cache else {'enabled': False},
+        'llm_clients': get_client_stats(),
+        'rate_limiter': get_rate_limit_stats(),
+        'stage_latency': get_stage_histograms(),
+        'llm_latency': get_latency_stats(),
+        'circuit_breakers': get_circuit_breaker_states(),
+        'mongo_pool': get_mongo_pool_stats()
+    })
+
+
+@require_http_methods(["GET"])
+@require_metrics_token
+def get_circuit_breaker_state(request):
+    """API endpoint exposing the state of this worker's circuit breakers"""
+    get_llm_circuit_breaker()  # Make sure the LLM breaker exists before the first call
+    return JsonResponse({
+        'success': True,
+        'circuit_breakers': get_circuit_breaker_states()
+    })
+
+
+@require_http_methods(["GET"])
+@require_metrics_token
+def get_metrics_prometheus(request):
+    """Per-stage latency histograms in the Prometheus text format, for scraping"""
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4')
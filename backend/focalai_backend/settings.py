@@ -47,6 +47,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.timing_middleware.ServerTimingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -96,14 +97,158 @@ DATABASES = {
 # MongoDB Configuration
 MONGODB_URI = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/')
 MONGODB_DB_NAME = os.getenv('MONGODB_DB_NAME', 'focalai')
+# One MongoClient per worker process is shared by every request thread; these size its connection pool
+MONGODB_MAX_POOL_SIZE = int(os.getenv('MONGODB_MAX_POOL_SIZE', '50'))
+MONGODB_MIN_POOL_SIZE = int(os.getenv('MONGODB_MIN_POOL_SIZE', '0'))
+MONGODB_MAX_IDLE_TIME_MS = int(os.getenv('MONGODB_MAX_IDLE_TIME_MS', '300000'))
+# How long a request waits for a free pooled connection before failing
+MONGODB_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv('MONGODB_WAIT_QUEUE_TIMEOUT_MS', '10000'))
 
 # Google OAuth Configuration
 GOOGLE_CLIENT_ID = os.getenv('GOOGLE_CLIENT_ID', '')
 GOOGLE_CLIENT_SECRET = os.getenv('GOOGLE_SECRET', '')
 
+# Shared secret for the internal metrics endpoints (sent as "Authorization: Bearer <token>" by
+# dashboards and Prometheus); the endpoints are disabled while it is unset
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
 # Gemini API Configuration
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')
 
+# LLM backend: 'gemini', 'fake' (deterministic offline model for load testing),
+# 'cassette_record' / 'cassette_replay' (record real calls, replay them offline) or a dotted provider class path
+LLM_PROVIDER = os.getenv('LLM_PROVIDER', 'gemini')
+
+# LLM cassettes (JSON Lines of recorded requests, responses and timings)
+LLM_CASSETTE_PATH = os.getenv('LLM_CASSETTE_PATH', str(BASE_DIR / 'llm_cassette.jsonl'))
+LLM_CASSETTE_RECORD_PROVIDER = os.getenv('LLM_CASSETTE_RECORD_PROVIDER', 'gemini')
+# Sleep for the recorded latency on replay (False replays as fast as possible)
+LLM_CASSETTE_KEEP_LATENCY = os.getenv('LLM_CASSETTE_KEEP_LATENCY', 'True') == 'True'
+
+# Fake provider behaviour (only used when LLM_PROVIDER=fake)
+FAKE_LLM_SEED = os.getenv('FAKE_LLM_SEED', 'focalai')
+# fixed | uniform | normal | lognormal
+FAKE_LLM_LATENCY_DISTRIBUTION = os.getenv('FAKE_LLM_LATENCY_DISTRIBUTION', 'lognormal')
+FAKE_LLM_LATENCY_MS_MEAN = float(os.getenv('FAKE_LLM_LATENCY_MS_MEAN', '1500'))
+FAKE_LLM_LATENCY_MS_STDDEV = float(os.getenv('FAKE_LLM_LATENCY_MS_STDDEV', '500'))
+FAKE_LLM_FIRST_TOKEN_FRACTION = float(os.getenv('FAKE_LLM_FIRST_TOKEN_FRACTION', '0.3'))
+FAKE_LLM_OUTPUT_TOKENS = int(os.getenv('FAKE_LLM_OUTPUT_TOKENS', '300'))
+FAKE_LLM_OUTPUT_TOKENS_STDDEV = int(os.getenv('FAKE_LLM_OUTPUT_TOKENS_STDDEV', '60'))
+FAKE_LLM_ERROR_RATE = float(os.getenv('FAKE_LLM_ERROR_RATE', '0'))
+FAKE_LLM_RATE_LIMIT_RATE = float(os.getenv('FAKE_LLM_RATE_LIMIT_RATE', '0'))
+
+# Multi-agent debate configuration
+# Number of agent LLM calls allowed in flight at once (1 runs agents sequentially)
+AGENT_MAX_PARALLELISM = int(os.getenv('AGENT_MAX_PARALLELISM', '5'))
+# Declarative persona / prompt template registry, re-read by running workers when the file changes
+PERSONA_REGISTRY_PATH = os.getenv('PERSONA_REGISTRY_PATH', str(BASE_DIR / 'api' / 'services' / 'personas.yaml'))
+PERSONA_REGISTRY_RELOAD_INTERVAL = float(os.getenv('PERSONA_REGISTRY_RELOAD_INTERVAL', '5'))
+# Rounds run when a request does not specify any, and the most a request may ask for. Each round
+# makes one LLM call per persona (5 with the shipped registry) and aggregation adds one more, so a
+# default refinement costs 6 calls; multi-round debates are opt-in per request ("rounds") because
+# 3 rounds (16 calls) already exceed GEMINI_REQUESTS_PER_MINUTE on the free tier
+DEBATE_DEFAULT_ROUNDS = int(os.getenv('DEBATE_DEFAULT_ROUNDS', '1'))
+DEBATE_MAX_ROUNDS = int(os.getenv('DEBATE_MAX_ROUNDS', '4'))
+# Hard cap on estimated tokens (prompts + responses) spent across all debate rounds
+DEBATE_TOKEN_BUDGET = int(os.getenv('DEBATE_TOKEN_BUDGET', '40000'))
+# Size of the rolling summary passed between rounds
+DEBATE_SUMMARY_MAX_TOKENS = int(os.getenv('DEBATE_SUMMARY_MAX_TOKENS', '600'))
+DEBATE_SUMMARY_CHARS_PER_AGENT = int(os.getenv('DEBATE_SUMMARY_CHARS_PER_AGENT', '400'))
+# 'single' aggregates the full final-round responses in one call; 'map_reduce' condenses each agent's
+# response as soon as it arrives (one extra, parallel call per agent) and aggregates the condensed notes
+AGGREGATION_MODE = os.getenv('AGGREGATION_MODE', 'single')
+# Prompt-size budgets (estimated tokens): an oversized idea is shortened before it is embedded in
+# every agent prompt, and the final-round responses share the aggregation input budget equally
+PROMPT_BUDGET_IDEA_TOKENS = int(os.getenv('PROMPT_BUDGET_IDEA_TOKENS', '1500'))
+PROMPT_BUDGET_AGGREGATION_TOKENS = int(os.getenv('PROMPT_BUDGET_AGGREGATION_TOKENS', '6000'))
+# Deadlines: each LLM request is abandoned after its timeout (time queued for rate limit quota is
+# not counted); once REFINE_DEADLINE_SECONDS have passed
+# the debate stops waiting for agents and aggregation runs on the responses that arrived (marked partial)
+LLM_CALL_TIMEOUT_SECONDS = float(os.getenv('LLM_CALL_TIMEOUT_SECONDS', '60'))
+AGGREGATION_TIMEOUT_SECONDS = float(os.getenv('AGGREGATION_TIMEOUT_SECONDS', '120'))
+REFINE_DEADLINE_SECONDS = float(os.getenv('REFINE_DEADLINE_SECONDS', '90'))
+# Hedged requests: a call still running after its kind's observed p95 latency gets a duplicate, and
+# the first answer wins. Off by default since hedges spend extra quota
+LLM_HEDGE_ENABLED = os.getenv('LLM_HEDGE_ENABLED', 'False') == 'True'
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv('LLM_HEDGE_MIN_SAMPLES', '20'))
+LLM_HEDGE_MIN_DELAY_SECONDS = float(os.getenv('LLM_HEDGE_MIN_DELAY_SECONDS', '1.0'))
+LLM_LATENCY_WINDOW_SIZE = int(os.getenv('LLM_LATENCY_WINDOW_SIZE', '200'))
+# Threads running deadline-bound calls (abandoned calls keep a thread until they return)
+LLM_CALL_MAX_THREADS = int(os.getenv('LLM_CALL_MAX_THREADS', '32'))
+# Circuit breaker around the LLM provider: opens when, over the window, the failure rate or the
+# share of calls slower than LLM_BREAKER_SLOW_CALL_SECONDS reaches its threshold; while open,
+# refinements fail fast with 503 and agents answer from fallbacks, until half-open trials succeed
+LLM_CIRCUIT_BREAKER_ENABLED = os.getenv('LLM_CIRCUIT_BREAKER_ENABLED', 'True') == 'True'
+LLM_BREAKER_WINDOW_SECONDS = float(os.getenv('LLM_BREAKER_WINDOW_SECONDS', '60'))
+LLM_BREAKER_MIN_CALLS = int(os.getenv('LLM_BREAKER_MIN_CALLS', '10'))
+LLM_BREAKER_FAILURE_RATE = float(os.getenv('LLM_BREAKER_FAILURE_RATE', '0.5'))
+LLM_BREAKER_SLOW_CALL_SECONDS = float(os.getenv('LLM_BREAKER_SLOW_CALL_SECONDS', '30'))
+LLM_BREAKER_SLOW_CALL_RATE = float(os.getenv('LLM_BREAKER_SLOW_CALL_RATE', '0.8'))
+LLM_BREAKER_OPEN_SECONDS = float(os.getenv('LLM_BREAKER_OPEN_SECONDS', '30'))
+LLM_BREAKER_HALF_OPEN_CALLS = int(os.getenv('LLM_BREAKER_HALF_OPEN_CALLS', '2'))
+
+# Background refinement jobs (POST /api/refine/jobs/)
+# Backend is a dotted path: api.services.job_queue.InProcessJobQueue or api.services.job_queue.SQLiteJobQueue
+REFINE_JOB_QUEUE_BACKEND = os.getenv('REFINE_JOB_QUEUE_BACKEND', 'api.services.job_queue.InProcessJobQueue')
+REFINE_JOB_WORKERS = int(os.getenv('REFINE_JOB_WORKERS', '2'))
+REFINE_JOB_SQLITE_PATH = os.getenv('REFINE_JOB_SQLITE_PATH', str(BASE_DIR / 'refinement_jobs.sqlite3'))
+REFINE_JOB_POLL_INTERVAL = float(os.getenv('REFINE_JOB_POLL_INTERVAL', '0.5'))
+REFINE_JOB_MAX_WAIT_SECONDS = float(os.getenv('REFINE_JOB_MAX_WAIT_SECONDS', '30'))
+# Recovery of jobs whose worker died: a running job whose lease (well above the longest refinement)
+# expired, or a job still queued after REFINE_JOB_QUEUE_TIMEOUT_SECONDS (e.g. lost with an in-process
+# queue on restart), is failed and its credits refunded by a sweep every REFINE_JOB_REAP_INTERVAL_SECONDS
+REFINE_JOB_LEASE_SECONDS = float(os.getenv('REFINE_JOB_LEASE_SECONDS', '600'))
+REFINE_JOB_QUEUE_TIMEOUT_SECONDS = float(os.getenv('REFINE_JOB_QUEUE_TIMEOUT_SECONDS', '900'))
+REFINE_JOB_REAP_INTERVAL_SECONDS = float(os.getenv('REFINE_JOB_REAP_INTERVAL_SECONDS', '60'))
+
+# Batch refinement (POST /api/refine/batch/)
+REFINE_BATCH_MAX_IDEAS = int(os.getenv('REFINE_BATCH_MAX_IDEAS', '200'))
+# Ideas debated at once; each debate also fans out to AGENT_MAX_PARALLELISM agent calls
+REFINE_BATCH_MAX_CONCURRENCY = int(os.getenv('REFINE_BATCH_MAX_CONCURRENCY', '4'))
+# Finished ideas buffered before debates and requirements are bulk-written
+REFINE_BATCH_WRITE_SIZE = int(os.getenv('REFINE_BATCH_WRITE_SIZE', '10'))
+
+# Gemini quota handling: shared token buckets plus retry with exponential backoff
+GEMINI_REQUESTS_PER_MINUTE = int(os.getenv('GEMINI_REQUESTS_PER_MINUTE', '15'))
+GEMINI_TOKENS_PER_MINUTE = int(os.getenv('GEMINI_TOKENS_PER_MINUTE', '1000000'))
+GEMINI_EXPECTED_OUTPUT_TOKENS = int(os.getenv('GEMINI_EXPECTED_OUTPUT_TOKENS', '800'))
+GEMINI_QUEUE_MAX_WAIT_SECONDS = float(os.getenv('GEMINI_QUEUE_MAX_WAIT_SECONDS', '60'))
+GEMINI_MAX_RETRIES = int(os.getenv('GEMINI_MAX_RETRIES', '4'))
+GEMINI_RETRY_BASE_DELAY = float(os.getenv('GEMINI_RETRY_BASE_DELAY', '1.0'))
+GEMINI_RETRY_MAX_DELAY = float(os.getenv('GEMINI_RETRY_MAX_DELAY', '30'))
+
+# LLM response cache (in-process LRU backed by a MongoDB collection with TTL eviction)
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'True') == 'True'
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '512'))
+LLM_CACHE_TTL_SECONDS = int(os.getenv('LLM_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+LLM_CACHE_USE_MONGO = os.getenv('LLM_CACHE_USE_MONGO', 'True') == 'True'
+
+# Idea titles: generated locally; the LLM (TITLE_LLM_MODEL) is only asked, when TITLE_LLM_FALLBACK is on,
+# for descriptions the heuristic can't shorten. Its calls are cached and micro-batched: single requests
+# arriving within TITLE_BATCH_WINDOW_MS share one call of up to TITLE_BATCH_SIZE titles.
+TITLE_LLM_FALLBACK = os.getenv('TITLE_LLM_FALLBACK', 'False') == 'True'
+TITLE_LLM_MODEL = os.getenv('TITLE_LLM_MODEL', 'gemini-pro')
+TITLE_BATCH_SIZE = int(os.getenv('TITLE_BATCH_SIZE', '20'))
+TITLE_BATCH_WINDOW_MS = int(os.getenv('TITLE_BATCH_WINDOW_MS', '50'))
+
+# AI insight on the dashboard: the stored copy is always served immediately and regenerated in the
+# background once new ideas arrived or it is older than INSIGHT_MAX_AGE_SECONDS. A worker holds a
+# lease of INSIGHT_REFRESH_LEASE_SECONDS while regenerating, so concurrent views trigger one LLM call.
+INSIGHT_MAX_AGE_SECONDS = int(os.getenv('INSIGHT_MAX_AGE_SECONDS', str(24 * 3600)))
+INSIGHT_REFRESH_LEASE_SECONDS = int(os.getenv('INSIGHT_REFRESH_LEASE_SECONDS', '120'))
+INSIGHT_REFRESH_WORKERS = int(os.getenv('INSIGHT_REFRESH_WORKERS', '2'))
+# Bound on the insight LLM call, so a stalled call frees its refresh worker well within the lease
+INSIGHT_LLM_TIMEOUT_SECONDS = float(os.getenv('INSIGHT_LLM_TIMEOUT_SECONDS', '30'))
+
+# Product domain taxonomy (domains and keywords) used to classify ideas when they are saved
+DOMAIN_TAXONOMY_PATH = os.getenv('DOMAIN_TAXONOMY_PATH', str(BASE_DIR / 'api' / 'services' / 'domains.yaml'))
+
+# Near-duplicate idea detection (TF-IDF cosine similarity over a user's previous ideas)
+IDEA_SIMILARITY_THRESHOLD = float(os.getenv('IDEA_SIMILARITY_THRESHOLD', '0.85'))
+IDEA_SIMILARITY_MAX_IDEAS = int(os.getenv('IDEA_SIMILARITY_MAX_IDEAS', '500'))
+IDEA_SIMILARITY_MAX_USERS = int(os.getenv('IDEA_SIMILARITY_MAX_USERS', '1000'))
+IDEA_SIMILARITY_INDEX_TTL_SECONDS = int(os.getenv('IDEA_SIMILARITY_INDEX_TTL_SECONDS', '300'))
+
 # Validate required environment variables
 if not MONGODB_URI:
     raise ValueError("MONGODB_URI environment variable is required")
@@ -155,3 +300,18 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Logging: the api services log through logging.getLogger(__name__) to the console
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {'format': '{asctime} {levelname} {name}: {message}', 'style': '{'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'simple'},
+    },
+    'loggers': {
+        'api': {'handlers': ['console'], 'level': os.getenv('API_LOG_LEVEL', 'INFO')},
+    },
+}